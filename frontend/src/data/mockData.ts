@@ -54,7 +54,11 @@ export const getOrders = async (): Promise<Order[]> => {
 // 6. Notifications (Specific to a user, example user 1)
 export const getNotifications = async (userId: string): Promise<Notification[]> => {
   try {
-    const response = await fetch(`${BASE_URL}/api/notifications/${userId}`);
+    // A user's notifications are only served to them (or staff)
+    const token = localStorage.getItem('token');
+    const response = await fetch(`${BASE_URL}/api/notifications/${userId}`, {
+      headers: token ? { Authorization: `Bearer ${token}` } : {},
+    });
     if (!response.ok) throw new Error("Failed to fetch notifications");
     return await response.json();
   } catch (error) {
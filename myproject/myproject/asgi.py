@@ -13,4 +13,20 @@ from django.core.asgi import get_asgi_application
 
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'myproject.settings')
 
-application = get_asgi_application()
+django_application = get_asgi_application()
+
+from store.catalog import catalog_publisher  # noqa: E402  (needs the app registry)
+from store.events import events_app  # noqa: E402
+
+# Catalog snapshots are served from this process's STATIC_ROOT, so they are
+# republished here when the catalog changes
+catalog_publisher.start()
+
+
+async def application(scope, receive, send):
+    # The SSE stream bypasses Django's middleware so that idle connections
+    # do not each hold a thread; everything else is plain Django.
+    if scope['type'] == 'http' and scope['path'] == '/api/events':
+        await events_app(scope, receive, send)
+    else:
+        await django_application(scope, receive, send)
@@ -59,7 +59,7 @@ CSRF_TRUSTED_ORIGINS = [
 
 MIDDLEWARE = [
     "django.middleware.security.SecurityMiddleware",
-    "whitenoise.middleware.WhiteNoiseMiddleware",
+    "store.catalog.CatalogWhiteNoiseMiddleware",
     'corsheaders.middleware.CorsMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
@@ -143,6 +143,9 @@ USE_TZ = True
 
 STATIC_URL = 'static/'
 
+# Catalog snapshots (store/catalog.py) carry a content hash in their name
+WHITENOISE_IMMUTABLE_FILE_TEST = r'/catalog/[a-z_]+\.[0-9a-f]{12}\.json$'
+
 
 REST_FRAMEWORK = {
     'DEFAULT_RENDERER_CLASSES': (
@@ -154,6 +157,13 @@ REST_FRAMEWORK = {
         'rest_framework.parsers.FormParser',
         'rest_framework.parsers.MultiPartParser',
     ),
+    # Keep 'line1' as 'line1' (the default turns it into 'line_1'). Product
+    # specifications keep their keys as stored, both ways: spec.<key> filters
+    # match them, and ?render=db embeds the JSONB as is (store/jsonsql.py).
+    'JSON_UNDERSCOREIZE': {
+        'no_underscore_before_number': True,
+        'ignore_fields': ('specifications',),
+    },
     'DEFAULT_AUTHENTICATION_CLASSES': (
         'store.authentication.JWTAuthentication', 
     ),
@@ -165,6 +175,9 @@ REST_FRAMEWORK = {
 CORS_ALLOW_ALL_ORIGINS = os.environ.get("CORS_ALLOW_ALL_ORIGINS") == 'True'
 CORS_ALLOW_CREDENTIALS = os.environ.get("CORS_ALLOW_CREDENTIALS") == 'True'
 
+# Keyset-paginated endpoints return their next/prev page URLs in this header
+CORS_EXPOSE_HEADERS = ['Link']
+
 # Allowed origins list
 CORS_ALLOWED_ORIGINS = os.environ.get(
     "CORS_ALLOWED_ORIGINS", ""
@@ -172,6 +185,30 @@ CORS_ALLOWED_ORIGINS = os.environ.get(
 
 APPEND_SLASH = False
 
+# Days a read notification is kept, per type, before `manage.py purge_notifications`
+# deletes (or archives) it. Types not listed are kept forever.
+NOTIFICATION_RETENTION_DAYS = {
+    'promotion': 30,
+    'info': 90,
+    'system': 90,
+    'order': 365,
+}
+
+# Background jobs (store/jobs.py, run by `manage.py run_workers`).
+# A job's default priority comes from its queue; higher runs first.
+JOB_QUEUE_PRIORITIES = {
+    'notifications': 10,
+    'default': 0,
+    'maintenance': -10,
+}
+# A running job refreshes its lock every JOB_HEARTBEAT seconds; one whose
+# lock is older than JOB_LOCK_TIMEOUT has lost its worker and is queued
+# again, or failed if that was its last attempt.
+JOB_HEARTBEAT = 60
+JOB_LOCK_TIMEOUT = 5 * 60
+# Finished jobs are kept this many days for inspection in the admin.
+JOB_KEEP_DONE_DAYS = 7
+
 CSRF_TRUSTED_ORIGINS = os.getenv(
     "CSRF_TRUSTED_ORIGINS", ""
 ).split(",")
@@ -180,3 +217,64 @@ CSRF_COOKIE_SAMESITE = "None"
 CSRF_COOKIE_SECURE = True
 SESSION_COOKIE_SAMESITE = "None"
 SESSION_COOKIE_SECURE = True
+
+# Seconds a superseded catalog snapshot stays on disk after
+# `manage.py publish_catalog` replaces it, for clients mid-download.
+CATALOG_SNAPSHOT_GRACE = 24 * 60 * 60
+# Seconds web processes wait after a catalog change before republishing;
+# review changes wait longer, so a steady trickle of them is one publish
+CATALOG_PUBLISH_DELAY = 10
+CATALOG_REVIEW_PUBLISH_DELAY = 5 * 60
+
+# Product detail response cache (store/productcache.py), per process. An
+# entry is served for PRODUCT_CACHE_FRESH seconds, then for up to
+# PRODUCT_CACHE_STALE more while one request reloads it. Size 0 turns it off.
+PRODUCT_CACHE_FRESH = 30
+PRODUCT_CACHE_STALE = 300
+PRODUCT_CACHE_SIZE = 5000
+
+# Answer product list filters and sorting from in-memory NumPy columns
+# (store/catalogengine.py) instead of SQL. Each process holds its own copy
+# and checks for product changes at most every CATALOG_ENGINE_REFRESH seconds.
+CATALOG_ENGINE = os.environ.get("CATALOG_ENGINE") == 'True'
+CATALOG_ENGINE_REFRESH = 5
+
+# /api/products/facets: price histogram bucket edges (effective price), and
+# how long SQL-computed counts are cached per filter set
+FACET_PRICE_BUCKETS = [500, 1000, 2000, 5000, 10000]
+FACET_CACHE_SECONDS = 60
+
+# /api/products/categories/tree is cached this long; category saves and
+# deletes clear it sooner. Product filters read category paths uncached.
+CATEGORY_TREE_SECONDS = 300
+
+# Product detail views are counted in memory and written every
+# VIEW_FLUSH_SECONDS (store/popularity.py). Their popularity score halves
+# every POPULARITY_HALF_LIFE seconds; /api/products/trending ranks products
+# viewed within TRENDING_WINDOW seconds and is cached TRENDING_CACHE_SECONDS.
+VIEW_FLUSH_SECONDS = 10
+POPULARITY_HALF_LIFE = 24 * 60 * 60
+TRENDING_WINDOW = 7 * 24 * 60 * 60
+TRENDING_CACHE_SECONDS = 60
+
+# Frequently bought together (store/recommendations.py): products kept per
+# product, orders two products need in common to count, and how far before
+# the previous incremental run new orders are looked for.
+RELATED_PRODUCTS_K = 12
+RELATED_MIN_ORDERS = 2
+RELATED_OVERLAP = 10 * 60
+
+# Similar products (store/similarity.py): products kept per product, where
+# the vector index is saved between incremental refreshes, and processes
+# used to build it. Refresh jobs skip workers that cannot read the index, so
+# with several worker hosts point SIMILAR_INDEX_PATH at storage they share.
+SIMILAR_PRODUCTS_K = 12
+SIMILAR_INDEX_PATH = os.environ.get("SIMILAR_INDEX_PATH", os.path.join(BASE_DIR, "var", "similar-products.npz"))
+SIMILAR_WORKERS = os.cpu_count() or 1
+
+# /api/home: trending product cards included (the newest until products have
+# views), hero slides whose images are preloaded, and how long the bundle is
+# cached; hero slide, category and brand saves clear it sooner
+HOME_PRODUCTS = 12
+HOME_PRELOAD_SLIDES = 1
+HOME_CACHE_SECONDS = 60
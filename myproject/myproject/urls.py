@@ -16,25 +16,39 @@ urlpatterns = [
 
     # Categories
     path('api/products/categories', views.CategoryListView.as_view()),
+    path('api/products/categories/tree', views.CategoryTreeView.as_view()),
     path('api/products/categories/<int:id>', views.CategoryDetailView.as_view()),
 
     # Brands
     path('api/products/brands', views.BrandListView.as_view()),
 
+    # Catalog snapshots
+    path('api/catalog', views.CatalogManifestView.as_view()),
+
     # Products
     path('api/products', views.ProductListView.as_view()), # Handles ?skip=0&limit=100
+    path('api/products/changes', views.ProductChangesView.as_view()),
+    path('api/products/facets', views.ProductFacetsView.as_view()),
+    path('api/products/trending', views.ProductTrendingView.as_view()),
+    path('api/products/cache-stats', views.ProductCacheStatsView.as_view()),
     path('api/products/<str:slug>', views.ProductDetailView.as_view()),
+    path('api/products/<str:slug>/related', views.ProductRelatedView.as_view()),
+    path('api/products/<str:slug>/similar', views.ProductSimilarView.as_view()),
 
     # Users
     path('api/users', views.UserListView.as_view()),
+    path('api/users/count', views.UserCountView.as_view()),
     path('api/users/<int:id>', views.UserDetailView.as_view()),
 
     # Orders
     path('api/orders', views.OrderListView.as_view()),
+    path('api/orders/transition', views.OrderTransitionView.as_view()),
     path('api/orders/user/<int:user_id>', views.UserOrderListView.as_view()),
 
     # Notifications
     path('api/notifications/<int:user_id>', views.NotificationListView.as_view()),
+    path('api/notifications/<int:user_id>/unread-count', views.NotificationUnreadCountView.as_view()),
+    path('api/notifications/<int:user_id>/mark-read', views.NotificationMarkReadView.as_view()),
 
     # Addresses
     path('api/addresses', views.AddressListCreateView.as_view()),
@@ -43,6 +57,9 @@ urlpatterns = [
     # Hero Slides
     path('api/hero-slides', views.HeroSlideListView.as_view()),
 
+    # Home page: hero slides, categories, brands and products in one request
+    path('api/home', views.HomeView.as_view()),
+
 ]
 
 # Helper for root
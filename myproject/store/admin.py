@@ -1,9 +1,13 @@
-from django.contrib import admin
+from django.contrib import admin, messages
 from django.contrib.auth.admin import UserAdmin
+from django.utils import timezone
 from .models import (
     User, Address, Category, Brand, Product, 
-    Review, Order, OrderItem, Notification, HeroSlide
+    Review, Order, OrderItem, Notification, HeroSlide, Broadcast, Job
 )
+from rest_framework.exceptions import ValidationError
+from .broadcasts import send_pending_broadcasts
+from .orders import transition_orders
 
 # 1. Custom User Admin
 class CustomUserAdmin(UserAdmin):
@@ -28,7 +32,7 @@ admin.site.register(User, CustomUserAdmin)
 # FIX: Changed 'admin.site.ModelAdmin' to 'admin.ModelAdmin'
 @admin.register(Category)
 class CategoryAdmin(admin.ModelAdmin):
-    list_display = ('id', 'name', 'slug')
+    list_display = ('id', 'name', 'slug', 'parent')
     prepopulated_fields = {'slug': ('name',)} 
 
 @admin.register(Brand)
@@ -64,6 +68,33 @@ class OrderAdmin(admin.ModelAdmin):
     list_filter = ('status', 'payment_status', 'created_at')
     search_fields = ('user__email', 'tracking_number')
     inlines = [OrderItemInline] 
+    list_select_related = ('user',)
+    show_full_result_count = False  # skip the unfiltered COUNT(*) on every page
+    actions = ['mark_processing', 'mark_shipped', 'mark_delivered', 'mark_cancelled']
+
+    def transition(self, request, queryset, status):
+        try:
+            updated = transition_orders(queryset.values_list('id', flat=True), status)
+        except ValidationError as exc:
+            self.message_user(request, f"Nothing changed: {exc.detail}", messages.ERROR)
+        else:
+            self.message_user(request, f"{updated} orders marked {status}; customers notified.")
+
+    @admin.action(description='Mark selected orders processing')
+    def mark_processing(self, request, queryset):
+        self.transition(request, queryset, 'processing')
+
+    @admin.action(description='Mark selected orders shipped')
+    def mark_shipped(self, request, queryset):
+        self.transition(request, queryset, 'shipped')
+
+    @admin.action(description='Mark selected orders delivered')
+    def mark_delivered(self, request, queryset):
+        self.transition(request, queryset, 'delivered')
+
+    @admin.action(description='Mark selected orders cancelled')
+    def mark_cancelled(self, request, queryset):
+        self.transition(request, queryset, 'cancelled')
 
 
 # 5. Other Simple Registrations
@@ -75,6 +106,48 @@ class AddressAdmin(admin.ModelAdmin):
 class NotificationAdmin(admin.ModelAdmin):
     list_display = ('user', 'title', 'type', 'is_read', 'created_at')
 
+@admin.register(Broadcast)
+class BroadcastAdmin(admin.ModelAdmin):
+    # Saving only queues the broadcast; a background job writes the notifications
+    list_display = ('title', 'role', 'segment', 'status', 'progress', 'created_at', 'finished_at')
+    list_filter = ('status', 'segment')
+    fields = ('title', 'message', 'type', 'role', 'segment',
+              'status', 'total', 'sent', 'error', 'started_at', 'finished_at')
+    readonly_fields = ('status', 'total', 'sent', 'error', 'started_at', 'finished_at')
+    actions = ['resume']
+
+    @admin.display(description='Progress')
+    def progress(self, obj):
+        if not obj.total:
+            return f"{obj.sent}"
+        return f"{obj.sent}/{obj.total} ({100 * obj.sent // obj.total}%)"
+
+    def save_model(self, request, obj, form, change):
+        super().save_model(request, obj, form, change)
+        if not change:
+            send_pending_broadcasts.delay()
+
+    @admin.action(description='Queue selected broadcasts again (resumes where they stopped)')
+    def resume(self, request, queryset):
+        queued = queryset.exclude(status='done').update(status='pending')
+        send_pending_broadcasts.delay()
+        self.message_user(request, f"{queued} broadcasts queued.")
+
+
+@admin.register(Job)
+class JobAdmin(admin.ModelAdmin):
+    list_display = ('id', 'name', 'queue', 'priority', 'status', 'attempts', 'run_at', 'finished_at')
+    list_filter = ('status', 'queue')
+    search_fields = ('name',)
+    readonly_fields = ('attempts', 'last_error', 'locked_by', 'locked_at', 'created_at', 'finished_at')
+    show_full_result_count = False
+    actions = ['retry_now']
+
+    @admin.action(description='Run selected jobs again now')
+    def retry_now(self, request, queryset):
+        queued = queryset.exclude(status='running').update(status='queued', run_at=timezone.now(), attempts=0)
+        self.message_user(request, f"{queued} jobs queued.")
+
 @admin.register(HeroSlide)
 class HeroSlideAdmin(admin.ModelAdmin):
     list_display = ('id', 'title', 'subtitle')
@@ -3,3 +3,7 @@ from django.apps import AppConfig
 
 class StoreConfig(AppConfig):
     name = 'store'
+
+    def ready(self):
+        # Connect the signal receivers
+        from . import catalogengine, categories, home, productcache  # noqa: F401
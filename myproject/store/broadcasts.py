@@ -0,0 +1,90 @@
+import json
+
+from django.db import connection, transaction
+from django.utils import timezone
+
+from .events import CHANNEL
+from .jobs import task
+from .models import Broadcast, Notification
+
+CHUNK_SIZE = 50000
+
+
+def claim_broadcast():
+    """Mark the oldest pending broadcast as running and return it, or None.
+
+    SKIP LOCKED lets several senders run side by side without picking the
+    same broadcast.
+    """
+    with transaction.atomic():
+        broadcast = (
+            Broadcast.objects.select_for_update(skip_locked=True)
+            .filter(status='pending').order_by('id').first()
+        )
+        if broadcast is not None:
+            broadcast.status = 'running'
+            broadcast.started_at = broadcast.started_at or timezone.now()
+            broadcast.save(update_fields=['status', 'started_at'])
+        return broadcast
+
+
+def send_broadcast(broadcast, chunk_size=CHUNK_SIZE, progress=None):
+    """Write one notification per recipient with chunked INSERT ... SELECT.
+
+    Recipients are walked in id order. Each chunk is one statement in its own
+    transaction, and the position is saved with it, so an interrupted send
+    resumes where it stopped. The per-row SSE trigger is switched off; each
+    chunk announces itself with a single event naming its range of user ids
+    and the range of notification ids it wrote.
+    """
+    recipients = broadcast.recipients()
+    if broadcast.total is None:
+        broadcast.total = recipients.count()
+        broadcast.save(update_fields=['total'])
+
+    try:
+        while True:
+            batch = recipients.filter(id__gt=broadcast.last_user_id).order_by('id').values('id')[:chunk_size]
+            sql, params = batch.query.sql_with_params()
+            with transaction.atomic(), connection.cursor() as cursor:
+                cursor.execute("SET LOCAL store.suppress_events = 'on'")
+                cursor.execute(f"""
+                    WITH batch AS ({sql}),
+                    written AS (
+                        INSERT INTO {Notification._meta.db_table} (user_id, title, message, type, is_read, created_at)
+                        SELECT id, %s, %s, %s, false, now() FROM batch
+                        RETURNING id
+                    )
+                    SELECT count(*), min(id), max(id), (SELECT min(id) FROM written), (SELECT max(id) FROM written)
+                    FROM batch
+                """, (*params, broadcast.title, broadcast.message, broadcast.type))
+                count, first_id, last_id, first_notification_id, last_notification_id = cursor.fetchone()
+                if not count:
+                    break
+                broadcast.sent += count
+                broadcast.last_user_id = last_id
+                broadcast.save(update_fields=['sent', 'last_user_id'])
+                cursor.execute("SELECT pg_notify(%s, %s)", [CHANNEL, json.dumps({
+                    'type': 'broadcast', 'id': broadcast.id,
+                    'first_user_id': first_id, 'last_user_id': last_id,
+                    'first_id': first_notification_id, 'last_id': last_notification_id,
+                })])
+            if progress is not None:
+                progress(broadcast)
+    except Exception as exc:
+        broadcast.status = 'failed'
+        broadcast.error = str(exc)
+        broadcast.save(update_fields=['status', 'error'])
+        raise
+
+    broadcast.status = 'done'
+    broadcast.error = ''
+    broadcast.finished_at = timezone.now()
+    broadcast.save(update_fields=['status', 'error', 'finished_at'])
+    return broadcast
+
+
+@task(queue='notifications')
+def send_pending_broadcasts():
+    while (broadcast := claim_broadcast()) is not None:
+        send_broadcast(broadcast)
@@ -0,0 +1,209 @@
+import fcntl
+import gzip
+import hashlib
+import json
+import logging
+import math
+import os
+import re
+import select
+import threading
+import time
+
+import brotli
+import psycopg2
+from django.conf import settings
+from django.db import connection, connections
+from django.db.models import Prefetch
+from django.templatetags.static import static
+from django.utils import timezone
+from djangorestframework_camel_case.render import CamelCaseJSONRenderer
+from whitenoise.middleware import WhiteNoiseMiddleware
+
+from .fastserializers import compiled
+from .models import Brand, Category, HeroSlide, Product, Review
+from .serializers import BrandSerializer, CategorySerializer, HeroSlideSerializer, ProductSerializer
+
+logger = logging.getLogger(__name__)
+
+# Snapshots live in STATIC_ROOT/catalog as <name>.<12 hex digits>.json, with
+# .gz and .br next to them, plus manifest.json naming the current set.
+CATALOG_DIR = 'catalog'
+SNAPSHOT_NAME = re.compile(r'[a-z_]+\.[0-9a-f]{12}\.json')
+# Postgres channel the catalog triggers publish on (see migration 0013)
+CHANNEL = 'store_catalog'
+
+# Same bodies as the list endpoints
+SNAPSHOTS = {
+    'products': (ProductSerializer, lambda: Product.objects.prefetch_related(
+        Prefetch('reviews', Review.objects.order_by('id'))).order_by('id')),
+    'categories': (CategorySerializer, lambda: Category.objects.order_by('id')),
+    'brands': (BrandSerializer, lambda: Brand.objects.order_by('id')),
+    'hero_slides': (HeroSlideSerializer, lambda: HeroSlide.objects.order_by('id')),
+}
+
+
+def catalog_root():
+    return os.path.join(settings.STATIC_ROOT, CATALOG_DIR)
+
+
+def write_file(path, content):
+    # Readers never see a half-written file
+    partial = f"{path}.{os.getpid()}.tmp"
+    with open(partial, 'wb') as f:
+        f.write(content)
+    os.replace(partial, path)
+
+
+def render_snapshot(serializer_class, queryset):
+    serializer = compiled(serializer_class)
+    rows = list(serializer.values(queryset))
+    return CamelCaseJSONRenderer().render(serializer.serialize(rows, queryset._prefetch_related_lookups))
+
+
+def publish_catalog():
+    """Write the catalog snapshots and point manifest.json at them; returns the manifest.
+
+    A snapshot whose content has not changed keeps its file name, so CDNs and
+    browsers keep their copy. Superseded files are removed once they are
+    older than CATALOG_SNAPSHOT_GRACE, which gives clients holding the
+    previous manifest time to finish downloading.
+    """
+    root = catalog_root()
+    os.makedirs(root, exist_ok=True)
+    previous = json.loads(read_manifest() or b'{}')
+    files = {}
+    for name, (serializer_class, queryset) in SNAPSHOTS.items():
+        content = render_snapshot(serializer_class, queryset())
+        filename = f"{name}.{hashlib.sha256(content).hexdigest()[:12]}.json"
+        path = os.path.join(root, filename)
+        if not os.path.exists(path):
+            # Compressed variants first: the server looks for them next to the .json
+            write_file(path + '.gz', gzip.compress(content, compresslevel=9, mtime=0))
+            write_file(path + '.br', brotli.compress(content, mode=brotli.MODE_TEXT))
+            write_file(path, content)
+        files[name] = filename
+    manifest = {name: static(f"{CATALOG_DIR}/{filename}") for name, filename in files.items()}
+    manifest['published_at'] = timezone.now().isoformat()
+    write_file(os.path.join(root, 'manifest.json'), CamelCaseJSONRenderer().render(manifest))
+
+    current = set(files.values())
+    superseded = {url.rsplit('/', 1)[-1] for url in previous.values()} - current
+    cutoff = time.time() - settings.CATALOG_SNAPSHOT_GRACE
+    for filename in os.listdir(root):
+        base = filename.removesuffix('.gz').removesuffix('.br')
+        if not SNAPSHOT_NAME.fullmatch(base) or base in current:
+            continue
+        path = os.path.join(root, filename)
+        if base in superseded:
+            os.utime(path)  # the grace period starts now
+        elif os.path.getmtime(path) < cutoff:
+            os.remove(path)
+    return manifest
+
+
+class CatalogPublisher:
+    """Republishes the snapshots in the process that serves them.
+
+    Started by the web server (myproject/asgi.py): every web process has
+    its own STATIC_ROOT, so a publish anywhere else would never be seen.
+    A daemon thread LISTENs for catalog changes and publishes
+    CATALOG_PUBLISH_DELAY seconds after the first one, so a burst of admin
+    edits or a bulk import becomes one publish. Reviews arrive all day and
+    each one would re-render the whole catalog, so they wait up to
+    CATALOG_REVIEW_PUBLISH_DELAY and ride along with whatever comes first.
+    Workers on the same host share the disk; a lock file lets one of them do it.
+    """
+
+    reconnect_delay = 5
+
+    def __init__(self):
+        self.thread = None
+
+    def start(self):
+        if self.thread is None:
+            self.thread = threading.Thread(target=self.run, name='catalog-publisher', daemon=True)
+            self.thread.start()
+
+    def run(self):
+        while True:
+            try:
+                self.listen()
+            except (psycopg2.Error, OSError):
+                logger.exception("Catalog publisher lost its connection; reconnecting")
+                time.sleep(self.reconnect_delay)
+
+    def listen(self):
+        conn = psycopg2.connect(**connections['default'].get_connection_params())
+        try:
+            conn.set_session(autocommit=True)
+            conn.cursor().execute(f'LISTEN {CHANNEL}')
+            due = None
+            while True:
+                timeout = None if due is None else max(due - time.monotonic(), 0)
+                if select.select([conn], [], [], timeout)[0]:
+                    conn.poll()
+                    due = self.next_due(due, [notify.payload for notify in conn.notifies])
+                    conn.notifies.clear()
+                elif due is not None:
+                    due = None
+                    try:
+                        self.publish()
+                    finally:
+                        connection.close()  # this thread's ORM connection, idle until the next change
+        finally:
+            conn.close()
+
+    def next_due(self, due, tables):
+        """When to publish, given the tables changed since `due` was set (None: nothing pending)."""
+        for table in tables:
+            delay = settings.CATALOG_REVIEW_PUBLISH_DELAY if table == 'store_review' else settings.CATALOG_PUBLISH_DELAY
+            due = min(due or math.inf, time.monotonic() + delay)
+        return due
+
+    def publish(self):
+        """Publish unless another process on this host is at it; True if this one did."""
+        root = catalog_root()
+        os.makedirs(root, exist_ok=True)
+        with open(os.path.join(root, '.publish.lock'), 'w') as lock:
+            try:
+                fcntl.flock(lock, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except BlockingIOError:
+                # It heard the same changes and republishes after them too
+                return False
+            try:
+                publish_catalog()
+            except Exception:
+                logger.exception("Catalog publish failed")
+                return False
+        return True
+
+
+catalog_publisher = CatalogPublisher()
+
+
+def read_manifest():
+    """The current manifest as published, or None before the first publish."""
+    try:
+        with open(os.path.join(catalog_root(), 'manifest.json'), 'rb') as f:
+            return f.read()
+    except FileNotFoundError:
+        return None
+
+
+class CatalogWhiteNoiseMiddleware(WhiteNoiseMiddleware):
+    """WhiteNoise, plus catalog snapshots published after the server started.
+
+    WhiteNoise indexes STATIC_ROOT once at startup; snapshot names are
+    content hashes, so they are looked up on disk instead (a few stat()
+    calls, and the CDN absorbs repeat downloads).
+    """
+
+    def __call__(self, request):
+        prefix = f"{self.static_prefix}{CATALOG_DIR}/"
+        name = request.path_info[len(prefix):] if request.path_info.startswith(prefix) else None
+        if name is not None and SNAPSHOT_NAME.fullmatch(name):
+            path = os.path.join(catalog_root(), name)
+            if os.path.exists(path):
+                return self.serve(self.get_static_file(path, request.path_info), request)
+        return super().__call__(request)
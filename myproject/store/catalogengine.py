@@ -0,0 +1,242 @@
+import threading
+import time
+
+import numpy as np
+from django.conf import settings
+from django.db import connection, transaction
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from .categories import subtree_counts
+from .models import Product
+
+COLUMNS_SQL = """
+    SELECT id, category_id, brand_id, coalesce(sale_price, price), rating_average, in_stock,
+           (extract(epoch FROM created_at) * 1000000)::bigint, tags
+    FROM store_product
+"""
+CATEGORIES_SQL = "SELECT id, path FROM store_category"
+
+
+class Columns:
+    """One generation of the catalog as NumPy arrays, one row per product version.
+
+    The arrays are never changed in place: a delta builds a new generation
+    in which the old rows of changed and deleted products are dead and the
+    new versions are appended.
+    """
+
+    def __init__(self, rows, floor, category_paths, previous=None, dropped=()):
+        ids, categories, brands, prices, ratings, in_stock, created, tags = zip(*rows) if rows else ([],) * 8
+        tag_codes = previous.tag_codes.copy() if previous is not None else {}
+        tag_rows, tag_values = [], []
+        for row, row_tags in enumerate(tags):
+            for tag in row_tags:
+                tag_rows.append(row)
+                tag_values.append(tag_codes.setdefault(tag, len(tag_codes)))
+        new = {
+            'ids': np.array(ids, dtype=np.int64),
+            'categories': np.array(categories, dtype=np.int64),
+            'brands': np.array(brands, dtype=np.int64),
+            'prices': np.array(prices, dtype=np.float64),
+            'ratings': np.array(ratings, dtype=np.float64),
+            'in_stock': np.array(in_stock, dtype=bool),
+            'created': np.array(created, dtype=np.int64),
+            'tag_rows': np.array(tag_rows, dtype=np.int64),
+            'tag_values': np.array(tag_values, dtype=np.int64),
+        }
+        if previous is None:
+            for name, values in new.items():
+                setattr(self, name, values)
+            self.alive = np.ones(len(self.ids), dtype=bool)
+        else:
+            offset = len(previous.ids)
+            new['tag_rows'] += offset
+            for name, values in new.items():
+                setattr(self, name, np.concatenate([getattr(previous, name), values]))
+            self.alive = np.concatenate([
+                previous.alive & ~np.isin(previous.ids, np.array(list(dropped), dtype=np.int64)),
+                np.ones(len(rows), dtype=bool),
+            ])
+        self.tag_codes = tag_codes
+        self.category_paths = category_paths  # category id -> Category.path
+        self.floor = floor
+        self.loaded_at = time.monotonic()
+        self.orders = {}
+
+    @property
+    def dead(self):
+        return len(self.alive) - int(self.alive.sum())
+
+    def order(self, sort):
+        # Row positions in the order of ?sort=, dead rows included; built
+        # once per generation, so a query only has to mask it
+        if sort not in self.orders:
+            keys = {
+                'id': (self.ids,),
+                'price': (self.ids, self.prices),
+                '-price': (-self.ids, -self.prices),
+                'rating': (self.ids, self.ratings),
+                '-rating': (-self.ids, -self.ratings),
+                'newest': (-self.ids, -self.created),
+            }[sort]
+            self.orders[sort] = np.lexsort(keys)
+        return self.orders[sort]
+
+    def masks(self, filters):
+        # One boolean mask per active filter, keyed like productfilters.FACETS
+        masks = {}
+        if filters.categories is not None:
+            # A category matches its whole subtree, as in SQL
+            roots = tuple(self.category_paths[id] for id in filters.categories if id in self.category_paths)
+            subtree = [id for id, path in self.category_paths.items() if roots and path.startswith(roots)]
+            masks['category'] = np.isin(self.categories, subtree)
+        if filters.brands is not None:
+            masks['brand'] = np.isin(self.brands, filters.brands)
+        if filters.in_stock is not None:
+            masks['in_stock'] = self.in_stock == filters.in_stock
+        if filters.min_rating is not None:
+            masks['rating'] = self.ratings >= filters.min_rating
+        if filters.min_price is not None or filters.max_price is not None:
+            price = np.ones(len(self.ids), dtype=bool)
+            if filters.min_price is not None:
+                price &= self.prices >= filters.min_price
+            if filters.max_price is not None:
+                price &= self.prices <= filters.max_price
+            masks['price'] = price
+        if filters.tags is not None:
+            codes = [self.tag_codes[tag] for tag in filters.tags if tag in self.tag_codes]
+            tagged = np.zeros(len(self.ids), dtype=bool)
+            tagged[self.tag_rows[np.isin(self.tag_values, codes)]] = True
+            masks['tags'] = tagged
+        return masks
+
+    def mask(self, filters, masks=None, exclude=None):
+        mask = self.alive.copy()
+        for name, other in (self.masks(filters) if masks is None else masks).items():
+            if name != exclude:
+                mask &= other
+        return mask
+
+    def facets(self, filters, price_buckets):
+        """Counts per facet value, each facet ignoring its own filter (see store/facets.py)."""
+        masks = self.masks(filters)
+
+        def counts(values, exclude):
+            found, numbers = np.unique(values[self.mask(filters, masks, exclude)], return_counts=True)
+            return dict(zip(found.tolist(), numbers.tolist()))
+
+        tagged = self.mask(filters, masks, 'tags')[self.tag_rows]
+        tag_counts = np.bincount(self.tag_values[tagged], minlength=len(self.tag_codes))
+        prices = self.prices[self.mask(filters, masks, 'price')]
+        categories = counts(self.categories, 'category')
+        return {
+            'total': int(self.mask(filters, masks).sum()),
+            # Rolled up the tree: a category counts its whole subtree
+            'category': subtree_counts({
+                self.category_paths[id]: count for id, count in categories.items() if id in self.category_paths
+            }),
+            'brand': counts(self.brands, 'brand'),
+            'tags': {tag: int(tag_counts[code]) for tag, code in self.tag_codes.items() if tag_counts[code]},
+            'in_stock': counts(self.in_stock, 'in_stock'),
+            'price': np.bincount(
+                np.searchsorted(price_buckets, prices, side='right'), minlength=len(price_buckets) + 1,
+            ).tolist(),
+        }
+
+    def query(self, filters, offset, limit):
+        order = self.order(filters.sort)
+        rows = order[self.mask(filters)[order]]
+        return self.ids[rows[offset:offset + limit]].tolist()
+
+
+def snapshot_floor(cursor):
+    # Same token as /api/products/changes: every change not yet visible has
+    # a transaction id at or above it
+    cursor.execute("SELECT pg_snapshot_xmin(pg_current_snapshot())::text::bigint")
+    return cursor.fetchone()[0]
+
+
+class CatalogEngine:
+    """Product filter/sort/paginate in memory, for settings.CATALOG_ENGINE.
+
+    The first query loads every product's filter and sort columns. Later
+    queries pick up changes by product sync_xid (stamped by trigger, see
+    migration 0012) at most every CATALOG_ENGINE_REFRESH seconds, or on the
+    next query after this process saved or deleted a product. Whoever
+    finds the engine loading or refreshing uses SQL or the previous
+    generation instead of waiting.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.columns = None
+        self.dirty = False
+
+    def current(self):
+        """The freshest generation available without waiting, or None."""
+        columns = self.columns
+        if columns is not None and not self.dirty and \
+                time.monotonic() - columns.loaded_at < settings.CATALOG_ENGINE_REFRESH:
+            return columns
+        if not self.lock.acquire(blocking=False):
+            return columns
+        try:
+            self.dirty = False
+            if self.columns is None or self.columns.dead > max(1000, len(self.columns.ids) // 5):
+                self.columns = self.load()
+            else:
+                self.columns = self.refresh(self.columns)
+            return self.columns
+        finally:
+            self.lock.release()
+
+    def load(self):
+        with transaction.atomic(), connection.cursor() as cursor:
+            floor = snapshot_floor(cursor)
+            cursor.execute(COLUMNS_SQL + " ORDER BY id")
+            rows = cursor.fetchall()
+            cursor.execute(CATEGORIES_SQL)
+            return Columns(rows, floor, dict(cursor.fetchall()))
+
+    def refresh(self, columns):
+        with transaction.atomic(), connection.cursor() as cursor:
+            floor = snapshot_floor(cursor)
+            cursor.execute(COLUMNS_SQL + " WHERE sync_xid >= %s ORDER BY id", [columns.floor])
+            rows = cursor.fetchall()
+            cursor.execute("SELECT product_id FROM store_producttombstone WHERE sync_xid >= %s", [columns.floor])
+            deleted = [product_id for product_id, in cursor.fetchall()]
+            # Moving a category changes no product rows; the few paths are reread every time
+            cursor.execute(CATEGORIES_SQL)
+            category_paths = dict(cursor.fetchall())
+        if not rows and not deleted:
+            columns.floor, columns.loaded_at, columns.category_paths = floor, time.monotonic(), category_paths
+            return columns
+        return Columns(rows, floor, category_paths, columns, dropped={row[0] for row in rows} | set(deleted))
+
+    def query(self, filters, offset, limit):
+        """Ids of the products on the requested page, or None to use SQL."""
+        if not settings.CATALOG_ENGINE or filters.specs is not None:
+            return None
+        columns = self.current()
+        return None if columns is None else columns.query(filters, offset, limit)
+
+    def facets(self, filters, price_buckets):
+        """Facet counts for `filters`, or None to use SQL."""
+        if not settings.CATALOG_ENGINE or filters.specs is not None:
+            return None
+        columns = self.current()
+        return None if columns is None else columns.facets(filters, price_buckets)
+
+    def reset(self):
+        with self.lock:
+            self.columns = None
+
+
+catalog_engine = CatalogEngine()
+
+
+@receiver([post_save, post_delete], sender=Product)
+def product_changed(sender, **kwargs):
+    # Read-your-writes for this process; other processes catch up on the watermark
+    transaction.on_commit(lambda: setattr(catalog_engine, 'dirty', True))
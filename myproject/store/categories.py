@@ -0,0 +1,61 @@
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from .models import Category
+from .serializers import CategorySerializer
+
+CACHE_KEY = 'categories:tree'
+
+
+def load_category_tree():
+    """Root categories, each with its `children`, nested all the way down."""
+    categories = Category.objects.order_by('id')
+    nodes = {}
+    for category, data in zip(categories, CategorySerializer(categories, many=True).data):
+        nodes[category.id] = {**data, 'children': []}
+    roots = []
+    for node in nodes.values():
+        parent = nodes.get(node['parent_id'])
+        (roots if parent is None else parent['children']).append(node)
+    return roots
+
+
+def category_tree():
+    """The category tree, as cached under CACHE_KEY."""
+    tree = cache.get(CACHE_KEY)
+    if tree is None:
+        tree = load_category_tree()
+        cache.set(CACHE_KEY, tree, settings.CATEGORY_TREE_SECONDS)
+    return tree
+
+
+def category_paths(ids):
+    """Paths of the categories `ids`; ids not found are left out.
+
+    Read from the table every time, not the per-process tree cache: a
+    category moved by another process must not keep filtering its old subtree.
+    """
+    return list(Category.objects.filter(id__in=ids).values_list('path', flat=True))
+
+
+def subtree_counts(path_counts):
+    """Counts keyed by category path rolled up: each category id also counts its descendants'."""
+    counts = {}
+    for path, count in path_counts.items():
+        for id in path.rstrip('/').split('/'):
+            if id:
+                counts[int(id)] = counts.get(int(id), 0) + count
+    return counts
+
+
+def invalidate_categories():
+    cache.delete(CACHE_KEY)
+    transaction.on_commit(lambda: cache.delete(CACHE_KEY))
+
+
+@receiver([post_save, post_delete], sender=Category)
+def category_changed(sender, **kwargs):
+    invalidate_categories()
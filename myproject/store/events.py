@@ -0,0 +1,308 @@
+import asyncio
+import json
+import logging
+from collections import defaultdict
+from urllib.parse import parse_qs
+
+import jwt
+import psycopg2
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.db import connection, connections
+from djangorestframework_camel_case.util import camelize
+from rest_framework.utils.encoders import JSONEncoder
+
+from .models import Notification
+from .serializers import NotificationSerializer
+
+logger = logging.getLogger(__name__)
+
+# Postgres channel the store triggers publish on (see migration 0007)
+CHANNEL = 'store_events'
+
+
+class Inbox(asyncio.Queue):
+    # A stream's queue; `missed` is set when events were dropped because it was full
+    missed = False
+
+
+class EventHub:
+    """In-process fan-out of store events to the SSE streams of this worker.
+
+    One LISTEN connection per process, opened in the default executor so a
+    slow or unreachable database does not stall the loop, is read from the
+    event loop (no thread), and each event is copied onto the queues of the streams that
+    belong to the user it is about. Broadcast events name a range of user
+    ids instead, and events with neither go to everyone. New notifications
+    are read here, once per event, and each stream gets its user's rows.
+    """
+
+    queue_size = 100
+    reconnect_delay = 5
+
+    def __init__(self):
+        self.subscribers = defaultdict(set)
+        self.listener = None
+
+    def subscribe(self, user_id):
+        queue = Inbox(self.queue_size)
+        self.subscribers[user_id].add(queue)
+        if self.listener is None or self.listener.done():
+            self.listener = asyncio.get_running_loop().create_task(self.listen())
+        return queue
+
+    def unsubscribe(self, user_id, queue):
+        queues = self.subscribers.get(user_id)
+        if queues is not None:
+            queues.discard(queue)
+            if not queues:
+                del self.subscribers[user_id]
+
+    def targets(self, event):
+        """The subscribed user ids the event is for."""
+        user_id = event.get('user_id')
+        if user_id is not None:
+            return [user_id] if user_id in self.subscribers else []
+        if 'first_user_id' in event:
+            # A broadcast chunk covers a range of user ids
+            return [
+                user_id for user_id in self.subscribers
+                if event['first_user_id'] <= user_id <= event['last_user_id']
+            ]
+        return list(self.subscribers)
+
+    def dispatch(self, event, notifications=None):
+        """Queue the event for its users; `notifications` maps user id to that user's new rows."""
+        for user_id in self.targets(event):
+            if notifications is not None:
+                message = {**event, 'notifications': notifications.get(user_id, [])}
+            else:
+                message = event
+            for queue in self.subscribers.get(user_id, ()):
+                try:
+                    queue.put_nowait(message)
+                except asyncio.QueueFull:
+                    # Slow client; it catches up from the database on its next event
+                    queue.missed = True
+
+    async def publish(self, event):
+        notifications = None
+        user_ids = self.targets(event)
+        if user_ids and event['type'] in ('notification', 'broadcast'):
+            try:
+                notifications = await notifications_for(event, user_ids)
+            except Exception:
+                # The streams read the table themselves instead
+                logger.exception("Event hub could not read the notifications for %r", event)
+        self.dispatch(event, notifications)
+
+    def connect(self):
+        # Blocking: connect and LISTEN, run off the event loop
+        conn = psycopg2.connect(**connections['default'].get_connection_params())
+        try:
+            conn.set_session(autocommit=True)
+            conn.cursor().execute(f'LISTEN {CHANNEL}')
+        except psycopg2.Error:
+            conn.close()
+            raise
+        return conn
+
+    async def listen(self):
+        loop = asyncio.get_running_loop()
+        while self.subscribers:
+            try:
+                conn = await loop.run_in_executor(None, self.connect)
+            except psycopg2.Error:
+                logger.exception("Event hub could not connect; retrying")
+                await asyncio.sleep(self.reconnect_delay)
+                continue
+            readable = asyncio.Event()
+            loop.add_reader(conn.fileno(), readable.set)
+            try:
+                while self.subscribers:
+                    try:
+                        await asyncio.wait_for(readable.wait(), self.reconnect_delay)
+                    except asyncio.TimeoutError:
+                        pass  # wake up to notice when the last subscriber has gone
+                    readable.clear()
+                    conn.poll()
+                    while conn.notifies:
+                        notify = conn.notifies.pop(0)
+                        try:
+                            event = json.loads(notify.payload)
+                        except ValueError:
+                            logger.warning("Ignoring malformed event %r", notify.payload)
+                            continue
+                        await self.publish(event)
+            except psycopg2.Error:
+                logger.exception("Event hub lost its connection; reconnecting")
+                await asyncio.sleep(self.reconnect_delay)
+            finally:
+                loop.remove_reader(conn.fileno())
+                conn.close()
+
+
+hub = EventHub()
+
+
+# --- Event stream (ASGI only) ---
+
+HEARTBEAT = 15  # seconds between keep-alive comments
+BATCH = 100
+
+
+def sse(event, data, event_id=None):
+    lines = [f'event: {event}']
+    if event_id is not None:
+        lines.append(f'id: {event_id}')
+    lines.append('data: ' + json.dumps(camelize(data), cls=JSONEncoder))
+    return '\n'.join(lines) + '\n\n'
+
+
+# Reads run on the shared thread pool and close their connection straight
+# away, so an idle stream holds neither a thread nor a database connection.
+@sync_to_async(thread_sensitive=False)
+def latest_notification_id(user_id):
+    try:
+        return Notification.objects.filter(user_id=user_id).order_by('-id').values_list(
+            'id', flat=True
+        ).first() or 0
+    finally:
+        connection.close()
+
+
+@sync_to_async(thread_sensitive=False)
+def new_notifications(user_id, after_id):
+    try:
+        queryset = Notification.objects.filter(user_id=user_id, id__gt=after_id).order_by('id')
+        return NotificationSerializer(queryset[:BATCH], many=True).data
+    finally:
+        connection.close()
+
+
+@sync_to_async(thread_sensitive=False)
+def notifications_for(event, user_ids):
+    # One read for every stream of this worker that the event is for. A
+    # broadcast chunk names the ids it wrote, so this is a primary key range.
+    try:
+        queryset = Notification.objects.filter(user_id__in=user_ids)
+        if 'first_id' in event:
+            queryset = queryset.filter(id__range=(event['first_id'], event['last_id']))
+        else:
+            queryset = queryset.filter(id=event['id'])
+        rows = defaultdict(list)
+        for notification in queryset.order_by('id'):
+            rows[notification.user_id].append(NotificationSerializer(notification).data)
+        return rows
+    finally:
+        connection.close()
+
+
+async def event_stream(user_id, last_id):
+    queue = hub.subscribe(user_id)
+    try:
+        if last_id is None:
+            last_id = await latest_notification_id(user_id)
+        yield 'retry: 5000\n\n'
+        pending = True  # catch up on anything after Last-Event-ID first
+        while True:
+            if pending:
+                batch = await new_notifications(user_id, last_id)
+                for data in batch:
+                    last_id = data['id']
+                    yield sse('notification', data, last_id)
+                pending = len(batch) == BATCH
+                if pending:
+                    continue
+            try:
+                event = await asyncio.wait_for(queue.get(), HEARTBEAT)
+            except asyncio.TimeoutError:
+                yield ': keep-alive\n\n'
+                continue
+            if event['type'] == 'order':
+                yield sse('order', {key: event[key] for key in ('id', 'status', 'tracking_number')})
+            elif queue.missed or 'notifications' not in event:
+                # Events were dropped, or the hub could not read the rows; read the table
+                queue.missed = False
+                pending = True
+            else:
+                for data in event['notifications']:
+                    if data['id'] > last_id:
+                        last_id = data['id']
+                        yield sse('notification', data, last_id)
+    finally:
+        hub.unsubscribe(user_id, queue)
+
+
+def stream_user_id(headers, query):
+    # EventSource cannot send headers, so the JWT may also come as ?token=
+    token = query.get('token', [None])[0]
+    header = headers.get('authorization', '')
+    if not token and header.lower().startswith('bearer '):
+        token = header.split(None, 1)[1]
+    try:
+        return int(jwt.decode(token, settings.SECRET_KEY, algorithms=["HS256"])['sub'])
+    except (TypeError, KeyError, ValueError, jwt.InvalidTokenError):
+        return None
+
+
+def cors_headers(origin):
+    if not origin or not (settings.CORS_ALLOW_ALL_ORIGINS or origin in settings.CORS_ALLOWED_ORIGINS):
+        return []
+    headers = [(b'access-control-allow-origin', origin.encode('latin-1')), (b'vary', b'Origin')]
+    if settings.CORS_ALLOW_CREDENTIALS:
+        headers.append((b'access-control-allow-credentials', b'true'))
+    return headers
+
+
+async def respond(send, status, detail, headers):
+    await send({
+        'type': 'http.response.start', 'status': status,
+        'headers': [(b'content-type', b'application/json'), *headers],
+    })
+    await send({'type': 'http.response.body', 'body': json.dumps({'detail': detail}).encode()})
+
+
+async def wait_for_disconnect(receive):
+    while (await receive())['type'] != 'http.disconnect':
+        pass
+
+
+async def events_app(scope, receive, send):
+    """GET /api/events?token=<jwt>: pushes `notification` and `order` events.
+
+    Mounted in myproject/asgi.py in front of Django: the sync middleware
+    would otherwise keep a thread for every open stream.
+    """
+    headers = {name.decode('latin-1').lower(): value.decode('latin-1') for name, value in scope['headers']}
+    query = parse_qs(scope['query_string'].decode('latin-1'))
+    cors = cors_headers(headers.get('origin'))
+    if scope['method'] != 'GET':
+        return await respond(send, 405, 'Method not allowed', [(b'allow', b'GET'), *cors])
+    user_id = stream_user_id(headers, query)
+    if user_id is None:
+        return await respond(send, 401, 'Invalid token', cors)
+    last_id = headers.get('last-event-id') or query.get('since', [''])[0]
+
+    await send({
+        'type': 'http.response.start', 'status': 200,
+        'headers': [
+            (b'content-type', b'text/event-stream'),
+            (b'cache-control', b'no-cache'),
+            (b'x-accel-buffering', b'no'),
+            *cors,
+        ],
+    })
+
+    async def pump():
+        async for chunk in event_stream(user_id, int(last_id) if last_id.isdigit() else None):
+            await send({'type': 'http.response.body', 'body': chunk.encode(), 'more_body': True})
+
+    stream = asyncio.ensure_future(pump())
+    disconnect = asyncio.ensure_future(wait_for_disconnect(receive))
+    done, _ = await asyncio.wait({stream, disconnect}, return_when=asyncio.FIRST_COMPLETED)
+    for task in (stream, disconnect):
+        task.cancel()
+    await asyncio.gather(stream, disconnect, return_exceptions=True)
+    if stream in done:
+        stream.result()  # the stream only ends on an error
@@ -0,0 +1,105 @@
+import hashlib
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import connection
+from django.db.models import BooleanField, ExpressionWrapper, F, Value
+from django.db.models.functions import Coalesce
+
+from .catalogengine import catalog_engine
+from .categories import subtree_counts
+from .models import Product
+from .productfilters import FACETS
+
+# Most frequent tags returned; a catalog can have thousands
+TAG_LIMIT = 50
+
+
+def matches(q):
+    return ExpressionWrapper(q, output_field=BooleanField()) if q else Value(True)
+
+
+def count_facets(filters, price_buckets):
+    """Facet counts in one grouped query.
+
+    The product rows are joined to their tags (rows without tags kept) and
+    grouped by every facet at once with GROUPING SETS. Each facet counts
+    with its own FILTER: the product must match every filter but that
+    facet's, and only tag counts look past a product's first tag row.
+    Categories are grouped by path and rolled up, so each one counts its
+    whole subtree, as the category filter matches it.
+    """
+    products = Product.objects.annotate(
+        effective_price=Coalesce('sale_price', 'price'), category_path=F('category__path'),
+    ).annotate(
+        match_all=matches(filters.q()),
+        **{f'match_{facet}': matches(filters.q(exclude=facet)) for facet in FACETS},
+    ).values(
+        'id', 'category_path', 'brand_id', 'tags', 'in_stock', 'effective_price',
+        'match_all', *(f'match_{facet}' for facet in FACETS),
+    ).order_by()
+    products_sql, params = products.query.sql_with_params()
+    first_row = "(t.n IS NULL OR t.n = 1)"
+    sql = f"""
+        SELECT GROUPING(p.category_path, p.brand_id, t.tag, p.in_stock, p.bucket),
+               p.category_path, p.brand_id, t.tag, p.in_stock, p.bucket,
+               count(*) FILTER (WHERE {first_row} AND p.match_all),
+               count(*) FILTER (WHERE {first_row} AND p.match_category),
+               count(*) FILTER (WHERE {first_row} AND p.match_brand),
+               count(*) FILTER (WHERE t.tag IS NOT NULL AND p.match_tags),
+               count(*) FILTER (WHERE {first_row} AND p.match_in_stock),
+               count(*) FILTER (WHERE {first_row} AND p.match_price)
+        FROM (
+            SELECT *, width_bucket(effective_price, %s::float8[]) AS bucket FROM ({products_sql}) products
+        ) p
+        LEFT JOIN LATERAL unnest(p.tags) WITH ORDINALITY AS t(tag, n) ON true
+        WHERE p.match_category OR p.match_brand OR p.match_tags OR p.match_in_stock OR p.match_price
+        GROUP BY GROUPING SETS ((), (p.category_path), (p.brand_id), (t.tag), (p.in_stock), (p.bucket))
+    """
+    result = {'total': 0, 'category': {}, 'brand': {}, 'tags': {}, 'in_stock': {},
+              'price': [0] * (len(price_buckets) + 1)}
+    # GROUPING() has a 1 bit for every column the row is not grouped by
+    sets = {0b01111: ('category', 1, 7), 0b10111: ('brand', 2, 8), 0b11011: ('tags', 3, 9),
+            0b11101: ('in_stock', 4, 10), 0b11110: ('price', 5, 11)}
+    with connection.cursor() as cursor:
+        cursor.execute(sql, [list(price_buckets), *params])
+        for row in cursor.fetchall():
+            if row[0] == 0b11111:
+                result['total'] = row[6]
+                continue
+            facet, value, count = sets[row[0]]
+            if row[count]:
+                result[facet][row[value]] = row[count]
+    result['category'] = subtree_counts(result['category'])
+    return result
+
+
+def facet_counts(filters):
+    """The /api/products/facets body for `filters`.
+
+    Served from the in-memory engine when it is on; otherwise from the
+    grouped query, cached for FACET_CACHE_SECONDS per distinct filter set.
+    """
+    buckets = settings.FACET_PRICE_BUCKETS
+    counts = catalog_engine.facets(filters, buckets)
+    if counts is None:
+        key = f"facets:{hashlib.sha256(f'{filters.key()}{buckets}'.encode()).hexdigest()}"
+        counts = cache.get(key)
+        if counts is None:
+            counts = count_facets(filters, buckets)
+            cache.set(key, counts, settings.FACET_CACHE_SECONDS)
+
+    def ranked(values):
+        return sorted(values.items(), key=lambda item: (-item[1], item[0]))
+
+    edges = [None, *buckets, None]
+    return {
+        'total': counts['total'],
+        'categories': [{'id': value, 'count': count} for value, count in ranked(counts['category'])],
+        'brands': [{'id': value, 'count': count} for value, count in ranked(counts['brand'])],
+        'tags': [{'tag': value, 'count': count} for value, count in ranked(counts['tags'])[:TAG_LIMIT]],
+        'in_stock': [{'in_stock': value, 'count': count} for value, count in ranked(counts['in_stock'])],
+        'prices': [
+            {'min': edges[i], 'max': edges[i + 1], 'count': count} for i, count in enumerate(counts['price'])
+        ],
+    }
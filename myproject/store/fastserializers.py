@@ -0,0 +1,99 @@
+from collections import defaultdict
+from functools import cache
+
+from django.core.exceptions import ImproperlyConfigured
+from django.db.models import Prefetch
+from rest_framework import serializers
+
+# Conversions DRF applies in these fields' to_representation(), inlined.
+# Every other field type calls its own to_representation().
+INLINE = [
+    (serializers.BooleanField, '{v}'),
+    (serializers.IntegerField, 'int({v})'),
+    (serializers.FloatField, 'float({v})'),
+    (serializers.CharField, 'str({v})'),
+    (serializers.JSONField, '{v}'),
+    (serializers.ReadOnlyField, '{v}'),
+]
+
+
+class CompiledSerializer:
+    """Read-only stand-in for a ModelSerializer that works from .values() rows.
+
+    For each serializer class a function is generated that turns one row
+    into the same dict the serializer would produce, with no per-field
+    get_attribute() or SkipField handling. Nested many=True serializers on
+    reverse foreign keys are fetched as one more .values() query per level.
+    """
+
+    def __init__(self, serializer_class):
+        serializer = serializer_class()
+        self.model = serializer.Meta.model
+        self.pk = self.model._meta.pk.attname
+        self.columns = []
+        self.nested = {}  # field name -> (related name, foreign key attname, CompiledSerializer)
+        namespace = {}
+        lines = []
+        for name, field in serializer.fields.items():
+            if field.write_only:
+                continue
+            if isinstance(field, serializers.ListSerializer):
+                relation = self.model._meta.get_field(field.source)
+                if not relation.one_to_many:
+                    raise ImproperlyConfigured(f"{serializer_class.__name__}.{name}: only reverse foreign keys nest")
+                self.nested[name] = (field.source, relation.field.attname, compiled(type(field.child)))
+                lines.append(f"{name!r}: nested[{name!r}].get(row[{self.pk!r}], [])")
+                continue
+            if '.' in field.source or field.source == '*':
+                raise ImproperlyConfigured(f"{serializer_class.__name__}.{name}: source {field.source!r} is not a column")
+            self.columns.append(field.source)
+            value = f"row[{field.source!r}]"
+            if isinstance(field, serializers.ListField) and isinstance(field.child, serializers.CharField):
+                converted = f"[None if item is None else str(item) for item in {value}]"
+            else:
+                template = next((template for kind, template in INLINE if isinstance(field, kind)), None)
+                if template is None:
+                    namespace[f"field_{name}"] = field
+                    template = f"field_{name}.to_representation({{v}})"
+                converted = template.format(v=value)
+            if converted != value:
+                converted = f"None if {value} is None else {converted}"
+            lines.append(f"{name!r}: {converted}")
+        if self.pk not in self.columns:
+            self.columns.append(self.pk)
+
+        source = "def represent(row, nested):\n    return {\n" + "".join(f"        {line},\n" for line in lines) + "    }\n"
+        exec(compile(source, f"<compiled {serializer_class.__name__}>", "exec"), namespace)
+        self.represent = namespace['represent']
+        self.source = source
+
+    def values(self, queryset, *extra):
+        """The rows this serializer reads; filters, ordering and slicing are kept.
+
+        `extra` columns (e.g. a paginator's ordering) are fetched but not output.
+        """
+        return queryset.prefetch_related(None).values(*dict.fromkeys([*self.columns, *extra]))
+
+    def serialize(self, rows, prefetches=()):
+        """Serialize a list of rows from values(); `prefetches` may carry ordered Prefetch querysets."""
+        nested = {}
+        if self.nested and rows:
+            ids = [row[self.pk] for row in rows]
+            lookups = {p.prefetch_through: p.queryset for p in prefetches if isinstance(p, Prefetch)}
+            for name, (related_name, foreign_key, child) in self.nested.items():
+                children = lookups.get(related_name)
+                if children is None:
+                    children = child.model._default_manager.order_by(child.pk)
+                children = children.filter(**{f"{foreign_key}__in": ids})
+                child_rows = list(child.values(children, foreign_key))
+                grouped = defaultdict(list)
+                for parent_id, data in zip((row[foreign_key] for row in child_rows), child.serialize(child_rows)):
+                    grouped[parent_id].append(data)
+                nested[name] = grouped
+        represent = self.represent
+        return [represent(row, nested) for row in rows]
+
+
+@cache
+def compiled(serializer_class):
+    return CompiledSerializer(serializer_class)
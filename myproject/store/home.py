@@ -0,0 +1,75 @@
+import gzip
+import hashlib
+
+import brotli
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models import TextField
+from django.db.models.functions import Cast
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+from django.utils.encoding import iri_to_uri
+
+from .catalog import SNAPSHOTS, render_snapshot
+from .models import Brand, Category, HeroSlide, ProductListing
+from .popularity import popular_products
+
+CACHE_KEY = 'home:bundle'
+
+
+def featured_products(limit):
+    """Trending product cards as a JSON array; the newest products until anything has been viewed."""
+    body = popular_products('trending', limit)
+    if body == '[]':
+        documents = (
+            ProductListing.objects.order_by('-product__created_at', '-product_id')
+            .annotate(text=Cast('document', TextField())).values_list('text', flat=True)[:limit]
+        )
+        body = f"[{','.join(documents)}]"
+    return body
+
+
+def load_home():
+    """The /api/home body with its ETag, compressed variants and hero images to preload."""
+    # Same bodies as the list endpoints and catalog snapshots
+    parts = {
+        key: render_snapshot(serializer_class, queryset())
+        for key, (serializer_class, queryset) in [
+            ('heroSlides', SNAPSHOTS['hero_slides']),
+            ('categories', SNAPSHOTS['categories']),
+            ('brands', SNAPSHOTS['brands']),
+        ]
+    }
+    parts['products'] = featured_products(settings.HOME_PRODUCTS).encode()
+    body = b'{' + b','.join(b'"%s":%s' % (name.encode(), part) for name, part in parts.items()) + b'}'
+    return {
+        'body': body,
+        'etag': f'"{hashlib.sha256(body).hexdigest()[:16]}"',
+        'gzip': gzip.compress(body, mtime=0),
+        'br': brotli.compress(body, mode=brotli.MODE_TEXT),
+        'preload': [
+            iri_to_uri(image)
+            for image in HeroSlide.objects.order_by('id').values_list('image', flat=True)[:settings.HOME_PRELOAD_SLIDES]
+        ],
+    }
+
+
+def home():
+    value = cache.get(CACHE_KEY)
+    if value is None:
+        value = load_home()
+        cache.set(CACHE_KEY, value, settings.HOME_CACHE_SECONDS)
+    return value
+
+
+def invalidate_home():
+    cache.delete(CACHE_KEY)
+    transaction.on_commit(lambda: cache.delete(CACHE_KEY))
+
+
+@receiver([post_save, post_delete], sender=HeroSlide)
+@receiver([post_save, post_delete], sender=Category)
+@receiver([post_save, post_delete], sender=Brand)
+def home_changed(sender, **kwargs):
+    invalidate_home()
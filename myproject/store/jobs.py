@@ -0,0 +1,171 @@
+import logging
+import os
+import random
+import socket
+import threading
+import traceback
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured
+from django.db import connection, transaction
+from django.db.models import F
+from django.utils import timezone
+from django.utils.module_loading import import_string
+
+from .models import Job
+
+logger = logging.getLogger(__name__)
+
+BACKOFF_BASE = 10  # seconds before the first retry; doubles with every attempt
+BACKOFF_MAX = 60 * 60
+
+
+def task(queue='default', max_attempts=5):
+    """Mark a function as runnable by the workers and give it a `.delay()`.
+
+    The function is stored by dotted path and called with the JSON-able
+    keyword arguments it was enqueued with.
+    """
+    def decorator(func):
+        func.is_task = True
+        func.queue = queue
+        func.max_attempts = max_attempts
+        func.delay = lambda **kwargs: enqueue(func, **kwargs)
+        return func
+    return decorator
+
+
+def enqueue(func, *, run_at=None, delay=None, priority=None, queue=None, **kwargs):
+    """Queue `func(**kwargs)`, optionally at `run_at` or `delay` seconds from now.
+
+    The job row is written in the caller's transaction, so it only runs if
+    that transaction commits.
+    """
+    queue = queue or func.queue
+    if run_at is None:
+        run_at = timezone.now() + timedelta(seconds=delay or 0)
+    if priority is None:
+        priority = settings.JOB_QUEUE_PRIORITIES.get(queue, 0)
+    return Job.objects.create(
+        queue=queue, name=f"{func.__module__}.{func.__qualname__}", kwargs=kwargs,
+        priority=priority, run_at=run_at, max_attempts=func.max_attempts,
+    )
+
+
+def worker_name():
+    return f"{socket.gethostname()}:{os.getpid()}"
+
+
+def claim_job(worker, queues=None):
+    """Lock the most urgent runnable job, mark it running and return it (or None)."""
+    now = timezone.now()
+    with transaction.atomic():
+        jobs = Job.objects.select_for_update(skip_locked=True).filter(status='queued', run_at__lte=now)
+        if queues:
+            jobs = jobs.filter(queue__in=queues)
+        job = jobs.order_by('-priority', 'run_at', 'id').first()
+        if job is None:
+            return None
+        job.status = 'running'
+        job.attempts += 1
+        job.locked_by = worker
+        job.locked_at = now
+        job.save(update_fields=['status', 'attempts', 'locked_by', 'locked_at'])
+    return job
+
+
+def backoff(attempts):
+    delay = min(BACKOFF_BASE * 2 ** (attempts - 1), BACKOFF_MAX)
+    return timedelta(seconds=delay * random.uniform(0.8, 1.2))
+
+
+class Heartbeat(threading.Thread):
+    """Refreshes a running job's locked_at every JOB_HEARTBEAT seconds, so
+    housekeeping only takes jobs whose worker stopped, however long they run."""
+
+    def __init__(self, job):
+        super().__init__(name=f"job-{job.id}-heartbeat", daemon=True)
+        self.job = job
+        self.stopped = threading.Event()
+
+    def run(self):
+        try:
+            while not self.stopped.wait(settings.JOB_HEARTBEAT):
+                try:
+                    Job.objects.filter(id=self.job.id, status='running', locked_by=self.job.locked_by).update(
+                        locked_at=timezone.now(),
+                    )
+                except Exception:
+                    logger.exception("Could not refresh the lock of job %s", self.job.id)
+        finally:
+            connection.close()  # this thread's own
+
+    def stop(self):
+        self.stopped.set()
+        self.join()
+
+
+def run_job(job):
+    """Run a claimed job and record the outcome; failures are retried with backoff."""
+    heartbeat = Heartbeat(job)
+    heartbeat.start()
+    try:
+        func = import_string(job.name)
+        if not getattr(func, 'is_task', False):
+            raise ImproperlyConfigured(f"{job.name} is not a task")
+        func(**job.kwargs)
+    except Exception:
+        logger.exception("Job %s (%s) failed on attempt %s", job.id, job.name, job.attempts)
+        job.last_error = traceback.format_exc()
+        if job.attempts < job.max_attempts:
+            job.status = 'queued'
+            job.run_at = timezone.now() + backoff(job.attempts)
+        else:
+            job.status = 'failed'
+            job.finished_at = timezone.now()
+    else:
+        job.status = 'done'
+        job.last_error = ''
+        job.finished_at = timezone.now()
+    finally:
+        heartbeat.stop()
+    job.locked_by = ''
+    job.locked_at = None
+    job.save(update_fields=['status', 'run_at', 'last_error', 'finished_at', 'locked_by', 'locked_at'])
+    return job
+
+
+def work(queues, poll, stop):
+    """Worker loop: claim and run jobs until `stop` is set."""
+    worker = worker_name()
+    while not stop.is_set():
+        job = claim_job(worker, queues)
+        if job is None:
+            stop.wait(poll)
+        else:
+            run_job(job)
+
+
+def housekeeping():
+    """Take back jobs whose worker died and prune old finished jobs.
+
+    A lost job is queued again if it has attempts left, as a failure would
+    be, and failed otherwise. Returns how many were requeued, failed and pruned.
+    """
+    now = timezone.now()
+    lost = Job.objects.filter(
+        status='running', locked_at__lt=now - timedelta(seconds=settings.JOB_LOCK_TIMEOUT),
+    )
+    requeued = lost.filter(attempts__lt=F('max_attempts')).update(
+        status='queued', locked_by='', locked_at=None, run_at=now,
+    )
+    failed = lost.filter(attempts__gte=F('max_attempts')).update(
+        status='failed', locked_by='', locked_at=None, finished_at=now,
+        last_error='The worker running this job was lost on its last attempt.',
+    )
+    old = Job.objects.filter(
+        status='done', finished_at__lt=now - timedelta(days=settings.JOB_KEEP_DONE_DAYS),
+    ).values('id')[:1000]
+    pruned, _ = Job.objects.filter(id__in=old).delete()
+    return requeued, failed, pruned
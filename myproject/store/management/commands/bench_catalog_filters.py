@@ -0,0 +1,115 @@
+import statistics
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+from django.http import QueryDict
+
+from store.models import Product
+from store.productfilters import ProductFilters
+
+MATERIALS = ['silver', 'gold', 'rose-gold', 'platinum', 'brass', 'crystal', 'pearl', 'titanium']
+STONES = ['none', 'ruby', 'emerald', 'sapphire', 'diamond', 'zircon', 'opal', 'onyx', 'topaz', 'garnet']
+TAGS = 200  # tag-0 .. tag-199, three per product, skewed towards the low numbers
+# Values are drawn at random: derived from the row number they would line up
+# with each other (every price level one material), which no real catalog does
+
+QUERIES = [
+    'spec.material=silver',
+    'spec.material=platinum&spec.stone=ruby',
+    'spec.material=gold,rose-gold&sort=-price',
+    'tags=tag-0',
+    'tags=tag-150,tag-170',
+    'tags=bridal,tag-190&spec.stone=opal&sort=newest',
+    'spec.material=pearl&tags=tag-5&in_stock=true&sort=price',
+    'spec.stone=diamond&skip=900&limit=100',
+]
+
+
+class Command(BaseCommand):
+    help = (
+        "Time spec/tags product list queries against a generated catalog "
+        "(vacuumed like a live table, deleted afterwards; product triggers are off while it seeds)."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--products', type=int, default=1000000)
+        parser.add_argument('--repeat', type=int, default=20, help="Runs per query; median and worst are reported.")
+
+    def seed(self, products):
+        """Insert the products; returns the bench category's id."""
+        with transaction.atomic(), connection.cursor() as cursor:
+            cursor.execute("ALTER TABLE store_product DISABLE TRIGGER USER")
+            cursor.execute("INSERT INTO store_category (name, slug) VALUES ('Bench', 'bench') RETURNING id")
+            category = cursor.fetchone()[0]
+            cursor.execute("INSERT INTO store_brand (name, slug) VALUES ('Bench', 'bench') RETURNING id")
+            brand = cursor.fetchone()[0]
+            cursor.execute("""
+                INSERT INTO store_product (category_id, brand_id, name, slug, price, sale_price, images, tags,
+                                           specifications, in_stock, quantity, rating_average,
+                                           created_at, updated_at, sync_xid)
+                SELECT %(category)s, %(brand)s, 'Bench ' || i, 'bench-' || i, 100 + (random() * 9000)::int,
+                       CASE WHEN random() < 0.2 THEN 90 + (random() * 9000)::int END, '{}',
+                       ARRAY['tag-' || (random() ^ 3 * %(tags)s)::int %% %(tags)s,
+                             'tag-' || (random() * %(tags)s)::int %% %(tags)s,
+                             'tag-' || i %% %(tags)s],
+                       jsonb_build_object(
+                           'material', (%(materials)s::text[])[1 + (random() * %(material_count)s)::int %% %(material_count)s],
+                           'stone', (%(stones)s::text[])[1 + (random() * %(stone_count)s)::int %% %(stone_count)s],
+                           'weight_grams', (random() * 40)::int),
+                       random() < 0.9, 1, (random() * 50)::int / 10.0, now() - make_interval(secs => i), now(), 0
+                FROM generate_series(1, %(products)s) AS i
+            """, {
+                'category': category, 'brand': brand, 'products': products, 'tags': TAGS,
+                'materials': MATERIALS, 'material_count': len(MATERIALS),
+                'stones': STONES, 'stone_count': len(STONES),
+            })
+            cursor.execute("SET CONSTRAINTS ALL IMMEDIATE")  # run the deferred FK checks first
+            cursor.execute("ALTER TABLE store_product ENABLE TRIGGER USER")
+        # Committed and vacuumed, so index-only scans skip the heap as they
+        # would on a live table; a rolled-back seed would never be all-visible
+        with connection.cursor() as cursor:
+            cursor.execute("VACUUM ANALYZE store_product")
+        return category
+
+    def clean_up(self, category):
+        with transaction.atomic(), connection.cursor() as cursor:
+            cursor.execute("ALTER TABLE store_product DISABLE TRIGGER USER")
+            cursor.execute("DELETE FROM store_product WHERE category_id = %s", [category])
+            cursor.execute("SET CONSTRAINTS ALL IMMEDIATE")
+            cursor.execute("ALTER TABLE store_product ENABLE TRIGGER USER")
+            cursor.execute("DELETE FROM store_category WHERE id = %s", [category])
+            cursor.execute("DELETE FROM store_brand WHERE slug = 'bench'")
+        # The deleted rows are dead tuples in the table and its indexes;
+        # left alone they slow the next run (and everything else) down
+        with connection.cursor() as cursor:
+            cursor.execute("VACUUM ANALYZE store_product")
+
+    def handle(self, *args, **options):
+        repeat = options['repeat']
+        started = time.perf_counter()
+        category = self.seed(options['products'])
+        self.stdout.write(f"Seeded {options['products']} products in {time.perf_counter() - started:.0f}s")
+        try:
+            self.stdout.write(f"{'query':<56}{'rows':>6}{'median ms':>11}{'worst ms':>10}  plan")
+            for query in QUERIES:
+                params = QueryDict(query)
+                filters = ProductFilters.from_params(params)
+                offset, limit = int(params.get('skip', 0)), int(params.get('limit', 100))
+                # The page's ids: the filter and sort work ProductListView's query does
+                queryset = filters.apply(Product.objects.all()).values_list('id', flat=True)[offset:offset + limit]
+                timings = []
+                for _ in range(repeat):
+                    started = time.perf_counter()
+                    rows = len(list(queryset.all()))
+                    timings.append((time.perf_counter() - started) * 1000)
+                plan = queryset.explain()
+                indexes = sorted({name for name in ('product_spec_gin', 'product_tags_gin') if name in plan})
+                if 'Index Only Scan' in plan:
+                    indexes.append('index-only')
+                self.stdout.write(
+                    f"{query:<56}{rows:>6}{statistics.median(timings):>11.1f}{max(timings):>10.1f}  "
+                    f"{', '.join(indexes) or 'no GIN index'}"
+                )
+        finally:
+            self.clean_up(category)
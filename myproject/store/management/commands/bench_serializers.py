@@ -0,0 +1,58 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from django.db.models import Prefetch
+from rest_framework.renderers import JSONRenderer
+
+from store.fastserializers import compiled
+from store.models import Address, Notification, Order, OrderItem, Product, Review, User
+from store.serializers import NotificationSerializer, OrderSerializer, ProductSerializer, UserSerializer
+from store.testing import seed_store
+
+CASES = [
+    (ProductSerializer, lambda: Product.objects.prefetch_related(Prefetch('reviews', Review.objects.order_by('id')))),
+    (OrderSerializer, lambda: Order.objects.prefetch_related(Prefetch('items', OrderItem.objects.order_by('id')))),
+    (UserSerializer, lambda: User.objects.prefetch_related(Prefetch('addresses', Address.objects.order_by('id')))),
+    (NotificationSerializer, lambda: Notification.objects.all()),
+]
+
+
+class Command(BaseCommand):
+    help = "Time the compiled serializers against DRF on the same rows (seeded, rolled back)."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--rows', type=int, default=500, help="Rows per list.")
+        parser.add_argument('--repeat', type=int, default=20, help="Runs per path; the best is reported.")
+
+    def best(self, func, repeat):
+        timings = []
+        for _ in range(repeat):
+            started = time.perf_counter()
+            func()
+            timings.append(time.perf_counter() - started)
+        return min(timings) * 1000
+
+    def handle(self, *args, **options):
+        rows, repeat = options['rows'], options['repeat']
+        render = JSONRenderer().render
+        with transaction.atomic():
+            seed_store(rows)
+            self.stdout.write(f"{'serializer':<24}{'DRF ms':>10}{'compiled ms':>13}{'speedup':>9}")
+            for serializer_class, queryset in CASES:
+                queryset = queryset().order_by('id')[:rows]
+                fast = compiled(serializer_class)
+
+                def drf():
+                    return serializer_class(queryset.all(), many=True).data
+
+                def compiled_path():
+                    return fast.serialize(list(fast.values(queryset)), queryset._prefetch_related_lookups)
+
+                if render(drf()) != render(compiled_path()):
+                    raise CommandError(f"{serializer_class.__name__}: compiled output differs from DRF")
+                slow, quick = self.best(drf, repeat), self.best(compiled_path, repeat)
+                self.stdout.write(
+                    f"{serializer_class.__name__:<24}{slow:>10.2f}{quick:>13.2f}{slow / quick:>8.1f}x"
+                )
+            transaction.set_rollback(True)
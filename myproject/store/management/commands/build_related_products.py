@@ -0,0 +1,20 @@
+from django.core.management.base import BaseCommand
+
+from store.recommendations import build_related_products, update_related_products
+
+
+class Command(BaseCommand):
+    help = (
+        "Rebuild the frequently-bought-together lists from order items. New "
+        "order items queue an incremental update as a job; run a full build "
+        "after bulk imports or to drop cancelled orders."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--incremental', action='store_true',
+                            help="Only redo products in orders created since the previous run.")
+
+    def handle(self, *args, **options):
+        run = (update_related_products if options['incremental'] else build_related_products)()
+        kind = 'incremental' if run.incremental else 'full'
+        self.stdout.write(self.style.SUCCESS(f"Rebuilt the lists of {run.products} products ({kind})"))
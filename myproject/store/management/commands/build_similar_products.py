@@ -0,0 +1,28 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from store.similarity import build_similar_products, refresh_similar_products
+
+
+class Command(BaseCommand):
+    help = (
+        "Rebuild the similar-product lists from product tags, specifications, "
+        "text, category and brand. Product changes queue an incremental "
+        "refresh as a job; run a full build after bulk imports, and now and "
+        "then so unchanged products' lists take in new products."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--incremental', action='store_true',
+                            help="Only redo products changed since the saved index.")
+        parser.add_argument('--workers', type=int, default=None,
+                            help="Processes to vectorize and search with (default: SIMILAR_WORKERS).")
+
+    def handle(self, *args, **options):
+        started = time.perf_counter()
+        build = refresh_similar_products if options['incremental'] else build_similar_products
+        products = build(workers=options['workers'])
+        self.stdout.write(self.style.SUCCESS(
+            f"Rebuilt the lists of {products} products in {time.perf_counter() - started:.1f}s"
+        ))
@@ -0,0 +1,60 @@
+from types import SimpleNamespace
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from django.db.models import Count
+
+from store.models import Product, User
+from store.queryplans import check_endpoints
+from store.testing import seed_scaled
+
+
+class Command(BaseCommand):
+    help = (
+        "EXPLAIN the SQL behind the key store endpoints and flag sequential scans "
+        "or disk sorts on large tables."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--seed', type=int, default=0,
+            help="Load a synthetic dataset of this many rows per table first (rolled back afterwards).",
+        )
+        parser.add_argument(
+            '--threshold', type=int, default=10000,
+            help="Only flag sequential scans on tables with at least this many rows.",
+        )
+        parser.add_argument(
+            '--no-analyze', action='store_true',
+            help="Plain EXPLAIN; faster, but sort spills cannot be detected.",
+        )
+
+    def handle(self, *args, **options):
+        with transaction.atomic():
+            if options['seed']:
+                self.stdout.write(f"Seeding {options['seed']} rows per table...")
+                data = seed_scaled(options['seed'])
+            else:
+                data = SimpleNamespace(
+                    user=User.objects.annotate(n=Count('orders')).order_by('-n').first(),
+                    product=Product.objects.order_by('id').first(),
+                )
+                if data.user is None or data.product is None:
+                    raise CommandError("No data to check against; pass --seed N.")
+
+            failures = 0
+            for name, sql, problems in check_endpoints(
+                data, options['threshold'], analyze=not options['no_analyze']
+            ):
+                if problems:
+                    failures += 1
+                    self.stdout.write(self.style.ERROR(f"[{name}] {sql}"))
+                    for problem in problems:
+                        self.stdout.write(f"    {problem}")
+                else:
+                    self.stdout.write(self.style.SUCCESS(f"[{name}] ok") + f"  {sql[:100]}")
+
+            transaction.set_rollback(True)
+
+        if failures:
+            raise CommandError(f"{failures} queries need attention.")
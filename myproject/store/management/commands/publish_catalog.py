@@ -0,0 +1,17 @@
+from django.core.management.base import BaseCommand
+
+from store.catalog import publish_catalog
+
+
+class Command(BaseCommand):
+    help = (
+        "Write the products, categories, brands and hero slides snapshots "
+        "(gzip and brotli too) into STATIC_ROOT/catalog and update its manifest. "
+        "Web processes republish on catalog changes; run this before they start."
+    )
+
+    def handle(self, *args, **options):
+        manifest = publish_catalog()
+        for name, url in manifest.items():
+            self.stdout.write(f"  {name}: {url}")
+        self.stdout.write(self.style.SUCCESS("Published the catalog snapshots"))
@@ -0,0 +1,88 @@
+import time
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.utils import timezone
+
+from store.models import Notification, NotificationArchive
+
+# One batch: lock the oldest expired rows nobody else holds, delete them and
+# optionally copy them to the archive, all in a single short statement.
+PURGE_SQL = """
+    WITH doomed AS (
+        SELECT id FROM {notification}
+        WHERE type = %(type)s AND is_read AND created_at < %(cutoff)s
+        ORDER BY created_at LIMIT %(limit)s
+        FOR UPDATE SKIP LOCKED
+    ), removed AS (
+        DELETE FROM {notification} n USING doomed WHERE n.id = doomed.id
+        RETURNING n.id, n.user_id, n.title, n.message, n.type, n.created_at
+    ){archive}
+    SELECT count(*) FROM removed
+"""
+
+ARCHIVE_SQL = """, archived AS (
+        INSERT INTO {archive} (id, user_id, title, message, type, created_at, archived_at)
+        SELECT id, user_id, title, message, type, created_at, now() FROM removed
+    )"""
+
+
+class Command(BaseCommand):
+    help = (
+        "Delete read notifications older than their type's retention "
+        "(settings.NOTIFICATION_RETENTION_DAYS), in small batches."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--batch-size', type=int, default=5000,
+            help="Rows removed per statement; each batch commits on its own.",
+        )
+        parser.add_argument(
+            '--pause', type=float, default=0.2,
+            help="Seconds to sleep between batches, to leave room for replication and vacuum.",
+        )
+        parser.add_argument(
+            '--archive', action='store_true',
+            help="Copy the rows to NotificationArchive instead of dropping them.",
+        )
+        parser.add_argument('--type', action='append', help="Only purge this type (repeatable).")
+        parser.add_argument('--dry-run', action='store_true', help="Only count what would go.")
+
+    def handle(self, *args, **options):
+        policy = settings.NOTIFICATION_RETENTION_DAYS
+        types = options['type'] or list(policy)
+        unknown = set(types) - set(policy)
+        if unknown:
+            raise CommandError(f"No retention configured for: {', '.join(sorted(unknown))}")
+
+        sql = PURGE_SQL.format(
+            notification=Notification._meta.db_table,
+            archive=ARCHIVE_SQL.format(archive=NotificationArchive._meta.db_table) if options['archive'] else '',
+        )
+        now = timezone.now()
+        total = 0
+        for kind in types:
+            cutoff = now - timedelta(days=policy[kind])
+            if options['dry_run']:
+                count = Notification.objects.filter(type=kind, is_read=True, created_at__lt=cutoff).count()
+                self.stdout.write(f"{kind}: {count} read notifications older than {policy[kind]} days")
+                continue
+
+            removed = 0
+            while True:
+                with connection.cursor() as cursor:
+                    cursor.execute(sql, {'type': kind, 'cutoff': cutoff, 'limit': options['batch_size']})
+                    count = cursor.fetchone()[0]
+                removed += count
+                if count < options['batch_size']:
+                    break
+                time.sleep(options['pause'])
+            total += removed
+            self.stdout.write(f"{kind}: removed {removed} older than {policy[kind]} days")
+
+        if not options['dry_run']:
+            verb = 'Archived' if options['archive'] else 'Deleted'
+            self.stdout.write(self.style.SUCCESS(f"{verb} {total} notifications"))
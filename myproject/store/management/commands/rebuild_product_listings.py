@@ -0,0 +1,32 @@
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+
+from store.models import Product
+
+
+class Command(BaseCommand):
+    help = (
+        "Rebuild the product listing documents. Triggers keep them current; "
+        "run this after changing the document shape or restoring data with triggers off."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=5000,
+                            help="Products rebuilt per statement; each batch commits on its own.")
+
+    def handle(self, *args, **options):
+        last_id = 0
+        rebuilt = 0
+        while True:
+            ids = list(
+                Product.objects.filter(id__gt=last_id).order_by('id')
+                .values_list('id', flat=True)[:options['batch_size']]
+            )
+            if not ids:
+                break
+            with transaction.atomic(), connection.cursor() as cursor:
+                cursor.execute("SELECT store_refresh_product_listings(%s::bigint[])", [ids])
+            rebuilt += len(ids)
+            last_id = ids[-1]
+            self.stdout.write(f"  {rebuilt} products")
+        self.stdout.write(self.style.SUCCESS(f"Rebuilt {rebuilt} listing documents"))
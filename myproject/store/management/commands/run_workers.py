@@ -0,0 +1,76 @@
+import multiprocessing
+import signal
+import threading
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import connections
+
+from store.jobs import housekeeping, work
+
+HOUSEKEEPING_INTERVAL = 60
+
+
+def worker_main(queues, poll):
+    # Each worker keeps its own stop flag: a lock shared with the parent could
+    # be left held by a worker that gets killed. The parent sends SIGTERM.
+    stop = threading.Event()
+    signal.signal(signal.SIGTERM, lambda signum, frame: stop.set())
+    # Ctrl-C reaches the whole process group; let the parent decide when to stop
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    work(queues, poll, stop)
+    connections.close_all()
+
+
+class Command(BaseCommand):
+    help = "Run background jobs from the jobs table in a pool of worker processes."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--concurrency', type=int, default=multiprocessing.cpu_count(),
+                            help="Number of worker processes.")
+        parser.add_argument('--queue', action='append', dest='queues',
+                            help="Only take jobs from this queue (repeatable); default is every queue.")
+        parser.add_argument('--poll', type=float, default=1.0,
+                            help="Seconds an idle worker waits before looking for jobs again.")
+
+    def handle(self, *args, **options):
+        # Fork so the children inherit the configured Django; no connection may cross the fork
+        context = multiprocessing.get_context('fork')
+        stop = threading.Event()
+        args = (options['queues'], options['poll'])
+
+        def start():
+            connections.close_all()
+            process = context.Process(target=worker_main, args=args, daemon=True)
+            process.start()
+            return process
+
+        def shutdown(signum, frame):
+            self.stdout.write("Stopping; workers finish their current job first...")
+            stop.set()
+
+        signal.signal(signal.SIGINT, shutdown)
+        signal.signal(signal.SIGTERM, shutdown)
+
+        pool = [start() for _ in range(options['concurrency'])]
+        self.stdout.write(f"Started {len(pool)} workers: {', '.join(str(p.pid) for p in pool)}")
+        next_housekeeping = 0
+        while not stop.is_set():
+            for i, process in enumerate(pool):
+                if not process.is_alive():
+                    self.stderr.write(f"Worker {process.pid} exited with {process.exitcode}; restarting")
+                    pool[i] = start()
+            if time.monotonic() >= next_housekeeping:
+                requeued, failed, pruned = housekeeping()
+                if requeued:
+                    self.stderr.write(f"Requeued {requeued} jobs left running by lost workers")
+                if failed:
+                    self.stderr.write(f"Failed {failed} jobs lost on their last attempt")
+                next_housekeeping = time.monotonic() + HOUSEKEEPING_INTERVAL
+            stop.wait(1)
+
+        for process in pool:
+            process.terminate()
+        for process in pool:
+            process.join()
+        self.stdout.write(self.style.SUCCESS("All workers stopped"))
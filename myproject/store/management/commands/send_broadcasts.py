@@ -0,0 +1,44 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from store.broadcasts import CHUNK_SIZE, claim_broadcast, send_broadcast
+
+
+class Command(BaseCommand):
+    help = "Send the pending notification broadcasts now, without waiting for the job workers."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--chunk-size', type=int, default=CHUNK_SIZE,
+            help="Notifications written per INSERT ... SELECT.",
+        )
+        parser.add_argument(
+            '--poll', type=float, default=0,
+            help="Keep running and look for new broadcasts every this many seconds.",
+        )
+
+    def handle(self, *args, **options):
+        while True:
+            broadcast = claim_broadcast()
+            if broadcast is None:
+                if not options['poll']:
+                    return
+                time.sleep(options['poll'])
+                continue
+
+            self.stdout.write(f"Sending broadcast {broadcast.id} \"{broadcast.title}\"")
+            started = time.monotonic()
+
+            def progress(broadcast):
+                elapsed = time.monotonic() - started
+                self.stdout.write(
+                    f"  {broadcast.sent}/{broadcast.total} "
+                    f"({broadcast.sent / elapsed:.0f}/s, {elapsed:.1f}s)"
+                )
+
+            try:
+                send_broadcast(broadcast, options['chunk_size'], progress)
+            except Exception as exc:
+                raise CommandError(f"Broadcast {broadcast.id} failed: {exc}") from exc
+            self.stdout.write(self.style.SUCCESS(f"Broadcast {broadcast.id} sent to {broadcast.sent} users"))
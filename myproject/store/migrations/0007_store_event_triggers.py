@@ -0,0 +1,52 @@
+from django.db import migrations
+
+# New notifications and order status changes are NOTIFYed on the
+# 'store_events' channel for the SSE hub in store/events.py. A bulk writer
+# can `SET LOCAL store.suppress_events = 'on'` to skip the per-row
+# notification events and announce the batch itself.
+
+FORWARD = """
+CREATE FUNCTION store_notification_event() RETURNS trigger AS $$
+BEGIN
+    IF coalesce(current_setting('store.suppress_events', true), '') <> 'on' THEN
+        PERFORM pg_notify('store_events', json_build_object(
+            'type', 'notification', 'user_id', NEW.user_id, 'id', NEW.id)::text);
+    END IF;
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+CREATE TRIGGER store_notification_event AFTER INSERT ON store_notification
+    FOR EACH ROW EXECUTE FUNCTION store_notification_event();
+
+CREATE FUNCTION store_order_status_event() RETURNS trigger AS $$
+BEGIN
+    PERFORM pg_notify('store_events', json_build_object(
+        'type', 'order', 'user_id', NEW.user_id, 'id', NEW.id,
+        'status', NEW.status, 'tracking_number', NEW.tracking_number)::text);
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+CREATE TRIGGER store_order_status_event AFTER UPDATE OF status ON store_order
+    FOR EACH ROW WHEN (OLD.status IS DISTINCT FROM NEW.status)
+    EXECUTE FUNCTION store_order_status_event();
+"""
+
+REVERSE = """
+DROP TRIGGER IF EXISTS store_order_status_event ON store_order;
+DROP FUNCTION IF EXISTS store_order_status_event();
+DROP TRIGGER IF EXISTS store_notification_event ON store_notification;
+DROP FUNCTION IF EXISTS store_notification_event();
+"""
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('store', '0006_notification_inbox_index'),
+    ]
+
+    operations = [
+        migrations.RunSQL(FORWARD, REVERSE),
+    ]
@@ -0,0 +1,103 @@
+# Generated by Django 6.0.1 on 2026-10-19 12:57
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+# store_refresh_product_listings(ids) rebuilds the listing documents of the
+# given products. Statement-level triggers call it with the ids a statement
+# touched (transition tables), so a bulk load refreshes once per statement,
+# not once per row. Brand and category renames refresh their products.
+
+FORWARD = """
+CREATE FUNCTION store_refresh_product_listings(product_ids bigint[]) RETURNS void AS $$
+    INSERT INTO store_productlisting (product_id, document, updated_at)
+    SELECT p.id, jsonb_build_object(
+        'id', p.id, 'name', p.name, 'slug', p.slug,
+        'price', p.price, 'salePrice', p.sale_price, 'image', p.images[1],
+        'categoryId', p.category_id, 'category', c.name, 'categorySlug', c.slug,
+        'brandId', p.brand_id, 'brand', b.name, 'brandSlug', b.slug,
+        'tags', to_jsonb(p.tags), 'inStock', p.in_stock, 'quantity', p.quantity,
+        'ratingAverage', p.rating_average, 'reviewCount', r.n, 'reviewRating', r.rating,
+        'createdAt', to_char(p.created_at AT TIME ZONE 'UTC', 'YYYY-MM-DD"T"HH24:MI:SS.US"Z"')
+    ), now()
+    FROM store_product p
+    JOIN store_category c ON c.id = p.category_id
+    JOIN store_brand b ON b.id = p.brand_id
+    CROSS JOIN LATERAL (
+        SELECT count(*) AS n, round(avg(rating)::numeric, 2) AS rating
+        FROM store_review WHERE product_id = p.id
+    ) r
+    WHERE p.id = ANY(product_ids)
+    ON CONFLICT (product_id) DO UPDATE SET document = EXCLUDED.document, updated_at = EXCLUDED.updated_at;
+$$ LANGUAGE sql;
+
+CREATE FUNCTION store_product_listing_changed() RETURNS trigger AS $$
+BEGIN
+    IF TG_TABLE_NAME = 'store_product' THEN
+        PERFORM store_refresh_product_listings(ARRAY(SELECT id FROM changed));
+    ELSIF TG_TABLE_NAME = 'store_review' AND TG_OP = 'UPDATE' THEN
+        -- A review moved to another product changes both listings
+        PERFORM store_refresh_product_listings(ARRAY(
+            SELECT product_id FROM changed UNION SELECT product_id FROM previous));
+    ELSIF TG_TABLE_NAME = 'store_review' THEN
+        PERFORM store_refresh_product_listings(ARRAY(SELECT DISTINCT product_id FROM changed));
+    ELSIF TG_TABLE_NAME = 'store_brand' THEN
+        PERFORM store_refresh_product_listings(ARRAY(
+            SELECT p.id FROM store_product p JOIN changed ON p.brand_id = changed.id));
+    ELSIF TG_TABLE_NAME = 'store_category' THEN
+        PERFORM store_refresh_product_listings(ARRAY(
+            SELECT p.id FROM store_product p JOIN changed ON p.category_id = changed.id));
+    END IF;
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+CREATE TRIGGER store_product_listing_insert AFTER INSERT ON store_product
+    REFERENCING NEW TABLE AS changed FOR EACH STATEMENT EXECUTE FUNCTION store_product_listing_changed();
+CREATE TRIGGER store_product_listing_update AFTER UPDATE ON store_product
+    REFERENCING NEW TABLE AS changed FOR EACH STATEMENT EXECUTE FUNCTION store_product_listing_changed();
+CREATE TRIGGER store_review_listing_insert AFTER INSERT ON store_review
+    REFERENCING NEW TABLE AS changed FOR EACH STATEMENT EXECUTE FUNCTION store_product_listing_changed();
+CREATE TRIGGER store_review_listing_update AFTER UPDATE ON store_review
+    REFERENCING OLD TABLE AS previous NEW TABLE AS changed
+    FOR EACH STATEMENT EXECUTE FUNCTION store_product_listing_changed();
+CREATE TRIGGER store_review_listing_delete AFTER DELETE ON store_review
+    REFERENCING OLD TABLE AS changed FOR EACH STATEMENT EXECUTE FUNCTION store_product_listing_changed();
+CREATE TRIGGER store_brand_listing_update AFTER UPDATE ON store_brand
+    REFERENCING NEW TABLE AS changed FOR EACH STATEMENT EXECUTE FUNCTION store_product_listing_changed();
+CREATE TRIGGER store_category_listing_update AFTER UPDATE ON store_category
+    REFERENCING NEW TABLE AS changed FOR EACH STATEMENT EXECUTE FUNCTION store_product_listing_changed();
+
+SELECT store_refresh_product_listings(ARRAY(SELECT id FROM store_product));
+"""
+
+REVERSE = """
+DROP TRIGGER IF EXISTS store_category_listing_update ON store_category;
+DROP TRIGGER IF EXISTS store_brand_listing_update ON store_brand;
+DROP TRIGGER IF EXISTS store_review_listing_delete ON store_review;
+DROP TRIGGER IF EXISTS store_review_listing_update ON store_review;
+DROP TRIGGER IF EXISTS store_review_listing_insert ON store_review;
+DROP TRIGGER IF EXISTS store_product_listing_update ON store_product;
+DROP TRIGGER IF EXISTS store_product_listing_insert ON store_product;
+DROP FUNCTION IF EXISTS store_product_listing_changed();
+DROP FUNCTION IF EXISTS store_refresh_product_listings(bigint[]);
+"""
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('store', '0010_job'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ProductListing',
+            fields=[
+                ('product', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='listing', serialize=False, to='store.product')),
+                ('document', models.JSONField()),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+            ],
+        ),
+        migrations.RunSQL(FORWARD, REVERSE),
+    ]
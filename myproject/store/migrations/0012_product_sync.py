@@ -0,0 +1,108 @@
+# Generated by Django 6.0.1 on 2026-10-19 13:06
+
+from django.db import migrations, models
+
+# Every write to a product stamps it with the id of the writing transaction.
+# Review changes stamp their products too (reviews are part of the product
+# payload); that UPDATE also refreshes the listing documents through the
+# product trigger from 0011, so the review listing triggers are replaced.
+# Deletes leave a tombstone carrying the deleting transaction's id.
+
+FORWARD = """
+CREATE FUNCTION store_product_stamp_xid() RETURNS trigger AS $$
+BEGIN
+    NEW.sync_xid := pg_current_xact_id()::text::bigint;
+    RETURN NEW;
+END;
+$$ LANGUAGE plpgsql;
+
+CREATE TRIGGER store_product_stamp_xid BEFORE INSERT OR UPDATE ON store_product
+    FOR EACH ROW EXECUTE FUNCTION store_product_stamp_xid();
+
+CREATE FUNCTION store_review_touch_product() RETURNS trigger AS $$
+BEGIN
+    IF TG_OP = 'UPDATE' THEN
+        -- A review moved to another product changes both
+        UPDATE store_product SET sync_xid = 0
+        WHERE id IN (SELECT product_id FROM changed UNION SELECT product_id FROM previous);
+    ELSE
+        UPDATE store_product SET sync_xid = 0
+        WHERE id IN (SELECT DISTINCT product_id FROM changed);
+    END IF;
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+DROP TRIGGER store_review_listing_insert ON store_review;
+DROP TRIGGER store_review_listing_update ON store_review;
+DROP TRIGGER store_review_listing_delete ON store_review;
+CREATE TRIGGER store_review_touch_product_insert AFTER INSERT ON store_review
+    REFERENCING NEW TABLE AS changed FOR EACH STATEMENT EXECUTE FUNCTION store_review_touch_product();
+CREATE TRIGGER store_review_touch_product_update AFTER UPDATE ON store_review
+    REFERENCING OLD TABLE AS previous NEW TABLE AS changed
+    FOR EACH STATEMENT EXECUTE FUNCTION store_review_touch_product();
+CREATE TRIGGER store_review_touch_product_delete AFTER DELETE ON store_review
+    REFERENCING OLD TABLE AS changed FOR EACH STATEMENT EXECUTE FUNCTION store_review_touch_product();
+
+CREATE FUNCTION store_product_tombstone() RETURNS trigger AS $$
+BEGIN
+    INSERT INTO store_producttombstone (product_id, sync_xid, deleted_at)
+    SELECT id, pg_current_xact_id()::text::bigint, now() FROM changed
+    ON CONFLICT (product_id) DO UPDATE SET sync_xid = EXCLUDED.sync_xid, deleted_at = EXCLUDED.deleted_at;
+    -- A review deleted in the same transaction may have rebuilt the listing
+    DELETE FROM store_productlisting WHERE product_id IN (SELECT id FROM changed);
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+CREATE TRIGGER store_product_tombstone AFTER DELETE ON store_product
+    REFERENCING OLD TABLE AS changed FOR EACH STATEMENT EXECUTE FUNCTION store_product_tombstone();
+
+UPDATE store_product SET sync_xid = 0;
+"""
+
+REVERSE = """
+DROP TRIGGER IF EXISTS store_product_tombstone ON store_product;
+DROP FUNCTION IF EXISTS store_product_tombstone();
+DROP TRIGGER IF EXISTS store_review_touch_product_delete ON store_review;
+DROP TRIGGER IF EXISTS store_review_touch_product_update ON store_review;
+DROP TRIGGER IF EXISTS store_review_touch_product_insert ON store_review;
+DROP FUNCTION IF EXISTS store_review_touch_product();
+CREATE TRIGGER store_review_listing_insert AFTER INSERT ON store_review
+    REFERENCING NEW TABLE AS changed FOR EACH STATEMENT EXECUTE FUNCTION store_product_listing_changed();
+CREATE TRIGGER store_review_listing_update AFTER UPDATE ON store_review
+    REFERENCING OLD TABLE AS previous NEW TABLE AS changed
+    FOR EACH STATEMENT EXECUTE FUNCTION store_product_listing_changed();
+CREATE TRIGGER store_review_listing_delete AFTER DELETE ON store_review
+    REFERENCING OLD TABLE AS changed FOR EACH STATEMENT EXECUTE FUNCTION store_product_listing_changed();
+DROP TRIGGER IF EXISTS store_product_stamp_xid ON store_product;
+DROP FUNCTION IF EXISTS store_product_stamp_xid();
+"""
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('store', '0011_product_listing'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ProductTombstone',
+            fields=[
+                ('product_id', models.BigIntegerField(primary_key=True, serialize=False)),
+                ('sync_xid', models.BigIntegerField(db_index=True)),
+                ('deleted_at', models.DateTimeField(auto_now_add=True)),
+            ],
+        ),
+        migrations.AddField(
+            model_name='product',
+            name='sync_xid',
+            field=models.BigIntegerField(default=0, editable=False),
+        ),
+        migrations.AddIndex(
+            model_name='product',
+            index=models.Index(fields=['sync_xid', 'id'], name='product_sync_idx'),
+        ),
+        migrations.RunSQL(FORWARD, REVERSE),
+    ]
@@ -0,0 +1,71 @@
+# Generated by Django 6.0.1 on 2026-10-19 13:11
+
+from django.db import migrations
+
+# Any statement that changes the catalog NOTIFYs 'store_catalog' with the
+# table's name (once per transaction; Postgres folds identical
+# notifications). Each web process listens and republishes the snapshots it
+# serves (store/catalog.py). Product updates only count when a column the
+# snapshot renders changed: review changes touch every product they belong
+# to (migration 0012), and are announced as store_review instead.
+
+TABLES = ['store_category', 'store_brand', 'store_heroslide', 'store_review']
+
+# store_product columns in ProductSerializer
+RENDERED = [
+    'name', 'slug', 'description', 'price', 'sale_price', 'images', 'category_id', 'brand_id', 'tags',
+    'in_stock', 'quantity', 'rating_average', 'specifications', 'created_at', 'updated_at',
+]
+
+FORWARD = """
+CREATE FUNCTION store_catalog_changed() RETURNS trigger AS $$
+BEGIN
+    PERFORM pg_notify('store_catalog', TG_TABLE_NAME);
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+CREATE FUNCTION store_product_catalog_updated() RETURNS trigger AS $$
+BEGIN
+    IF EXISTS (
+        SELECT 1 FROM previous JOIN changed USING (id)
+        WHERE (%(old)s) IS DISTINCT FROM (%(new)s)
+    ) THEN
+        PERFORM pg_notify('store_catalog', TG_TABLE_NAME);
+    END IF;
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+CREATE TRIGGER store_product_catalog_publish AFTER INSERT OR DELETE OR TRUNCATE ON store_product
+    FOR EACH STATEMENT EXECUTE FUNCTION store_catalog_changed();
+CREATE TRIGGER store_product_catalog_publish_update AFTER UPDATE ON store_product
+    REFERENCING OLD TABLE AS previous NEW TABLE AS changed
+    FOR EACH STATEMENT EXECUTE FUNCTION store_product_catalog_updated();
+""" % {
+    'old': ', '.join(f'previous.{column}' for column in RENDERED),
+    'new': ', '.join(f'changed.{column}' for column in RENDERED),
+} + "".join(f"""
+CREATE TRIGGER {table}_catalog_publish AFTER INSERT OR UPDATE OR DELETE OR TRUNCATE ON {table}
+    FOR EACH STATEMENT EXECUTE FUNCTION store_catalog_changed();
+""" for table in TABLES)
+
+REVERSE = "".join(f"""
+DROP TRIGGER IF EXISTS {table}_catalog_publish ON {table};
+""" for table in TABLES) + """
+DROP TRIGGER IF EXISTS store_product_catalog_publish_update ON store_product;
+DROP TRIGGER IF EXISTS store_product_catalog_publish ON store_product;
+DROP FUNCTION IF EXISTS store_product_catalog_updated();
+DROP FUNCTION IF EXISTS store_catalog_changed();
+"""
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('store', '0012_product_sync'),
+    ]
+
+    operations = [
+        migrations.RunSQL(FORWARD, REVERSE),
+    ]
@@ -0,0 +1,86 @@
+# Generated by Django 6.0.1 on 2026-10-19 13:42
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+# Category.path is the category's ancestors' ids and its own, "1/4/9/".
+# Set before every insert and every write of parent_id (Django's save()
+# writes all columns, so a stale path from Python is overwritten); when it
+# changes, the subtree's paths are rewritten after it. Moving a category
+# under itself or its own descendants is refused.
+
+FORWARD = """
+CREATE FUNCTION store_category_set_path() RETURNS trigger AS $$
+DECLARE
+    parent_path varchar;
+BEGIN
+    IF NEW.parent_id IS NULL THEN
+        NEW.path := NEW.id || '/';
+        RETURN NEW;
+    END IF;
+    SELECT path INTO parent_path FROM store_category WHERE id = NEW.parent_id;
+    IF parent_path IS NULL THEN
+        RAISE EXCEPTION 'category % has no parent %', NEW.id, NEW.parent_id;
+    END IF;
+    IF TG_OP = 'UPDATE' AND parent_path LIKE OLD.path || '%' THEN
+        RAISE EXCEPTION 'category % cannot move under its own subtree', NEW.id;
+    END IF;
+    NEW.path := parent_path || NEW.id || '/';
+    RETURN NEW;
+END;
+$$ LANGUAGE plpgsql;
+
+CREATE FUNCTION store_category_move_subtree() RETURNS trigger AS $$
+BEGIN
+    UPDATE store_category SET path = NEW.path || substr(path, length(OLD.path) + 1)
+    WHERE path LIKE OLD.path || '_%';
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+CREATE TRIGGER store_category_set_path BEFORE INSERT OR UPDATE OF parent_id ON store_category
+    FOR EACH ROW EXECUTE FUNCTION store_category_set_path();
+CREATE TRIGGER store_category_move_subtree AFTER UPDATE OF parent_id ON store_category
+    FOR EACH ROW WHEN (OLD.path IS DISTINCT FROM NEW.path) EXECUTE FUNCTION store_category_move_subtree();
+
+-- Statement triggers (the catalog publish from 0013) fire even for no rows
+DO $$
+BEGIN
+    IF EXISTS (SELECT 1 FROM store_category) THEN
+        UPDATE store_category SET path = id || '/';
+    END IF;
+END;
+$$;
+"""
+
+REVERSE = """
+DROP TRIGGER IF EXISTS store_category_move_subtree ON store_category;
+DROP TRIGGER IF EXISTS store_category_set_path ON store_category;
+DROP FUNCTION IF EXISTS store_category_move_subtree();
+DROP FUNCTION IF EXISTS store_category_set_path();
+"""
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('store', '0014_product_filter_indexes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='category',
+            name='parent',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.PROTECT, related_name='children', to='store.category'),
+        ),
+        migrations.AddField(
+            model_name='category',
+            name='path',
+            field=models.CharField(db_default='', editable=False, max_length=255),
+        ),
+        migrations.AddIndex(
+            model_name='category',
+            index=models.Index(fields=['path'], name='category_path_idx', opclasses=['varchar_pattern_ops']),
+        ),
+        migrations.RunSQL(FORWARD, REVERSE),
+    ]
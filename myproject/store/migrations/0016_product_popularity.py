@@ -0,0 +1,26 @@
+# Generated by Django 6.0.1 on 2026-10-19 13:47
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('store', '0015_category_tree'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ProductPopularity',
+            fields=[
+                ('product', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='popularity', serialize=False, to='store.product')),
+                ('views', models.BigIntegerField(default=0)),
+                ('score', models.FloatField(default=0.0)),
+                ('scored_at', models.DateTimeField()),
+            ],
+            options={
+                'indexes': [models.Index(fields=['scored_at'], name='popularity_scored_idx'), models.Index(fields=['-views', 'product'], name='popularity_views_idx')],
+            },
+        ),
+    ]
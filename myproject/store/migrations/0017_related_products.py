@@ -0,0 +1,65 @@
+# Generated by Django 6.0.1 on 2026-10-19 13:50
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+# New order items queue store.recommendations.update_related_products on the
+# maintenance queue a minute out, unless one is already queued; the job
+# finds the new orders itself.
+
+FORWARD = """
+CREATE FUNCTION store_queue_related_products() RETURNS trigger AS $$
+BEGIN
+    INSERT INTO store_job (queue, name, kwargs, priority, status, run_at, attempts, max_attempts,
+                           last_error, locked_by, created_at)
+    SELECT 'maintenance', 'store.recommendations.update_related_products', '{}', -10, 'queued',
+           now() + interval '1 minute', 0, 5, '', '', now()
+    WHERE NOT EXISTS (
+        SELECT 1 FROM store_job WHERE status = 'queued' AND name = 'store.recommendations.update_related_products'
+    );
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+CREATE TRIGGER store_orderitem_related_products AFTER INSERT ON store_orderitem
+    FOR EACH STATEMENT EXECUTE FUNCTION store_queue_related_products();
+"""
+
+REVERSE = """
+DROP TRIGGER IF EXISTS store_orderitem_related_products ON store_orderitem;
+DROP FUNCTION IF EXISTS store_queue_related_products();
+"""
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('store', '0016_product_popularity'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='RelatedProductsRun',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('started_at', models.DateTimeField()),
+                ('incremental', models.BooleanField()),
+                ('products', models.IntegerField()),
+            ],
+        ),
+        migrations.CreateModel(
+            name='RelatedProduct',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('rank', models.SmallIntegerField()),
+                ('orders', models.IntegerField()),
+                ('confidence', models.FloatField()),
+                ('product', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='related', to='store.product')),
+                ('related', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to='store.product')),
+            ],
+            options={
+                'constraints': [models.UniqueConstraint(fields=('product', 'rank'), name='related_product_rank_uniq')],
+            },
+        ),
+        migrations.RunSQL(FORWARD, REVERSE),
+    ]
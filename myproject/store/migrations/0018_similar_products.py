@@ -0,0 +1,55 @@
+# Generated by Django 6.0.1 on 2026-10-19 13:53
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+# Product changes queue store.similarity.refresh_similar_products on the
+# maintenance queue five minutes out, unless one is already queued, so a
+# burst of edits is one refresh; the job finds the changes by sync_xid.
+
+FORWARD = """
+CREATE FUNCTION store_queue_similar_products() RETURNS trigger AS $$
+BEGIN
+    INSERT INTO store_job (queue, name, kwargs, priority, status, run_at, attempts, max_attempts,
+                           last_error, locked_by, created_at)
+    SELECT 'maintenance', 'store.similarity.refresh_similar_products', '{}', -10, 'queued',
+           now() + interval '5 minutes', 0, 5, '', '', now()
+    WHERE NOT EXISTS (
+        SELECT 1 FROM store_job WHERE status = 'queued' AND name = 'store.similarity.refresh_similar_products'
+    );
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+CREATE TRIGGER store_product_similar_products AFTER INSERT OR UPDATE OR DELETE ON store_product
+    FOR EACH STATEMENT EXECUTE FUNCTION store_queue_similar_products();
+"""
+
+REVERSE = """
+DROP TRIGGER IF EXISTS store_product_similar_products ON store_product;
+DROP FUNCTION IF EXISTS store_queue_similar_products();
+"""
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('store', '0017_related_products'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SimilarProduct',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('rank', models.SmallIntegerField()),
+                ('score', models.FloatField()),
+                ('product', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='similar', to='store.product')),
+                ('similar', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to='store.product')),
+            ],
+            options={
+                'constraints': [models.UniqueConstraint(fields=('product', 'rank'), name='similar_product_rank_uniq')],
+            },
+        ),
+        migrations.RunSQL(FORWARD, REVERSE),
+    ]
@@ -1,6 +1,11 @@
 from django.db import models
 from django.contrib.auth.models import AbstractUser
 from django.contrib.postgres.fields import ArrayField
+from django.contrib.postgres.indexes import GinIndex, OpClass
+from django.db.models import Exists, OuterRef
+from django.db.models.functions import Coalesce, Upper
+from django.utils import timezone
+from datetime import timedelta
 
 class User(AbstractUser):
     # We set phone as the unique identifier
@@ -19,6 +24,17 @@ class User(AbstractUser):
     # (username is required by AbstractUser logic, name is our custom requirement)
     REQUIRED_FIELDS = ['username', 'name'] 
 
+    class Meta(AbstractUser.Meta):
+        indexes = [
+            # Admin user directory: role filter + newest first, and
+            # substring search (icontains compares UPPER(col) LIKE UPPER(term))
+            models.Index(fields=['role', 'date_joined', 'id'], name='user_role_joined_idx'),
+            models.Index(fields=['date_joined', 'id'], name='user_joined_idx'),
+            GinIndex(OpClass(Upper('name'), name='gin_trgm_ops'), name='user_name_trgm_idx'),
+            GinIndex(OpClass(Upper('phone'), name='gin_trgm_ops'), name='user_phone_trgm_idx'),
+            GinIndex(OpClass(Upper('email'), name='gin_trgm_ops'), name='user_email_trgm_idx'),
+        ]
+
     def __str__(self):
         return self.email
     
@@ -39,6 +55,17 @@ class Category(models.Model):
     slug = models.SlugField(unique=True)
     image = models.CharField(max_length=500, null=True, blank=True)
     description = models.TextField(null=True, blank=True)
+    parent = models.ForeignKey(
+        'self', on_delete=models.PROTECT, null=True, blank=True, related_name='children',
+    )
+    # Ids from the root down, "1/4/9/"; a subtree is every path starting with
+    # its root's. Kept by trigger (migration 0015) on insert and reparenting.
+    path = models.CharField(max_length=255, db_default='', editable=False)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['path'], opclasses=['varchar_pattern_ops'], name='category_path_idx'),
+        ]
 
 class Brand(models.Model):
     name = models.CharField(max_length=255)
@@ -65,6 +92,55 @@ class Product(models.Model):
     rating_average = models.FloatField(default=0.0)
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
+    # Id of the transaction that last changed the product or its reviews, set
+    # by a trigger (migration 0012); /api/products/changes syncs on it
+    sync_xid = models.BigIntegerField(default=0, editable=False)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['sync_xid', 'id'], name='product_sync_idx'),
+            # ?spec.material=silver (jsonb @>) and ?tags=a,b (array &&)
+            GinIndex(OpClass('specifications', name='jsonb_path_ops'), name='product_spec_gin'),
+            GinIndex(fields=['tags'], name='product_tags_gin'),
+            # ?sort=: walked forwards or backwards, with the filters checked on the way.
+            # Only small scalar columns may be INCLUDEd: tags and specifications
+            # are unbounded and would push entries past the btree row size limit.
+            models.Index(
+                Coalesce('sale_price', 'price'), 'id', name='product_price_idx',
+                include=['sale_price', 'price', 'in_stock'],
+            ),
+            models.Index(fields=['rating_average', 'id'], name='product_rating_idx'),
+            models.Index(fields=['created_at', 'id'], name='product_created_idx'),
+        ]
+
+class ProductTombstone(models.Model):
+    # Deleted products, so delta-syncing clients learn about deletes
+    product_id = models.BigIntegerField(primary_key=True)
+    sync_xid = models.BigIntegerField(db_index=True)
+    deleted_at = models.DateTimeField(auto_now_add=True)
+
+class ProductListing(models.Model):
+    # Card-sized product document (names, primary image, review aggregates),
+    # already camelCased; database triggers keep it current (migration 0011)
+    product = models.OneToOneField(Product, on_delete=models.CASCADE, primary_key=True, related_name='listing')
+    document = models.JSONField()
+    updated_at = models.DateTimeField(auto_now=True)
+
+class ProductPopularity(models.Model):
+    # Product detail views, written in batches from each process's buffer
+    # (store/popularity.py). Kept off Product so counting a view does not
+    # write the product row or fire its triggers.
+    product = models.OneToOneField(Product, on_delete=models.CASCADE, primary_key=True, related_name='popularity')
+    views = models.BigIntegerField(default=0)
+    # Views decayed by POPULARITY_HALF_LIFE, as of scored_at
+    score = models.FloatField(default=0.0)
+    scored_at = models.DateTimeField()
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['scored_at'], name='popularity_scored_idx'),
+            models.Index(fields=['-views', 'product'], name='popularity_views_idx'),
+        ]
 
 class Review(models.Model):
     user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='reviews')
@@ -89,6 +165,16 @@ class Order(models.Model):
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
 
+    class Meta:
+        indexes = [
+            # Admin order listing: keyset pages on created_at, optionally by status
+            models.Index(fields=['created_at'], name='order_created_idx'),
+            models.Index(fields=['status', 'created_at'], name='order_status_created_idx'),
+            models.Index(fields=['payment_status', 'created_at'], name='order_payment_created_idx'),
+            # Order history: a user's orders newest first, without a sort
+            models.Index(fields=['user', '-created_at'], name='order_user_created_idx'),
+        ]
+
 class OrderItem(models.Model):
     order = models.ForeignKey(Order, on_delete=models.CASCADE, related_name='items')
     product = models.ForeignKey(Product, on_delete=models.SET_NULL, null=True, related_name='order_items')
@@ -97,6 +183,40 @@ class OrderItem(models.Model):
     quantity = models.IntegerField(default=1)
     image = models.CharField(max_length=500, null=True, blank=True)
 
+class RelatedProduct(models.Model):
+    # Frequently bought together: each product's most co-purchased products,
+    # rank 0 first, rebuilt from order items by store/recommendations.py
+    product = models.ForeignKey(Product, on_delete=models.CASCADE, related_name='related')
+    related = models.ForeignKey(Product, on_delete=models.CASCADE, related_name='+')
+    rank = models.SmallIntegerField()
+    orders = models.IntegerField()  # orders containing both
+    confidence = models.FloatField()  # share of the product's orders that have `related` too
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['product', 'rank'], name='related_product_rank_uniq'),
+        ]
+
+class SimilarProduct(models.Model):
+    # Products most alike in tags, specifications, words, category and brand,
+    # rank 0 first; found offline by store/similarity.py
+    product = models.ForeignKey(Product, on_delete=models.CASCADE, related_name='similar')
+    similar = models.ForeignKey(Product, on_delete=models.CASCADE, related_name='+')
+    rank = models.SmallIntegerField()
+    score = models.FloatField()  # cosine similarity of the TF-IDF vectors
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['product', 'rank'], name='similar_product_rank_uniq'),
+        ]
+
+class RelatedProductsRun(models.Model):
+    # One rebuild of RelatedProduct; an incremental run picks up the orders
+    # created since the previous run started
+    started_at = models.DateTimeField()
+    incremental = models.BooleanField()
+    products = models.IntegerField()  # products whose lists were rebuilt
+
 class Notification(models.Model):
     user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='notifications')
     title = models.CharField(max_length=255)
@@ -105,6 +225,109 @@ class Notification(models.Model):
     is_read = models.BooleanField(default=False)
     created_at = models.DateTimeField(auto_now_add=True)
 
+    class Meta:
+        indexes = [
+            # Inbox listing, unread counts and "since" polling for one user
+            models.Index(fields=['user', 'is_read', 'created_at'], name='notif_user_read_created_idx'),
+            # Retention purge: oldest read notifications of one type
+            models.Index(fields=['type', 'created_at'], condition=models.Q(is_read=True),
+                         name='notif_read_type_created_idx'),
+        ]
+
+class NotificationArchive(models.Model):
+    # Read notifications moved out by `manage.py purge_notifications --archive`; keeps the original id
+    id = models.BigIntegerField(primary_key=True)
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='+')
+    title = models.CharField(max_length=255)
+    message = models.TextField()
+    type = models.CharField(max_length=50)
+    created_at = models.DateTimeField()
+    archived_at = models.DateTimeField(auto_now_add=True)
+
+class Broadcast(models.Model):
+    SEGMENTS = [
+        ('all', 'All users'),
+        ('customers', 'Placed an order'),
+        ('prospects', 'Never ordered'),
+        ('new', 'Joined in the last 30 days'),
+    ]
+    STATUSES = [
+        ('pending', 'Pending'),
+        ('running', 'Running'),
+        ('done', 'Done'),
+        ('failed', 'Failed'),
+    ]
+
+    title = models.CharField(max_length=255)
+    message = models.TextField()
+    type = models.CharField(max_length=50, default="promotion")
+    # Blank role means every role
+    role = models.CharField(max_length=20, blank=True)
+    segment = models.CharField(max_length=20, choices=SEGMENTS, default='all')
+
+    # Progress, written after every chunk; last_user_id is where a resumed send picks up
+    status = models.CharField(max_length=20, choices=STATUSES, default='pending')
+    total = models.IntegerField(null=True, blank=True)
+    sent = models.IntegerField(default=0)
+    last_user_id = models.BigIntegerField(default=0)
+    error = models.TextField(blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    started_at = models.DateTimeField(null=True, blank=True)
+    finished_at = models.DateTimeField(null=True, blank=True)
+
+    def recipients(self):
+        users = User.objects.filter(is_active=True)
+        if self.role:
+            users = users.filter(role=self.role)
+        has_orders = Exists(Order.objects.filter(user=OuterRef('pk')))
+        if self.segment == 'customers':
+            users = users.filter(has_orders)
+        elif self.segment == 'prospects':
+            users = users.filter(~has_orders)
+        elif self.segment == 'new':
+            users = users.filter(date_joined__gte=timezone.now() - timedelta(days=30))
+        return users
+
+    def __str__(self):
+        return self.title
+
+class Job(models.Model):
+    STATUSES = [
+        ('queued', 'Queued'),
+        ('running', 'Running'),
+        ('done', 'Done'),
+        ('failed', 'Failed'),
+    ]
+
+    queue = models.CharField(max_length=50, default='default')
+    # Dotted path of a function decorated with store.jobs.task
+    name = models.CharField(max_length=255)
+    kwargs = models.JSONField(default=dict, blank=True)
+    # Higher runs first; defaults to the queue's priority in settings.JOB_QUEUE_PRIORITIES
+    priority = models.IntegerField(default=0)
+    status = models.CharField(max_length=20, choices=STATUSES, default='queued')
+    run_at = models.DateTimeField(default=timezone.now)
+    attempts = models.IntegerField(default=0)
+    max_attempts = models.IntegerField(default=5)
+    last_error = models.TextField(blank=True)
+    locked_by = models.CharField(max_length=100, blank=True)
+    locked_at = models.DateTimeField(null=True, blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    finished_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        indexes = [
+            # Claiming: the most urgent runnable job, skipping locked ones
+            models.Index(fields=['-priority', 'run_at', 'id'], condition=models.Q(status='queued'),
+                         name='job_queued_idx'),
+            # Housekeeping: running jobs whose worker died, finished jobs to prune
+            models.Index(fields=['locked_at'], condition=models.Q(status='running'), name='job_running_idx'),
+            models.Index(fields=['finished_at'], condition=models.Q(status='done'), name='job_done_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.name} #{self.id}"
+
 class HeroSlide(models.Model):
     id = models.IntegerField(primary_key=True)
     title = models.CharField(max_length=255)
@@ -0,0 +1,77 @@
+from django.db import connection, transaction
+from rest_framework.exceptions import ValidationError
+
+from .models import Notification, Order
+
+# Status changes an order may make; anything else is rejected
+ORDER_TRANSITIONS = {
+    'pending': {'processing', 'cancelled'},
+    'processing': {'shipped', 'cancelled'},
+    'shipped': {'delivered'},
+    'delivered': set(),
+    'cancelled': set(),
+}
+
+# Same wording as the storefront uses for a single order
+STATUS_MESSAGES = {
+    'processing': 'is now being processed',
+    'shipped': 'has been shipped',
+    'delivered': 'has been delivered',
+    'cancelled': 'has been cancelled',
+}
+
+MAX_BULK_ORDERS = 10000
+
+
+def transition_orders(order_ids, status, tracking_numbers=None):
+    """Move every order in `order_ids` to `status` and notify each customer.
+
+    All or nothing: the orders are locked and checked against
+    ORDER_TRANSITIONS first, then changed with a single UPDATE and announced
+    with a single bulk_create. `tracking_numbers` maps order id to number;
+    orders without one keep theirs. Returns the number of orders changed.
+    """
+    if status not in STATUS_MESSAGES:
+        raise ValidationError({'status': f'Unknown status "{status}".'})
+    order_ids = sorted(set(order_ids))
+    if len(order_ids) > MAX_BULK_ORDERS:
+        raise ValidationError({'ids': f'At most {MAX_BULK_ORDERS} orders at a time.'})
+    tracking_numbers = tracking_numbers or {}
+    unknown = set(tracking_numbers) - set(order_ids)
+    if unknown:
+        raise ValidationError({'tracking_numbers': f'Not in ids: {sorted(unknown)[:20]}'})
+
+    with transaction.atomic():
+        orders = list(
+            Order.objects.select_for_update().filter(id__in=order_ids).order_by('id')
+            .values_list('id', 'user_id', 'status')
+        )
+        missing = set(order_ids) - {order_id for order_id, _, _ in orders}
+        if missing:
+            raise ValidationError({'ids': f'No such orders: {sorted(missing)[:20]}'})
+        invalid = [
+            f'#{order_id} {current} -> {status}' for order_id, _, current in orders
+            if status not in ORDER_TRANSITIONS.get(current, ())
+        ]
+        if invalid:
+            raise ValidationError({'status': ['Not allowed: ' + ', '.join(invalid[:20])]})
+        if not orders:
+            return 0
+
+        with connection.cursor() as cursor:
+            cursor.execute(f"""
+                UPDATE {Order._meta.db_table} o
+                SET status = %s, updated_at = now(),
+                    tracking_number = coalesce(v.tracking_number, o.tracking_number)
+                FROM unnest(%s::bigint[], %s::varchar[]) AS v(id, tracking_number)
+                WHERE o.id = v.id
+            """, [status, order_ids, [tracking_numbers.get(order_id) for order_id in order_ids]])
+
+        Notification.objects.bulk_create(
+            Notification(
+                user_id=user_id, title='Order Update', type='order',
+                message=f'Your order #{order_id} {STATUS_MESSAGES[status]}.',
+            )
+            for order_id, user_id, _ in orders
+        )
+    return len(orders)
@@ -1,4 +1,4 @@
-from rest_framework.pagination import LimitOffsetPagination
+from rest_framework.pagination import CursorPagination, LimitOffsetPagination
 from rest_framework.response import Response
 
 class SkipLimitPagination(LimitOffsetPagination):
@@ -6,7 +6,39 @@ class SkipLimitPagination(LimitOffsetPagination):
     limit_query_param = 'limit'
     offset_query_param = 'skip'
 
+    def paginate_queryset(self, queryset, request, view=None):
+        # Same as LimitOffsetPagination, minus the COUNT(*) we never send back
+        self.request = request
+        self.limit = self.get_limit(request)
+        if self.limit is None:
+            return None
+        self.offset = self.get_offset(request)
+        return list(queryset[self.offset:self.offset + self.limit])
+
     def get_paginated_response(self, data):
         # CRITICAL FIX: Return the raw list 'data' instead of 
         # the default dictionary { count: x, results: data }
-        return Response(data)
\ No newline at end of file
+        return Response(data)
+
+
+class KeysetPagination(CursorPagination):
+    # Keyset (cursor) pagination: every page is an indexed range scan, so page
+    # 10,000 costs the same as page 1. The body stays a raw list like
+    # SkipLimitPagination; the next/prev page URLs go in the Link header.
+    page_size = 50
+    page_size_query_param = 'limit'
+    max_page_size = 500
+    ordering = ('-created_at', '-id')
+
+    def get_paginated_response(self, data):
+        links = [
+            f'<{url}>; rel="{rel}"'
+            for rel, url in (('next', self.get_next_link()), ('prev', self.get_previous_link()))
+            if url
+        ]
+        headers = {'Link': ', '.join(links)} if links else None
+        return Response(data, headers=headers)
+
+
+class UserKeysetPagination(KeysetPagination):
+    ordering = ('-date_joined', '-id')
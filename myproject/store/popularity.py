@@ -0,0 +1,117 @@
+import logging
+import threading
+import time
+from collections import Counter
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import connection
+
+logger = logging.getLogger(__name__)
+
+# Views per slug in, counters and decayed scores out. One statement for the
+# whole batch; slugs that no longer exist drop out in the join.
+FLUSH_SQL = """
+    INSERT INTO store_productpopularity (product_id, views, score, scored_at)
+    SELECT p.id, v.views, v.views, now()
+    FROM (VALUES {values}) AS v(slug, views)
+    JOIN store_product p ON p.slug = v.slug
+    ON CONFLICT (product_id) DO UPDATE SET
+        views = store_productpopularity.views + EXCLUDED.views,
+        score = store_productpopularity.score
+                * power(0.5, extract(epoch FROM EXCLUDED.scored_at - store_productpopularity.scored_at) / %s)
+                + EXCLUDED.views,
+        scored_at = EXCLUDED.scored_at
+"""
+
+RANKINGS = {
+    # Decayed to now; products not viewed within TRENDING_WINDOW are left out
+    'trending': """
+        WHERE s.scored_at >= now() - make_interval(secs => %(window)s)
+        ORDER BY s.score * power(0.5, extract(epoch FROM now() - s.scored_at) / %(half_life)s) DESC, s.product_id
+    """,
+    'views': "ORDER BY s.views DESC, s.product_id",
+}
+
+POPULAR_SQL = """
+    SELECT l.document::text
+    FROM store_productpopularity s
+    JOIN store_productlisting l ON l.product_id = s.product_id
+    {ranking}
+    LIMIT %(limit)s
+"""
+
+
+class ViewCounter:
+    """Product detail views counted in memory, written every VIEW_FLUSH_SECONDS.
+
+    A view costs a dict increment; a background thread, started by the
+    first view, moves the counts to ProductPopularity in one statement per
+    interval. A flush that fails puts its counts back for the next one;
+    counts not yet flushed when the process exits are lost.
+    VIEW_FLUSH_SECONDS = 0 stops the thread's flushes; flush() still works.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.pending = Counter()  # slug -> views since the last flush
+        self.thread = None
+
+    def record(self, slug):
+        with self.lock:
+            self.pending[slug] += 1
+            if self.thread is None and settings.VIEW_FLUSH_SECONDS:
+                self.thread = threading.Thread(target=self.run, name='view-counter', daemon=True)
+                self.thread.start()
+
+    def run(self):
+        while True:
+            time.sleep(settings.VIEW_FLUSH_SECONDS or 1)
+            if settings.VIEW_FLUSH_SECONDS:
+                try:
+                    self.flush()
+                except Exception:
+                    logger.exception("View counts not flushed; retrying in %ss", settings.VIEW_FLUSH_SECONDS)
+                finally:
+                    connection.close()
+
+    def flush(self):
+        """Write the pending counts now; returns how many slugs were written.
+
+        On failure the counts go back into `pending` and the error is raised.
+        """
+        with self.lock:
+            batch, self.pending = self.pending, Counter()
+        if not batch:
+            return 0
+        values = ', '.join(['(%s, %s::bigint)'] * len(batch))
+        params = [value for item in batch.items() for value in item]
+        try:
+            with connection.cursor() as cursor:
+                cursor.execute(FLUSH_SQL.format(values=values), [*params, settings.POPULARITY_HALF_LIFE])
+        except Exception:
+            with self.lock:
+                self.pending.update(batch)
+            raise
+        return len(batch)
+
+    def clear(self):
+        with self.lock:
+            self.pending.clear()
+
+
+view_counter = ViewCounter()
+
+
+def popular_products(ranking, limit):
+    """The top `limit` product cards (listing documents) as a JSON array, cached briefly."""
+    key = f'popular:{ranking}:{limit}'
+    body = cache.get(key)
+    if body is None:
+        with connection.cursor() as cursor:
+            cursor.execute(POPULAR_SQL.format(ranking=RANKINGS[ranking]), {
+                'window': settings.TRENDING_WINDOW, 'half_life': settings.POPULARITY_HALF_LIFE, 'limit': limit,
+            })
+            body = f"[{','.join(document for document, in cursor.fetchall())}]"
+        cache.set(key, body, settings.TRENDING_CACHE_SECONDS)
+    return body
@@ -0,0 +1,146 @@
+import os
+import threading
+import time
+from collections import Counter, OrderedDict
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from .models import Product, Review
+
+
+class Flight:
+    # One load in progress; requests for the same key wait on it
+    def __init__(self):
+        self.done = threading.Event()
+        self.body = None
+        self.error = None
+
+
+class ProductDetailCache:
+    """Rendered product detail bodies by slug, per process.
+
+    An entry is served as-is for PRODUCT_CACHE_FRESH seconds. For
+    PRODUCT_CACHE_STALE seconds after that, the first request to see it
+    reloads it while everyone else keeps getting the old body. Concurrent
+    misses for one slug share a single load. Saves and deletes of products
+    and reviews drop the product's entries; changes that bypass signals
+    (queryset.update(), raw SQL) show up once the entry goes stale.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.entries = OrderedDict()  # slug -> (body, product id, stored at), least recent first
+        self.slugs = {}  # product id -> slugs cached for it
+        self.flights = {}  # slug -> Flight
+        self.generation = 0  # bumped by every invalidation
+        self.stats = Counter()
+
+    def get(self, slug, load):
+        """Return (body, how) for `slug`; `load()` returns (product id, body) and may raise.
+
+        `how` is HIT, STALE, MISS, REFRESH or COALESCED.
+        """
+        if not settings.PRODUCT_CACHE_SIZE:
+            return load()[1], 'MISS'
+        now = time.monotonic()
+        with self.lock:
+            entry = self.entries.get(slug)
+            if entry is not None:
+                age = now - entry[2]
+                if age < settings.PRODUCT_CACHE_FRESH:
+                    self.stats['hits'] += 1
+                    self.entries.move_to_end(slug)
+                    return entry[0], 'HIT'
+                if age < settings.PRODUCT_CACHE_FRESH + settings.PRODUCT_CACHE_STALE and slug in self.flights:
+                    self.stats['stale'] += 1
+                    return entry[0], 'STALE'
+            flight = self.flights.get(slug)
+            leader = flight is None
+            if leader:
+                flight = self.flights[slug] = Flight()
+                generation = self.generation
+
+        if not leader:
+            flight.done.wait()
+            if flight.error is not None:
+                raise flight.error
+            with self.lock:
+                self.stats['coalesced'] += 1
+            return flight.body, 'COALESCED'
+
+        how = 'MISS' if entry is None else 'REFRESH'
+        try:
+            product_id, flight.body = load()
+        except Exception as error:
+            flight.error = error
+            raise
+        else:
+            with self.lock:
+                # A change during the load may not be in what it read
+                if self.generation == generation:
+                    self.store(slug, product_id, flight.body, now)
+        finally:
+            with self.lock:
+                del self.flights[slug]
+                self.stats['misses' if how == 'MISS' else 'refreshes'] += 1
+            flight.done.set()
+        return flight.body, how
+
+    def store(self, slug, product_id, body, now):
+        self.drop(slug)
+        self.entries[slug] = (body, product_id, now)
+        self.slugs.setdefault(product_id, set()).add(slug)
+        while len(self.entries) > settings.PRODUCT_CACHE_SIZE:
+            self.drop(next(iter(self.entries)))
+
+    def drop(self, slug):
+        entry = self.entries.pop(slug, None)
+        if entry is not None:
+            slugs = self.slugs.get(entry[1], set())
+            slugs.discard(slug)
+            if not slugs:
+                self.slugs.pop(entry[1], None)
+
+    def invalidate(self, product_id):
+        with self.lock:
+            self.generation += 1
+            self.stats['invalidations'] += 1
+            for slug in self.slugs.pop(product_id, set()):
+                self.entries.pop(slug, None)
+
+    def clear(self):
+        with self.lock:
+            self.generation += 1
+            self.entries.clear()
+            self.slugs.clear()
+
+    def counters(self):
+        with self.lock:
+            return {
+                'pid': os.getpid(), 'entries': len(self.entries),
+                **{name: self.stats[name] for name in
+                   ('hits', 'stale', 'misses', 'refreshes', 'coalesced', 'invalidations')},
+            }
+
+
+product_details = ProductDetailCache()
+
+
+def invalidate_product(product_id):
+    # Now, and again at commit: a request between the two could otherwise
+    # cache what it read before the change was visible
+    product_details.invalidate(product_id)
+    transaction.on_commit(lambda: product_details.invalidate(product_id))
+
+
+@receiver([post_save, post_delete], sender=Product)
+def product_changed(sender, instance, **kwargs):
+    invalidate_product(instance.id)
+
+
+@receiver([post_save, post_delete], sender=Review)
+def review_changed(sender, instance, **kwargs):
+    invalidate_product(instance.product_id)
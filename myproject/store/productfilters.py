@@ -0,0 +1,174 @@
+import math
+import re
+from functools import reduce
+from operator import or_
+
+from django.contrib.postgres.fields import ArrayField
+from django.db.models import BigIntegerField, F, Func, Q, Value
+from django.db.models.functions import Coalesce
+from rest_framework.exceptions import ValidationError
+
+from .categories import category_paths
+
+# Facets counted by /api/products/facets; each one's counts ignore its own
+# filter, so picking a category still shows what the other categories hold
+FACETS = ['category', 'brand', 'tags', 'in_stock', 'price']
+
+SPEC_KEY = re.compile(r'[A-Za-z0-9_]+')
+
+# ?sort= values and the ordering each one means; `id` breaks ties so pages
+# never overlap, in the sort's direction so an index can be read backwards.
+# "price" is what the customer pays: the sale price if set.
+SORTS = {
+    'id': ['id'],
+    'price': ['effective_price', 'id'],
+    '-price': ['-effective_price', '-id'],
+    'rating': ['rating_average', 'id'],
+    '-rating': ['-rating_average', '-id'],
+    'newest': ['-created_at', '-id'],
+}
+
+
+def id_list(params, name):
+    values = params[name].split(',')
+    if not all(value.isdigit() for value in values):
+        raise ValidationError({name: 'Expected comma-separated ids.'})
+    return [int(value) for value in values]
+
+
+def number(params, name):
+    try:
+        value = float(params[name])
+    except ValueError:
+        value = math.nan
+    if not math.isfinite(value):
+        raise ValidationError({name: 'Must be a number.'})
+    return value
+
+
+class ProductFilters:
+    """The catalog filters of a product list request.
+
+    ?category=1,2&brand=3&min_price=10&max_price=99.5&in_stock=true
+    &min_rating=4&tags=silver,gift&spec.material=silver,gold&sort=-price.
+    Lists match any of their values; different filters all have to match.
+    A category matches products anywhere in its subtree.
+    Applied either in SQL (apply()) or by the in-memory engine
+    (store/catalogengine.py), which leaves spec filters to SQL.
+    """
+
+    def __init__(self, categories=None, brands=None, min_price=None, max_price=None,
+                 in_stock=None, min_rating=None, tags=None, specs=None, sort='id'):
+        self.categories = categories
+        self.brands = brands
+        self.min_price = min_price
+        self.max_price = max_price
+        self.in_stock = in_stock
+        self.min_rating = min_rating
+        self.tags = tags
+        self.specs = specs  # specification key -> accepted string values
+        self.sort = sort
+        self._paths = None
+
+    @classmethod
+    def from_params(cls, params):
+        filters = cls()
+        if params.get('category'):
+            filters.categories = id_list(params, 'category')
+        if params.get('brand'):
+            filters.brands = id_list(params, 'brand')
+        for name in ('min_price', 'max_price', 'min_rating'):
+            if params.get(name):
+                setattr(filters, name, number(params, name))
+        if params.get('in_stock'):
+            if params['in_stock'] not in ('true', 'false'):
+                raise ValidationError({'in_stock': 'Must be true or false.'})
+            filters.in_stock = params['in_stock'] == 'true'
+        if params.get('tags'):
+            filters.tags = params['tags'].split(',')
+        for name in params:
+            if name.startswith('spec.'):
+                key = name[len('spec.'):]
+                if not SPEC_KEY.fullmatch(key) or not params[name]:
+                    raise ValidationError({name: 'Expected spec.<key>=value[,value...].'})
+                filters.specs = filters.specs or {}
+                filters.specs[key] = params[name].split(',')
+        if params.get('sort'):
+            if params['sort'] not in SORTS:
+                raise ValidationError({'sort': f'One of: {", ".join(SORTS)}.'})
+            filters.sort = params['sort']
+        return filters
+
+    def category_paths(self):
+        # Looked up once per request, however many facets call q()
+        if self._paths is None:
+            self._paths = category_paths(self.categories)
+        return self._paths
+
+    def q(self, prefix='', exclude=None):
+        """The filters as a Q; `exclude` leaves out one of FACETS (for that facet's counts).
+
+        Price filters refer to the effective_price annotation apply() adds.
+        """
+        lookups = {}
+        paths = []
+        if self.categories is not None and exclude != 'category':
+            # A category matches its whole subtree: one prefix scan of the path index
+            paths = self.category_paths()
+            if not paths:
+                lookups[prefix + 'category_id__in'] = self.categories  # none exist; matches nothing
+        if self.brands is not None and exclude != 'brand':
+            lookups[prefix + 'brand_id__in'] = self.brands
+        if self.in_stock is not None and exclude != 'in_stock':
+            lookups[prefix + 'in_stock'] = self.in_stock
+        if self.min_rating is not None:
+            lookups[prefix + 'rating_average__gte'] = self.min_rating
+        if self.tags is not None and exclude != 'tags':
+            lookups[prefix + 'tags__overlap'] = self.tags
+        if self.min_price is not None and exclude != 'price':
+            lookups['effective_price__gte'] = self.min_price
+        if self.max_price is not None and exclude != 'price':
+            lookups['effective_price__lte'] = self.max_price
+        q = Q(**lookups)
+        if paths:
+            q &= reduce(or_, (Q(**{prefix + 'category__path__startswith': path}) for path in paths))
+        if self.specs is not None:
+            # Single values share one containment check: specifications @> '{"a": "x", "b": "y"}'
+            single = {key: values[0] for key, values in self.specs.items() if len(values) == 1}
+            if single:
+                q &= Q(**{prefix + 'specifications__contains': single})
+            for key, values in self.specs.items():
+                if len(values) > 1:
+                    q &= reduce(or_, (Q(**{prefix + 'specifications__contains': {key: value}}) for value in values))
+        return q
+
+    def apply(self, queryset, prefix=''):
+        """Filter and order `queryset`; `prefix` reaches Product from a related model."""
+        queryset = queryset.annotate(
+            effective_price=Coalesce(f'{prefix}sale_price', f'{prefix}price'),
+        ).filter(self.q(prefix))
+        ordering = []
+        for name in SORTS[self.sort]:
+            field = name.lstrip('-')
+            if field != 'effective_price':
+                field = prefix + field
+            ordering.append(f"{'-' if name.startswith('-') else ''}{field}")
+        return queryset.order_by(*ordering)
+
+    def key(self):
+        """The filters in a canonical form (sort left out), for cache keys."""
+        return repr([
+            sorted(set(self.categories)) if self.categories is not None else None,
+            sorted(set(self.brands)) if self.brands is not None else None,
+            self.min_price, self.max_price, self.in_stock, self.min_rating,
+            sorted(set(self.tags)) if self.tags is not None else None,
+            sorted((key, sorted(set(values))) for key, values in (self.specs or {}).items()),
+        ])
+
+
+def in_id_order(queryset, ids, field='id'):
+    """`queryset` limited to `ids`, in the order they are listed."""
+    position = Func(
+        Value(list(ids), output_field=ArrayField(BigIntegerField())), F(field), function='array_position',
+    )
+    return queryset.filter(**{f'{field}__in': ids}).order_by(position)
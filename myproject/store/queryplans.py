@@ -0,0 +1,111 @@
+import json
+from urllib.parse import urlsplit
+
+from django.db import connection
+from django.test import RequestFactory, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import resolve
+from rest_framework.test import force_authenticate
+
+# Endpoints whose queries have to stay on indexes however large the tables get.
+# Each url is built from a dataset exposing `.user` and `.product`, and is
+# requested as `.user`.
+KEY_ENDPOINTS = [
+    ('product-detail', lambda d: f'/api/products/{d.product.slug}'),
+    ('products', lambda d: '/api/products'),
+    ('product-cards', lambda d: '/api/products?view=card&skip=5000'),
+    ('products-in-category', lambda d: f'/api/products?category={d.product.category_id}&sort=-price'),
+    ('product-changes', lambda d: '/api/products/changes?since=1&limit=500'),
+    ('orders', lambda d: '/api/orders'),
+    ('orders-by-status', lambda d: '/api/orders?status=shipped'),
+    ('orders-by-payment', lambda d: '/api/orders?payment_status=paid&created_after=2020-01-01'),
+    ('user-orders', lambda d: f'/api/orders/user/{d.user.id}'),
+    ('user-orders-summary', lambda d: f'/api/orders/user/{d.user.id}?view=summary'),
+    ('notifications', lambda d: f'/api/notifications/{d.user.id}'),
+    ('notifications-unread', lambda d: f'/api/notifications/{d.user.id}?unread=true'),
+    ('notifications-since', lambda d: f'/api/notifications/{d.user.id}?since={d.user.id * 10}'),
+    ('notifications-unread-count', lambda d: f'/api/notifications/{d.user.id}/unread-count'),
+    ('users', lambda d: '/api/users'),
+    ('users-search', lambda d: f'/api/users?search={d.user.email}'),
+    ('users-by-role', lambda d: '/api/users?role=admin'),
+]
+
+# Nodes that read their whole input before returning a row, so a Limit above
+# them does not stop the scan below them early.
+BLOCKING_NODES = {'Sort', 'Aggregate', 'Hash', 'Materialize', 'WindowAgg', 'SetOp'}
+
+
+def capture_sql(path, user=None):
+    """Run the view behind `path` as `user` and return the SELECTs it issued."""
+    match = resolve(urlsplit(path).path)
+    request = RequestFactory().get(path)
+    if user is not None:
+        force_authenticate(request, user=user)
+    # Response caches would hide the queries being checked
+    with override_settings(PRODUCT_CACHE_SIZE=0), CaptureQueriesContext(connection) as ctx:
+        response = match.func(request, *match.args, **match.kwargs)
+        if hasattr(response, 'render'):
+            response.render()
+    # A refused request runs none of the queries being checked
+    if response.status_code >= 400:
+        raise ValueError(f'{path} answered {response.status_code}; its queries cannot be checked')
+    return [
+        query['sql'] for query in ctx.captured_queries
+        if query['sql'].lstrip().upper().startswith('SELECT')
+    ]
+
+
+def table_sizes():
+    with connection.cursor() as cursor:
+        cursor.execute("""
+            SELECT c.relname, c.reltuples FROM pg_class c
+            JOIN pg_namespace n ON n.oid = c.relnamespace
+            WHERE c.relkind IN ('r', 'p') AND n.nspname = current_schema()
+        """)
+        return dict(cursor.fetchall())
+
+
+def explain(sql, analyze=True):
+    options = 'ANALYZE, BUFFERS, FORMAT JSON' if analyze else 'FORMAT JSON'
+    with connection.cursor() as cursor:
+        cursor.execute(f'EXPLAIN ({options}) {sql}')
+        plan = cursor.fetchone()[0]
+    if isinstance(plan, str):
+        plan = json.loads(plan)
+    return plan[0]['Plan']
+
+
+def find_problems(plan, sizes, threshold):
+    """Sequential scans over tables above `threshold` rows, and sorts that spilled to disk.
+
+    A plain Seq Scan directly under a Limit is allowed: it stops after the
+    first page and does not grow with the table.
+    """
+    problems = []
+
+    def walk(node, under_limit):
+        kind = node['Node Type']
+        relation = node.get('Relation Name')
+        if kind == 'Seq Scan' and sizes.get(relation, 0) >= threshold:
+            if 'Filter' in node or not under_limit:
+                detail = f" filtering {node['Filter'][:120]}" if 'Filter' in node else ''
+                problems.append(f'Seq Scan on {relation} (~{int(sizes[relation])} rows){detail}')
+        if kind == 'Sort' and node.get('Sort Space Type') == 'Disk':
+            problems.append(
+                f"Sort on {', '.join(node.get('Sort Key', []))} spilled "
+                f"{node.get('Sort Space Used')} kB to disk"
+            )
+        under_limit = kind == 'Limit' or (under_limit and kind not in BLOCKING_NODES)
+        for child in node.get('Plans', []):
+            walk(child, under_limit)
+
+    walk(plan, False)
+    return problems
+
+
+def check_endpoints(data, threshold, analyze=True, endpoints=KEY_ENDPOINTS):
+    """Yield (endpoint, sql, problems) for every SELECT the key endpoints run, as `data.user`."""
+    sizes = table_sizes()
+    for name, url in endpoints:
+        for sql in capture_sql(url(data), data.user):
+            yield name, sql, find_problems(explain(sql, analyze), sizes, threshold)
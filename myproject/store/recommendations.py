@@ -0,0 +1,122 @@
+from datetime import timedelta
+
+import numpy as np
+from django.conf import settings
+from django.db import connection, transaction
+from django.utils import timezone
+from scipy import sparse
+
+from .jobs import task
+from .models import RelatedProduct, RelatedProductsRun
+
+# (order, product) for every item of a non-cancelled order
+BASKETS_SQL = """
+    SELECT oi.order_id, oi.product_id
+    FROM store_orderitem oi
+    JOIN store_order o ON o.id = oi.order_id
+    WHERE o.status <> 'cancelled' AND oi.product_id IS NOT NULL
+"""
+
+# Products in orders created since a time; their lists are the ones that change
+TOUCHED_SQL = """
+    SELECT DISTINCT oi.product_id
+    FROM store_orderitem oi
+    JOIN store_order o ON o.id = oi.order_id
+    WHERE o.created_at >= %s AND oi.product_id IS NOT NULL
+"""
+
+
+def basket_matrix(pairs):
+    """Orders x products 0/1 matrix of (order id, product id) pairs, and the product id of each column."""
+    pairs = np.array(pairs, dtype=np.int64).reshape(-1, 2)
+    order_ids, rows = np.unique(pairs[:, 0], return_inverse=True)
+    product_ids, columns = np.unique(pairs[:, 1], return_inverse=True)
+    baskets = sparse.csr_array(
+        (np.ones(len(pairs), dtype=np.int32), (rows, columns)), shape=(len(order_ids), len(product_ids)),
+    )
+    baskets.sum_duplicates()
+    baskets.data[:] = 1  # the same product twice in one order counts once
+    return baskets, product_ids
+
+
+def top_related(baskets, product_ids, columns, k, min_orders):
+    """The top-k co-purchased products of the products at `columns`.
+
+    Co-occurrence counts are one sparse product: (baskets[:, columns]^T
+    baskets)[i, j] is how many orders hold both product i and j. Within
+    a row, most orders first, then lowest id. Returns parallel arrays:
+    product id, related id, rank, orders, confidence.
+    """
+    counts = np.asarray(baskets.sum(axis=0)).ravel()  # orders per product
+    together = (baskets.tocsc()[:, columns].T @ baskets).tocoo()
+    row, column, orders = together.row, together.col, together.data
+    keep = (columns[row] != column) & (orders >= min_orders)
+    row, column, orders = row[keep], column[keep], orders[keep]
+    order = np.lexsort((product_ids[column], -orders, row))
+    row, column, orders = row[order], column[order], orders[order]
+    rank = np.arange(len(row)) - np.searchsorted(row, row, side='left')
+    keep = rank < k
+    row, column, orders, rank = row[keep], column[keep], orders[keep], rank[keep]
+    products = columns[row]
+    return product_ids[products], product_ids[column], rank, orders, orders / counts[products]
+
+
+def write_related(products, result):
+    """Replace the lists of `products` (None: every product) with `result`."""
+    with transaction.atomic():
+        rows = RelatedProduct.objects.all() if products is None else RelatedProduct.objects.filter(
+            product_id__in=list(products),
+        )
+        rows.delete()
+        RelatedProduct.objects.bulk_create(
+            (
+                RelatedProduct(product_id=product, related_id=related, rank=rank, orders=orders, confidence=confidence)
+                for product, related, rank, orders, confidence in zip(*(values.tolist() for values in result))
+            ),
+            batch_size=5000,
+        )
+
+
+@task(queue='maintenance')
+def build_related_products():
+    """Rebuild every product's frequently-bought-together list from all orders."""
+    started_at = timezone.now()
+    with connection.cursor() as cursor:
+        cursor.execute(BASKETS_SQL)
+        baskets, product_ids = basket_matrix(cursor.fetchall())
+    columns = np.arange(len(product_ids))
+    write_related(None, top_related(
+        baskets, product_ids, columns, settings.RELATED_PRODUCTS_K, settings.RELATED_MIN_ORDERS,
+    ))
+    return RelatedProductsRun.objects.create(started_at=started_at, incremental=False, products=len(product_ids))
+
+
+@task(queue='maintenance')
+def update_related_products():
+    """Rebuild the lists of the products bought since the previous run.
+
+    Only rows of products in new orders change, so those are recomputed in
+    full from every order that holds any of them; nothing is added to
+    stale counts. Orders are taken from RELATED_OVERLAP seconds before the
+    previous run, for transactions that were still open then; redoing a
+    product gives the same list. Cancellations show at the next full build.
+    Queued by a trigger on new order items (migration 0017).
+    """
+    previous = RelatedProductsRun.objects.order_by('-started_at').first()
+    if previous is None:
+        return build_related_products()
+    started_at = timezone.now()
+    with connection.cursor() as cursor:
+        cursor.execute(TOUCHED_SQL, [previous.started_at - timedelta(seconds=settings.RELATED_OVERLAP)])
+        touched = [product_id for product_id, in cursor.fetchall()]
+        cursor.execute(
+            BASKETS_SQL + " AND oi.order_id IN (SELECT order_id FROM store_orderitem WHERE product_id = ANY(%s))",
+            [touched],
+        )
+        baskets, product_ids = basket_matrix(cursor.fetchall())
+    # Touched products whose orders were all cancelled keep no column, and no list
+    columns = np.flatnonzero(np.isin(product_ids, touched))
+    write_related(touched, top_related(
+        baskets, product_ids, columns, settings.RELATED_PRODUCTS_K, settings.RELATED_MIN_ORDERS,
+    ))
+    return RelatedProductsRun.objects.create(started_at=started_at, incremental=True, products=len(touched))
@@ -16,7 +16,7 @@ class UserSerializer(serializers.ModelSerializer):
 class CategorySerializer(serializers.ModelSerializer):
     class Meta:
         model = Category
-        fields = ['id', 'name', 'slug', 'image', 'description']
+        fields = ['id', 'name', 'slug', 'image', 'description', 'parent_id']
 
 class BrandSerializer(serializers.ModelSerializer):
     class Meta:
@@ -56,6 +56,13 @@ class OrderSerializer(serializers.ModelSerializer):
             'discount', 'total', 'tracking_number', 'created_at', 'updated_at'
         ]
 
+class OrderSummarySerializer(serializers.ModelSerializer):
+    item_count = serializers.IntegerField(read_only=True)
+
+    class Meta:
+        model = Order
+        fields = ['id', 'status', 'total', 'item_count', 'created_at']
+
 class NotificationSerializer(serializers.ModelSerializer):
     class Meta:
         model = Notification
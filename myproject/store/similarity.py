@@ -0,0 +1,333 @@
+import io
+import logging
+import multiprocessing
+import os
+import re
+import zlib
+from collections import deque
+
+import numpy as np
+from django.conf import settings
+from django.db import connection, transaction
+from scipy import sparse
+
+from .catalogengine import snapshot_floor
+from .jobs import task
+
+logger = logging.getLogger(__name__)
+
+DIM = 2 ** 18  # hashed feature columns
+PROJECTION = 64  # dense dimensions products are clustered and shortlisted on
+SEED = 49  # of the random projection; the saved index depends on it
+KMEANS_ITERATIONS = 10
+NPROBE = 4  # clusters searched for a product: its own and the nearest others
+SHORTLIST = 4  # times K candidates re-ranked on the exact vectors
+BLOCK = 1 << 22  # query x candidate scores held at once
+CHUNK = 5000  # products vectorized per pool task
+
+WORD = re.compile(r'[a-z0-9]{2,}')
+# A shared tag or specification says more than a shared word
+WEIGHTS = {'category': 1.0, 'brand': 1.0, 'tag': 2.0, 'spec': 2.0, 'word': 1.0}
+
+PRODUCTS_SQL = """
+    SELECT p.id, c.path, p.brand_id, p.tags, p.specifications, p.name, p.description
+    FROM store_product p
+    JOIN store_category c ON c.id = p.category_id
+"""
+
+WRITE_SQL = """
+    INSERT INTO store_similarproduct (product_id, similar_id, rank, score)
+    SELECT l.product_id, l.similar_id, l.rank, l.score FROM similar_load l
+    WHERE EXISTS (SELECT 1 FROM store_product WHERE id = l.product_id)
+      AND EXISTS (SELECT 1 FROM store_product WHERE id = l.similar_id)
+"""
+
+
+def features(row):
+    _, path, brand, tags, specs, name, description = row
+    for category in path.split('/')[:-1]:  # the category's ancestors count too
+        yield 'category', category
+    yield 'brand', str(brand)
+    for tag in tags:
+        yield 'tag', tag.lower()
+    for key, value in specs.items() if isinstance(specs, dict) else ():
+        yield 'spec', f'{key}={value}'.lower()
+    for word in WORD.findall(f'{name} {description or ""}'.lower()):
+        yield 'word', word
+
+
+def vectorize(rows):
+    """Field-weighted term counts of PRODUCTS_SQL rows, hashed to DIM columns: (ids, matrix)."""
+    ids, indptr, indices, data = [], [0], [], []
+    for row in rows:
+        counts = {}
+        for field, token in features(row):
+            column = zlib.crc32(f'{field}:{token}'.encode()) % DIM
+            counts[column] = counts.get(column, 0.0) + WEIGHTS[field]
+        ids.append(row[0])
+        indices.extend(counts)
+        data.extend(counts.values())
+        indptr.append(len(indices))
+    matrix = sparse.csr_array(
+        (np.array(data, dtype=np.float32), np.array(indices, dtype=np.int32), np.array(indptr, dtype=np.int64)),
+        shape=(len(ids), DIM),
+    )
+    matrix.sort_indices()
+    return np.array(ids, dtype=np.int64), matrix
+
+
+def weigh(counts, idf):
+    # TF-IDF rows of unit length, so a dot product is the cosine
+    matrix = counts.copy()
+    matrix.data *= idf[matrix.indices]
+    norms = np.sqrt(np.asarray(matrix.multiply(matrix).sum(axis=1)).ravel())
+    matrix.data /= np.repeat(np.maximum(norms, 1e-12), np.diff(matrix.indptr)).astype(np.float32)
+    return matrix
+
+
+def project(matrix):
+    # Random projection to PROJECTION unit-length dimensions; cosines survive roughly
+    projection = np.random.default_rng(SEED).standard_normal((DIM, PROJECTION), dtype=np.float32)
+    points = np.asarray(matrix @ projection, dtype=np.float32)
+    return points / np.maximum(np.linalg.norm(points, axis=1), 1e-12)[:, None]
+
+
+def train_centroids(points, clusters):
+    """Spherical k-means on a sample of `points`; returns unit centroids."""
+    rng = np.random.default_rng(SEED)
+    sample = points[rng.choice(len(points), min(len(points), clusters * 40), replace=False)]
+    centroids = sample[rng.choice(len(sample), clusters, replace=False)].copy()
+    for _ in range(KMEANS_ITERATIONS):
+        nearest = np.argmax(sample @ centroids.T, axis=1)
+        members = sparse.csr_array(
+            (np.ones(len(sample), dtype=np.float32), (nearest, np.arange(len(sample)))),
+            shape=(clusters, len(sample)),
+        )
+        sums = members @ sample
+        norms = np.linalg.norm(sums, axis=1)
+        filled = norms > 0
+        centroids[filled] = sums[filled] / norms[filled, None]
+    return centroids
+
+
+def nearest_centroid(points, centroids):
+    nearest = [np.argmax(points[i:i + 50000] @ centroids.T, axis=1) for i in range(0, len(points), 50000)]
+    return np.concatenate(nearest) if nearest else np.zeros(0, dtype=np.int64)
+
+
+class SimilarityIndex:
+    """Every product's TF-IDF vector, and an inverted file over them.
+
+    Products are clustered (k-means on a random projection). A product's
+    neighbours are looked for in its own cluster and the NPROBE - 1
+    nearest: a shortlist by projected cosine, re-ranked on the exact
+    vectors. Saved between runs so a refresh only redoes changed products;
+    the IDF weights and clusters stay those of the last full build.
+    """
+
+    def __init__(self, ids, matrix, idf, centroids, floor):
+        self.ids = ids
+        self.matrix = matrix
+        self.idf = idf
+        self.centroids = centroids
+        self.floor = floor
+        self.points = project(matrix)
+        self.assignment = nearest_centroid(self.points, centroids)
+        self.cluster()
+
+    @classmethod
+    def build(cls, ids, counts, floor):
+        document_frequency = np.bincount(counts.indices, minlength=DIM)
+        idf = (np.log((1 + len(ids)) / (1 + document_frequency)) + 1).astype(np.float32)
+        matrix = weigh(counts, idf)
+        centroids = train_centroids(project(matrix), max(1, int(np.sqrt(len(ids)))))
+        return cls(ids, matrix, idf, centroids, floor)
+
+    def cluster(self):
+        self.order = np.argsort(self.assignment, kind='stable')
+        self.bounds = np.searchsorted(self.assignment[self.order], np.arange(len(self.centroids) + 1))
+        nearest = np.argsort(-(self.centroids @ self.centroids.T), axis=1)
+        self.probe = nearest[:, :NPROBE]
+
+    def members(self, cluster):
+        return self.order[self.bounds[cluster]:self.bounds[cluster + 1]]
+
+    def replace(self, ids, counts, removed):
+        """Drop the products `removed` and add (or re-add) `ids` with their term `counts`."""
+        keep = ~np.isin(self.ids, np.array(list(removed), dtype=np.int64))
+        matrix = weigh(counts, self.idf)
+        points = project(matrix)
+        self.ids = np.concatenate([self.ids[keep], ids])
+        self.matrix = sparse.vstack([self.matrix[keep], matrix], format='csr')
+        self.points = np.concatenate([self.points[keep], points])
+        self.assignment = np.concatenate([self.assignment[keep], nearest_centroid(points, self.centroids)])
+        self.cluster()
+
+    def tasks(self, positions):
+        """(cluster, positions in it) for the products at `positions`."""
+        order = positions[np.argsort(self.assignment[positions], kind='stable')]
+        clusters, starts = np.unique(self.assignment[order], return_index=True)
+        return list(zip(clusters.tolist(), np.split(order, starts[1:])))
+
+    def search(self, cluster, queries, k):
+        """Top-k neighbours of the products at `queries`, all in `cluster`:
+        arrays of product id, similar id, rank and score."""
+        candidates = np.concatenate([self.members(probe) for probe in self.probe[cluster]])
+        shortlist = min(k * SHORTLIST, len(candidates))
+        candidate_points = self.points[candidates].T
+        found = []
+        for start in range(0, len(queries), max(1, BLOCK // len(candidates))):
+            block = queries[start:start + max(1, BLOCK // len(candidates))]
+            coarse = self.points[block] @ candidate_points
+            if shortlist < len(candidates):
+                top = np.argpartition(-coarse, shortlist - 1, axis=1)[:, :shortlist]
+            else:
+                top = np.broadcast_to(np.arange(len(candidates)), coarse.shape)
+            product, similar = np.repeat(block, top.shape[1]), candidates[top.ravel()]
+            score = np.asarray(self.matrix[product].multiply(self.matrix[similar]).sum(axis=1)).ravel()
+            keep = (product != similar) & (score > 0)
+            product, similar, score = product[keep], similar[keep], score[keep]
+            order = np.lexsort((self.ids[similar], -score, product))
+            product, similar, score = product[order], similar[order], score[order]
+            rank = np.arange(len(product)) - np.searchsorted(product, product, side='left')
+            keep = rank < k
+            found.append((self.ids[product[keep]], self.ids[similar[keep]], rank[keep], score[keep]))
+        return found
+
+    def save(self, path):
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        partial = f"{path}.{os.getpid()}.tmp"
+        with open(partial, 'wb') as f:
+            np.savez(
+                f, ids=self.ids, data=self.matrix.data, indices=self.matrix.indices, indptr=self.matrix.indptr,
+                idf=self.idf, centroids=self.centroids, floor=self.floor,
+            )
+        os.replace(partial, path)
+
+    @classmethod
+    def load(cls, path):
+        if not os.path.exists(path):
+            return None
+        with np.load(path) as saved:
+            matrix = sparse.csr_array((saved['data'], saved['indices'], saved['indptr']), shape=(len(saved['ids']), DIM))
+            return cls(saved['ids'], matrix, saved['idf'], saved['centroids'], int(saved['floor']))
+
+
+# The index being searched; pool processes are forked with it in place
+current_index = None
+
+
+def search_task(args):
+    cluster, queries = args
+    return current_index.search(cluster, queries, settings.SIMILAR_PRODUCTS_K)
+
+
+def pool_map(func, items, workers):
+    """func over items, in order. Items are drawn in this thread (they may
+    be read from this thread's connection), at most 2 * workers ahead."""
+    # Job workers are daemonic processes, which may not start children;
+    # there (and with workers=1) everything runs in this process
+    if workers > 1 and not multiprocessing.current_process().daemon:
+        with multiprocessing.get_context('fork').Pool(workers) as pool:
+            pending = deque()
+            for item in items:
+                pending.append(pool.apply_async(func, (item,)))
+                if len(pending) >= 2 * workers:
+                    yield pending.popleft().get()
+            while pending:
+                yield pending.popleft().get()
+    else:
+        yield from map(func, items)
+
+
+def load_products(workers, where='', params=()):
+    """Vectorize the products PRODUCTS_SQL + where selects: (ids, term counts)."""
+    def chunks():
+        with transaction.atomic(), connection.chunked_cursor() as cursor:
+            cursor.execute(PRODUCTS_SQL + where, params)
+            while rows := cursor.fetchmany(CHUNK):
+                yield rows
+
+    parts = list(pool_map(vectorize, chunks(), workers))
+    if not parts:
+        return np.zeros(0, dtype=np.int64), sparse.csr_array((0, DIM), dtype=np.float32)
+    return np.concatenate([ids for ids, _ in parts]), sparse.vstack([counts for _, counts in parts], format='csr')
+
+
+def find_similar(index, positions, workers):
+    global current_index
+    current_index = index
+    try:
+        found = [part for parts in pool_map(search_task, index.tasks(positions), workers) for part in parts]
+    finally:
+        current_index = None
+    return [np.concatenate(column) for column in zip(*found)] if found else [np.zeros(0)] * 4
+
+
+def write_similar(products, found):
+    """Replace the lists of `products` (None: every product) with `found`.
+
+    Loaded with COPY through a temporary table, leaving out products
+    deleted while the lists were computed.
+    """
+    product, similar, rank, score = found
+    row = '{}\t{}\t{}\t{:.6f}\n'.format
+    buffer = io.StringIO(''.join(map(row, product.tolist(), similar.tolist(), rank.tolist(), score.tolist())))
+    with transaction.atomic(), connection.cursor() as cursor:
+        cursor.execute(
+            "CREATE TEMPORARY TABLE similar_load (product_id bigint, similar_id bigint, rank smallint, score float8)"
+        )
+        cursor.copy_expert("COPY similar_load FROM STDIN", buffer)
+        if products is None:
+            cursor.execute("DELETE FROM store_similarproduct")
+        else:
+            cursor.execute("DELETE FROM store_similarproduct WHERE product_id = ANY(%s)", [list(products)])
+        cursor.execute(WRITE_SQL)
+        cursor.execute("DROP TABLE similar_load")
+
+
+@task(queue='maintenance')
+def build_similar_products(workers=None):
+    """Vectorize every product, cluster them and rebuild every similar list; returns how many lists."""
+    workers = workers or settings.SIMILAR_WORKERS
+    with connection.cursor() as cursor:
+        floor = snapshot_floor(cursor)
+    ids, counts = load_products(workers, " ORDER BY p.id")
+    if not len(ids):
+        write_similar(None, [np.zeros(0)] * 4)
+        return 0
+    index = SimilarityIndex.build(ids, counts, floor)
+    write_similar(None, find_similar(index, np.arange(len(ids)), workers))
+    index.save(settings.SIMILAR_INDEX_PATH)
+    return len(ids)
+
+
+@task(queue='maintenance')
+def refresh_similar_products(workers=None):
+    """Redo the lists of products changed since the saved index; returns how many lists.
+
+    Changes are found by sync_xid and tombstones, as in the catalog engine.
+    Other products' lists only take changed products in at the next full
+    build. Queued by a trigger on product changes (migration 0018), so it
+    may run on any worker host: without a saved index there it does
+    nothing rather than a full build per product change.
+    """
+    workers = workers or settings.SIMILAR_WORKERS
+    index = SimilarityIndex.load(settings.SIMILAR_INDEX_PATH)
+    if index is None:
+        logger.warning(
+            "No similar-product index at %s; skipping the refresh. Run `manage.py build_similar_products` "
+            "where this worker can read the index.", settings.SIMILAR_INDEX_PATH,
+        )
+        return 0
+    with connection.cursor() as cursor:
+        floor = snapshot_floor(cursor)
+        cursor.execute("SELECT product_id FROM store_producttombstone WHERE sync_xid >= %s", [index.floor])
+        deleted = [product_id for product_id, in cursor.fetchall()]
+    ids, counts = load_products(workers, " WHERE p.sync_xid >= %s ORDER BY p.id", [index.floor])
+    index.replace(ids, counts, removed=set(ids.tolist()) | set(deleted))
+    index.floor = floor
+    positions = np.flatnonzero(np.isin(index.ids, ids))
+    write_similar(ids.tolist(), find_similar(index, positions, workers))
+    index.save(settings.SIMILAR_INDEX_PATH)
+    return len(ids)
@@ -0,0 +1,205 @@
+import re
+from collections import Counter
+from types import SimpleNamespace
+
+from django.db import connection
+
+from .models import *
+
+# --- Dataset helpers (used by the query-count tests and the plan checks) ---
+
+SEED_PASSWORD = "seed-password"
+
+
+def seed_store(size):
+    """Create one of everything, with `size` related rows hanging off each list."""
+    user = User(username="9000000000", phone="9000000000", name="Seed User", email="seed@example.com")
+    user.set_password(SEED_PASSWORD)
+    user.save()
+
+    category = Category.objects.create(name="Category 0", slug="category-0")
+    brand = Brand.objects.create(name="Brand 0", slug="brand-0")
+    Category.objects.bulk_create(
+        Category(name=f"Category {i}", slug=f"category-{i}") for i in range(1, size)
+    )
+    Brand.objects.bulk_create(
+        Brand(name=f"Brand {i}", slug=f"brand-{i}") for i in range(1, size)
+    )
+
+    products = Product.objects.bulk_create(
+        Product(
+            category=category, brand=brand, name=f"Product {i}", slug=f"product-{i}",
+            price=100.0 + i, images=[f"/img/{i}.jpg"], tags=["seed"],
+            specifications={"material": "silver"}, quantity=10,
+        )
+        for i in range(size)
+    )
+    Review.objects.bulk_create(
+        Review(user=user, product=product, user_name=user.name, rating=4.0, comment="Nice")
+        for product in products
+    )
+    # The detail view gets `size` reviews on a single product as well
+    Review.objects.bulk_create(
+        Review(user=user, product=products[0], user_name=user.name, rating=5.0)
+        for _ in range(size)
+    )
+
+    orders = Order.objects.bulk_create(
+        Order(user=user, payment_method="cod", total=100.0, shipping_address_snapshot={"city": "Pune"})
+        for _ in range(size)
+    )
+    OrderItem.objects.bulk_create(
+        OrderItem(order=order, product=products[0], name=products[0].name, price=100.0)
+        for order in orders
+    )
+
+    others = User.objects.bulk_create(
+        User(username=f"8{i:09d}", phone=f"8{i:09d}", name=f"User {i}", password="!")
+        for i in range(size)
+    )
+    Address.objects.bulk_create(
+        Address(user=other, name=other.name, line1="1 Main St", city="Pune",
+                state="MH", postal_code="411001", country="India")
+        for other in [user] + others
+    )
+    address = user.addresses.first()
+
+    Notification.objects.bulk_create(
+        Notification(user=user, title=f"Notice {i}", message="Hello", type="info")
+        for i in range(size)
+    )
+    HeroSlide.objects.bulk_create(
+        HeroSlide(id=i, title=f"Slide {i}", subtitle="", description="",
+                  buttonText="Shop", buttonLink="/products", image=f"/hero/{i}.jpg")
+        for i in range(1, size + 1)
+    )
+
+    return SimpleNamespace(
+        user=user, category=category, brand=brand, product=products[0],
+        order=orders[0], address=address,
+    )
+
+
+SCALE_TABLES = [
+    'store_user', 'store_category', 'store_brand', 'store_product', 'store_review',
+    'store_order', 'store_orderitem', 'store_notification', 'store_productlisting',
+]
+
+
+def seed_scaled(size):
+    """Bulk-load a realistically spread dataset of roughly `size` rows per table.
+
+    Rows are generated in SQL so that 100k+ rows take seconds. Orders,
+    reviews and notifications are spread over `size // 20` users, so
+    per-user lookups are as selective as they would be in production.
+    """
+    users = max(size // 20, 10)
+    with connection.cursor() as cursor:
+        def first_id(table, column, prefix):
+            cursor.execute(f"SELECT min(id) FROM {table} WHERE {column} LIKE %s", [prefix + '%'])
+            return cursor.fetchone()[0]
+
+        cursor.execute("""
+            INSERT INTO store_user (password, is_superuser, username, first_name, last_name,
+                                    email, is_staff, is_active, date_joined, name, phone, role)
+            SELECT '!', false, 'scale-' || i, '', '', 'scale' || i || '@example.com',
+                   false, true, now() - make_interval(mins => i), 'Scale User ' || i, 'scale-' || i,
+                   CASE WHEN i %% 100 = 0 THEN 'admin' ELSE 'user' END
+            FROM generate_series(1, %(users)s) AS i
+        """, {'users': users})
+        cursor.execute("""
+            INSERT INTO store_category (name, slug)
+            SELECT 'Scale Category ' || i, 'scale-category-' || i FROM generate_series(1, 50) AS i
+        """)
+        cursor.execute("""
+            INSERT INTO store_brand (name, slug)
+            SELECT 'Scale Brand ' || i, 'scale-brand-' || i FROM generate_series(1, 50) AS i
+        """)
+        ids = {
+            'users': users, 'size': size,
+            'user': first_id('store_user', 'username', 'scale-'),
+            'category': first_id('store_category', 'slug', 'scale-'),
+            'brand': first_id('store_brand', 'slug', 'scale-'),
+        }
+        cursor.execute("""
+            INSERT INTO store_product (category_id, brand_id, name, slug, description, price, sale_price,
+                                       images, tags, specifications, in_stock, quantity, rating_average,
+                                       created_at, updated_at)
+            SELECT %(category)s + i %% 50, %(brand)s + (i / 7) %% 50, 'Scale Product ' || i,
+                   'scale-product-' || i, 'Generated product', 100 + i %% 9000,
+                   CASE WHEN i %% 4 = 0 THEN 90 + i %% 9000 END,
+                   ARRAY['/img/' || i || '.jpg'], ARRAY['tag-' || i %% 100, 'tag-' || i %% 7],
+                   jsonb_build_object('material', (ARRAY['silver', 'gold', 'crystal'])[1 + i %% 3]),
+                   i %% 10 <> 0, i %% 50, (i %% 50) / 10.0,
+                   now() - make_interval(secs => i), now() - make_interval(secs => i)
+            FROM generate_series(0, %(size)s - 1) AS i
+        """, ids)
+        ids['product'] = first_id('store_product', 'slug', 'scale-')
+        cursor.execute("""
+            INSERT INTO store_review (user_id, product_id, user_name, rating, comment, created_at)
+            SELECT %(user)s + i %% %(users)s, %(product)s + i, 'Scale User', 1 + i %% 5, '', now()
+            FROM generate_series(0, %(size)s - 1) AS i
+        """, ids)
+        cursor.execute("""
+            INSERT INTO store_order (user_id, status, payment_method, payment_status, subtotal, tax,
+                                     shipping_cost, discount, total, shipping_address_snapshot,
+                                     created_at, updated_at)
+            SELECT %(user)s + i %% %(users)s,
+                   (ARRAY['processing', 'shipped', 'delivered', 'cancelled'])[1 + i %% 4],
+                   'cod', (ARRAY['pending', 'paid'])[1 + i %% 2], 100, 0, 0, 0, 100, '{}',
+                   now() - make_interval(mins => i), now() - make_interval(mins => i)
+            FROM generate_series(0, %(size)s - 1) AS i
+        """, ids)
+        cursor.execute("""
+            INSERT INTO store_orderitem (order_id, product_id, name, price, quantity, image)
+            SELECT o.id, %(product)s + (o.id * k) %% %(size)s, 'Scale Product', 100, 1, NULL
+            FROM store_order o, generate_series(1, 2) AS k
+            WHERE o.user_id >= %(user)s
+        """, ids)
+        cursor.execute("""
+            INSERT INTO store_notification (user_id, title, message, type, is_read, created_at)
+            SELECT %(user)s + i %% %(users)s, 'Notice ' || i, 'Hello', 'info', i %% 3 = 0,
+                   now() - make_interval(mins => i)
+            FROM generate_series(0, %(size)s - 1) AS i
+        """, ids)
+        # Autovacuum would have merged GIN pending lists by now; do it so the planner costs them fairly
+        cursor.execute("""
+            SELECT gin_clean_pending_list(i.indexrelid) FROM pg_index i
+            JOIN pg_class c ON c.oid = i.indexrelid JOIN pg_am am ON am.oid = c.relam
+            WHERE am.amname = 'gin' AND i.indrelid::regclass::text = ANY(%s)
+        """, [SCALE_TABLES])
+        for table in SCALE_TABLES:
+            cursor.execute(f'ANALYZE {table}')
+
+    return SimpleNamespace(
+        user=User.objects.filter(username__startswith='scale-').order_by('id').first(),
+        product=Product.objects.filter(slug__startswith='scale-').order_by('id').first(),
+    )
+
+
+# --- Query shapes ---
+
+_STRING_RE = re.compile(r"'(?:[^']|'')*'")
+_NUMBER_RE = re.compile(r"\b\d+(?:\.\d+)?\b")
+_IN_LIST_RE = re.compile(r"IN \((?:\?, )*\?\)")
+
+
+def query_shape(sql):
+    """Strip literals so that queries differing only in parameters compare equal."""
+    sql = _STRING_RE.sub("?", sql)
+    sql = _NUMBER_RE.sub("?", sql)
+    return _IN_LIST_RE.sub("IN (...)", sql)
+
+
+def query_shapes(queries):
+    return Counter(query_shape(query["sql"]) for query in queries)
+
+
+def describe_growth(small, large):
+    """Human readable list of the shapes that ran more often on the larger dataset."""
+    small_shapes = query_shapes(small)
+    lines = []
+    for shape, count in query_shapes(large).most_common():
+        if count > small_shapes.get(shape, 0):
+            lines.append(f"  {small_shapes.get(shape, 0)} -> {count}x  {shape}")
+    return "\n".join(lines)
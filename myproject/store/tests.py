@@ -1,3 +1,1455 @@
-from django.test import TestCase
+import asyncio
+import brotli
+import fcntl
+import gzip
+import json
+import os
+import select
+import tempfile
+import threading
+import time
+from datetime import timedelta
+from io import StringIO
 
-# Create your tests here.
+import psycopg2
+from django.conf import settings
+from django.core.cache import cache
+from django.core.management import call_command
+from django.db import InternalError, OperationalError, connection, connections, transaction
+from django.test import TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.db.models import Prefetch, Sum
+from django.utils import timezone
+from djangorestframework_camel_case.render import CamelCaseJSONRenderer
+from rest_framework.renderers import JSONRenderer
+
+from .broadcasts import send_broadcast
+from .catalog import CHANNEL as CATALOG_CHANNEL, catalog_publisher, catalog_root, publish_catalog
+from .catalogengine import catalog_engine
+from .events import CHANNEL, EventHub, events_app
+from .fastserializers import compiled
+from .jobs import claim_job, enqueue, housekeeping, run_job, task
+from .orders import transition_orders
+from .popularity import view_counter
+from .recommendations import build_related_products, update_related_products
+from .similarity import build_similar_products, refresh_similar_products
+from .productcache import ProductDetailCache, product_details
+from .models import (
+    Address, Brand, Broadcast, Category, HeroSlide, Job, Notification, NotificationArchive, Order,
+    OrderItem, Product, ProductListing, ProductPopularity, RelatedProduct, Review, SimilarProduct, User,
+)
+from .serializers import (
+    AddressSerializer, BrandSerializer, CategorySerializer, HeroSlideSerializer, NotificationSerializer,
+    OrderSerializer, OrderSummarySerializer, ProductSerializer, UserSerializer,
+)
+from .queryplans import check_endpoints
+from .testing import SEED_PASSWORD, describe_growth, seed_scaled, seed_store
+from .views import create_access_token
+
+# --- Query-count regression tests ---
+
+# (name, method, url, payload, authenticated). `url` and `payload` are called
+# with the seeded dataset so they can point at real rows; authenticated is
+# True for the seeded user, 'admin' for the same user made staff.
+ENDPOINTS = [
+    ('login', 'post', lambda d: '/api/auth/login',
+     lambda d: {'phone': d.user.phone, 'password': SEED_PASSWORD}, False),
+    ('register', 'post', lambda d: '/api/auth/register',
+     lambda d: {'phone': '7000000000', 'password': 'pw', 'name': 'New'}, False),
+    ('user-me', 'get', lambda d: '/api/user/me', None, True),
+    ('user-update', 'put', lambda d: '/api/user/update', lambda d: {'name': 'Renamed'}, True),
+    ('categories', 'get', lambda d: '/api/products/categories', None, False),
+    ('category-detail', 'get', lambda d: f'/api/products/categories/{d.category.id}', None, False),
+    ('category-tree', 'get', lambda d: '/api/products/categories/tree', None, False),
+    ('brands', 'get', lambda d: '/api/products/brands', None, False),
+    ('products', 'get', lambda d: '/api/products', None, False),
+    ('product-cards', 'get', lambda d: '/api/products?view=card', None, False),
+    ('products-filtered', 'get',
+     lambda d: f'/api/products?category={d.category.id}&min_price=1&in_stock=true&tags=seed&sort=-price',
+     None, False),
+    ('product-changes', 'get', lambda d: '/api/products/changes?since=1', None, False),
+    ('product-facets', 'get', lambda d: f'/api/products/facets?brand={d.brand.id}&tags=seed', None, False),
+    ('product-detail', 'get', lambda d: f'/api/products/{d.product.slug}', None, False),
+    ('products-trending', 'get', lambda d: '/api/products/trending', None, False),
+    ('product-related', 'get', lambda d: f'/api/products/{d.product.slug}/related', None, False),
+    ('users', 'get', lambda d: '/api/users', None, False),
+    ('users-search', 'get', lambda d: '/api/users?search=user&role=user', None, False),
+    ('users-count', 'get', lambda d: '/api/users/count?search=user', None, 'admin'),
+    ('user-detail', 'get', lambda d: f'/api/users/{d.user.id}', None, False),
+    ('orders', 'get', lambda d: '/api/orders', None, False),
+    ('orders-filtered', 'get',
+     lambda d: f'/api/orders?status=processing&payment_status=pending&user={d.user.id}'
+               '&created_after=2020-01-01', None, False),
+    ('orders-transition', 'post', lambda d: '/api/orders/transition',
+     lambda d: {'ids': list(d.user.orders.values_list('id', flat=True)), 'status': 'shipped',
+                'trackingNumbers': {str(d.order.id): 'TRK1'}}, 'admin'),
+    ('user-orders', 'get', lambda d: f'/api/orders/user/{d.user.id}', None, False),
+    ('user-orders-summary', 'get', lambda d: f'/api/orders/user/{d.user.id}?view=summary', None, False),
+    ('notifications', 'get', lambda d: f'/api/notifications/{d.user.id}', None, True),
+    ('notifications-since', 'get',
+     lambda d: f'/api/notifications/{d.user.id}?since=2020-01-01T00:00:00Z&unread=true', None, True),
+    ('notifications-unread-count', 'get', lambda d: f'/api/notifications/{d.user.id}/unread-count', None, True),
+    ('notifications-mark-read', 'post', lambda d: f'/api/notifications/{d.user.id}/mark-read',
+     lambda d: {}, True),
+    ('address-create', 'post', lambda d: '/api/addresses',
+     lambda d: {'name': 'Home', 'line1': '2 Main St', 'city': 'Pune', 'state': 'MH',
+                'postalCode': '411002', 'country': 'India'}, True),
+    ('address-update', 'put', lambda d: f'/api/addresses/{d.address.id}',
+     lambda d: {'city': 'Mumbai'}, True),
+    ('address-delete', 'delete', lambda d: f'/api/addresses/{d.address.id}', None, True),
+    ('hero-slides', 'get', lambda d: '/api/hero-slides', None, False),
+    ('home', 'get', lambda d: '/api/home', None, False),
+]
+
+
+@override_settings(PASSWORD_HASHERS=['django.contrib.auth.hashers.MD5PasswordHasher'], PRODUCT_CACHE_SIZE=0)
+class QueryCountTests(TestCase):
+    SIZES = (10, 1000)
+
+    def run_endpoint(self, endpoint, size):
+        name, method, url, payload, authenticated = endpoint
+        with transaction.atomic():
+            data = seed_store(size)
+            kwargs = {}
+            if payload is not None:
+                kwargs = {'data': json.dumps(payload(data)), 'content_type': 'application/json'}
+            if authenticated == 'admin':
+                User.objects.filter(id=data.user.id).update(is_staff=True)
+            if authenticated:
+                kwargs['HTTP_AUTHORIZATION'] = f'Bearer {create_access_token(data.user.id)}'
+            with CaptureQueriesContext(connection) as ctx:
+                response = getattr(self.client, method)(url(data), **kwargs)
+            transaction.set_rollback(True)
+        self.assertLess(response.status_code, 400, f'{name}: {response.content[:200]!r}')
+        return ctx.captured_queries
+
+    def test_query_count_does_not_grow_with_data(self):
+        for endpoint in ENDPOINTS:
+            with self.subTest(endpoint=endpoint[0]):
+                small, large = (self.run_endpoint(endpoint, size) for size in self.SIZES)
+                if len(large) > len(small):
+                    self.fail(
+                        f'{endpoint[0]}: {len(small)} queries at {self.SIZES[0]} rows, '
+                        f'{len(large)} at {self.SIZES[1]} rows. Repeated shapes:\n'
+                        + describe_growth(small, large)
+                    )
+
+
+# --- Query plan regression tests ---
+
+class QueryPlanTests(TestCase):
+    SIZE = 20000
+    THRESHOLD = 5000
+
+    def test_key_endpoints_use_indexes(self):
+        data = seed_scaled(self.SIZE)
+        failures = [
+            f'[{name}] {sql}\n    ' + '\n    '.join(problems)
+            for name, sql, problems in check_endpoints(data, self.THRESHOLD)
+            if problems
+        ]
+        self.assertFalse(failures, '\n'.join(failures))
+
+
+# --- Broadcasts ---
+
+class BroadcastTests(TestCase):
+    def test_broadcast_reaches_each_recipient_once(self):
+        data = seed_store(20)
+        User.objects.filter(phone='8000000000').update(role='admin')
+        before = Notification.objects.count()
+        cases = [('', 'all', 21), ('admin', 'all', 1), ('', 'customers', 1), ('user', 'prospects', 19)]
+        for role, segment, expected in cases:
+            with self.subTest(role=role, segment=segment):
+                broadcast = Broadcast.objects.create(title='Sale', message='Hello', role=role, segment=segment)
+                send_broadcast(broadcast, chunk_size=7)
+                broadcast.refresh_from_db()
+                self.assertEqual((broadcast.status, broadcast.total, broadcast.sent), ('done', expected, expected))
+                written = Notification.objects.filter(title='Sale', id__gt=before)
+                self.assertEqual(written.count(), expected)
+                self.assertEqual(written.values('user').distinct().count(), expected)
+                before = Notification.objects.order_by('-id').values_list('id', flat=True).first()
+        self.assertTrue(Notification.objects.filter(user=data.user, title='Sale', type='promotion').exists())
+
+
+# --- Event stream ---
+
+class QuietHub(EventHub):
+    # Routing only, without a LISTEN connection
+    async def listen(self):
+        pass
+
+
+class EventStreamTests(TransactionTestCase):
+    # The stream reads on other threads, so the rows have to be committed
+
+    def stream(self, method='GET', headers=(), until=None):
+        """Run events_app until `until(body)` holds; returns (status, body)."""
+        messages = []
+
+        def body():
+            return b''.join(message.get('body', b'') for message in messages[1:]).decode()
+
+        async def main():
+            disconnected = asyncio.Event()
+
+            async def receive():
+                await disconnected.wait()
+                return {'type': 'http.disconnect'}
+
+            async def send(message):
+                messages.append(message)
+                if until is not None and until(body()):
+                    disconnected.set()
+
+            scope = {
+                'type': 'http', 'method': method, 'path': '/api/events', 'query_string': b'',
+                'headers': [(name.encode(), value.encode()) for name, value in headers],
+            }
+            await asyncio.wait_for(events_app(scope, receive, send), 10)
+
+        asyncio.run(main())
+        return messages[0]['status'], body()
+
+    def test_dispatch_routes_by_user(self):
+        async def main():
+            hub = QuietHub()
+            queues = {user_id: hub.subscribe(user_id) for user_id in (1, 2, 5)}
+            second = hub.subscribe(2)
+            hub.dispatch({'type': 'order', 'user_id': 2, 'id': 9})
+            hub.dispatch({'type': 'order', 'user_id': 3, 'id': 9})
+            hub.dispatch({'type': 'broadcast', 'first_user_id': 2, 'last_user_id': 5})
+            hub.dispatch({'type': 'maintenance'})
+            hub.unsubscribe(2, second)
+            return {user_id: queue.qsize() for user_id, queue in queues.items()}, second.qsize(), set(hub.subscribers)
+
+        sizes, second, subscribed = asyncio.run(main())
+        self.assertEqual(sizes, {1: 1, 2: 3, 5: 2})
+        self.assertEqual((second, subscribed), (3, {1, 2, 5}))
+
+    def test_hub_connects_off_the_event_loop(self):
+        class SlowHub(EventHub):
+            reconnect_delay = 0.1
+            connected = False
+
+            def connect(self):
+                time.sleep(0.5)  # a slow database
+                conn = super().connect()
+                self.connected = True
+                return conn
+
+        async def main():
+            hub = SlowHub()
+            queue = hub.subscribe(1)
+            ticks = 0
+            while not hub.connected:
+                await asyncio.sleep(0.05)
+                ticks += 1
+            hub.unsubscribe(1, queue)
+            await asyncio.wait_for(hub.listener, 5)
+            return ticks
+
+        self.assertGreaterEqual(asyncio.run(main()), 5)
+
+    def test_hub_reads_a_broadcast_once_for_every_stream(self):
+        seed_store(3)
+        users = list(User.objects.order_by('id').values_list('id', flat=True))
+        listener = psycopg2.connect(**connections['default'].get_connection_params())
+        self.addCleanup(listener.close)
+        listener.set_session(autocommit=True)
+        listener.cursor().execute(f'LISTEN {CHANNEL}')
+        send_broadcast(Broadcast.objects.create(title='Sale', message='Hello'), chunk_size=len(users) - 1)
+        listener.poll()
+        first, last = (json.loads(notify.payload) for notify in listener.notifies)
+        self.assertEqual((first['first_user_id'], first['last_user_id']), (users[0], users[-2]))
+
+        async def main():
+            hub = QuietHub()
+            queues = {user_id: hub.subscribe(user_id) for user_id in (users[0], users[1], users[-1])}
+            await hub.publish(first)
+            return {user_id: [queue.get_nowait() for _ in range(queue.qsize())] for user_id, queue in queues.items()}
+
+        received = asyncio.run(main())
+        self.assertEqual(received[users[-1]], [])  # in the second chunk
+        for user_id in users[:2]:
+            [event] = received[user_id]
+            [notification] = event['notifications']
+            self.assertEqual(notification['id'], Notification.objects.get(user_id=user_id, title='Sale').id)
+
+    def test_rejects_bad_requests(self):
+        self.assertEqual(self.stream()[0], 401)
+        self.assertEqual(self.stream(headers=[('authorization', 'Bearer nonsense')])[0], 401)
+        self.assertEqual(self.stream(method='POST')[0], 405)
+
+    def test_catches_up_from_last_event_id(self):
+        user = seed_store(4).user
+        ids = list(Notification.objects.filter(user=user).order_by('id').values_list('id', flat=True))
+        status, body = self.stream(
+            headers=[('authorization', f'Bearer {create_access_token(user.id)}'), ('last-event-id', str(ids[1]))],
+            until=lambda body: body.count('event: notification') == 2,
+        )
+        self.assertEqual(status, 200)
+        self.assertEqual([int(line[4:]) for line in body.splitlines() if line.startswith('id: ')], ids[2:])
+        self.assertIn('"isRead": false', body)
+
+
+# --- Product listing documents ---
+
+class ProductListingTests(TestCase):
+    def test_documents_follow_product_review_and_brand_changes(self):
+        data = seed_store(2)
+        Review.objects.create(user=data.user, product=data.product, user_name='x', rating=1.0)
+        Brand.objects.filter(id=data.brand.id).update(name='Renamed Brand')
+        data.product.name = 'Renamed Product'
+        data.product.save()
+
+        cards = self.client.get('/api/products?view=card&limit=1').json()
+        self.assertEqual(len(cards), 1)
+        self.assertEqual(
+            {key: cards[0][key] for key in ('id', 'name', 'brand', 'category', 'image', 'reviewCount', 'salePrice')},
+            {'id': data.product.id, 'name': 'Renamed Product', 'brand': 'Renamed Brand',
+             'category': data.category.name, 'image': data.product.images[0], 'reviewCount': 4,
+             'salePrice': None},
+        )
+        self.assertEqual(cards[0]['reviewRating'], round((4.0 + 5.0 * 2 + 1.0) / 4, 2))
+
+    def test_moving_a_review_refreshes_both_products(self):
+        data = seed_store(2)
+        other = Product.objects.exclude(id=data.product.id).get()
+        # Listings follow reviews through the product touch (migration 0012)
+        Review.objects.filter(product=other).update(product=data.product)
+        counts = dict(ProductListing.objects.values_list('product_id', 'document__reviewCount'))
+        self.assertEqual(counts, {data.product.id: 4, other.id: 0})
+
+
+
+
+
+# --- Catalog filters and the in-memory engine ---
+
+class CatalogFilterTests(TestCase):
+    QUERIES = [
+        '', 'sort=price', 'sort=-price&limit=7', 'sort=rating&skip=5&limit=10', 'sort=-rating', 'sort=newest',
+        'category={c1}', 'category={c1},{c2}&brand={b2}&sort=-price', 'min_price=105.5&max_price=120',
+        'in_stock=false', 'min_rating=3.5&sort=rating', 'tags=red', 'tags=red,blue&sort=price',
+        'tags=no-such-tag', 'category={c2}&in_stock=true&tags=blue&sort=newest&skip=1&limit=3',
+    ]
+
+    def setUp(self):
+        catalog_engine.reset()
+        self.addCleanup(catalog_engine.reset)
+        data = seed_store(2)
+        self.categories = [data.category, Category.objects.exclude(id=data.category.id).get()]
+        self.brands = [data.brand, Brand.objects.exclude(id=data.brand.id).get()]
+        Product.objects.bulk_create(
+            Product(
+                category=self.categories[i % 2], brand=self.brands[i % 3 // 2], name=f'Item {i}', slug=f'item-{i}',
+                price=100.0 + i % 25, sale_price=99.0 + i % 7 if i % 4 == 0 else None, in_stock=i % 5 != 0,
+                rating_average=i % 9 / 2, tags=[['red'], ['blue'], ['red', 'blue'], []][i % 4],
+                specifications={'material': ['silver', 'gold', 'brass'][i % 3], 'stone': ['ruby', 'none'][i % 2]},
+                created_at=timezone.now() - timedelta(hours=i % 13),
+            )
+            for i in range(60)
+        )
+
+    def urls(self):
+        values = {'c1': self.categories[0].id, 'c2': self.categories[1].id, 'b2': self.brands[1].id}
+        return [f'/api/products?{query.format(**values)}' for query in self.QUERIES]
+
+    def ids(self, url):
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, 200, response.content[:200])
+        return [product['id'] for product in response.json()]
+
+    def test_sql_filters(self):
+        products = self.client.get(f'/api/products?category={self.categories[1].id}&tags=blue&sort=-price').json()
+        self.assertTrue(products)
+        prices = [product['salePrice'] or product['price'] for product in products]
+        self.assertEqual(prices, sorted(prices, reverse=True))
+        expected = Product.objects.filter(category=self.categories[1], tags__overlap=['blue']).count()
+        self.assertEqual(len(products), expected)
+        cards = self.client.get(f'/api/products?view=card&category={self.categories[1].id}&tags=blue&sort=-price')
+        self.assertEqual([card['id'] for card in cards.json()], [product['id'] for product in products])
+        for bad in ('category=x', 'min_price=cheap', 'min_price=nan', 'in_stock=yes', 'sort=name',
+                    'spec.=silver', 'spec.ma-terial=silver', 'spec.material='):
+            self.assertEqual(self.client.get(f'/api/products?{bad}').status_code, 400)
+
+    def test_spec_filters(self):
+        def expected(test):
+            return sorted(p.id for p in Product.objects.all() if test(p.specifications or {}, p.tags))
+
+        cases = {
+            'spec.material=silver': lambda s, t: s.get('material') == 'silver',
+            'spec.material=silver&spec.stone=ruby': lambda s, t: s.get('material') == 'silver' and s.get('stone') == 'ruby',
+            'spec.material=gold,brass&tags=blue': lambda s, t: s.get('material') in ('gold', 'brass') and 'blue' in t,
+            'spec.material=gold,brass&spec.stone=none': lambda s, t: s.get('material') in ('gold', 'brass')
+                                                                    and s.get('stone') == 'none',
+            'spec.material=unobtainium': lambda s, t: False,
+        }
+        for query, test in cases.items():
+            with self.subTest(query=query):
+                self.assertEqual(sorted(self.ids(f'/api/products?{query}&limit=100')), expected(test))
+        # Spec filters stay in SQL even with the engine on, facets included
+        with override_settings(CATALOG_ENGINE=True):
+            self.assertEqual(sorted(self.ids('/api/products?spec.material=silver&limit=100')),
+                             expected(cases['spec.material=silver']))
+            facets = self.client.get('/api/products/facets?spec.material=silver&tags=red').json()
+            self.assertEqual(facets['total'], len(expected(lambda s, t: s.get('material') == 'silver' and 'red' in t)))
+
+    def test_long_tags_and_specifications_fit_the_indexes(self):
+        # Incompressible values well past the 2704-byte btree entry limit
+        product = Product.objects.create(
+            category=self.categories[0], brand=self.brands[0], name='Wide', slug='wide', price=100,
+            tags=[os.urandom(30).hex() for _ in range(80)],
+            specifications={f'key_{i}': os.urandom(32).hex() for i in range(80)},
+        )
+        product.tags = [os.urandom(30).hex() for _ in range(80)]
+        product.save()
+        ids = [p['id'] for p in self.client.get(f'/api/products?tags={product.tags[0]}&sort=price').json()]
+        self.assertEqual(ids, [product.id])
+
+    @override_settings(FACET_PRICE_BUCKETS=[100, 105, 110])
+    def test_facets_ignore_their_own_filter(self):
+        cache.clear()
+        self.addCleanup(cache.clear)
+        category = self.categories[1].id
+        query = f'category={category}&tags=blue&min_price=100&max_price=109&in_stock=true'
+        facets = self.client.get(f'/api/products/facets?{query}').json()
+
+        products = list(Product.objects.all())
+        price = lambda p: p.price if p.sale_price is None else p.sale_price
+        tests = {
+            'category': lambda p: p.category_id == category,
+            'tags': lambda p: 'blue' in p.tags,
+            'price': lambda p: 100 <= price(p) <= 109,
+            'in_stock': lambda p: p.in_stock,
+        }
+
+        def matching(exclude=None):
+            return [p for p in products if all(test(p) for name, test in tests.items() if name != exclude)]
+
+        def counted(values):
+            counts = {}
+            for value in values:
+                counts[value] = counts.get(value, 0) + 1
+            return counts
+
+        self.assertEqual(facets['total'], len(matching()))
+        self.assertEqual({c['id']: c['count'] for c in facets['categories']},
+                         counted(p.category_id for p in matching('category')))
+        self.assertEqual({b['id']: b['count'] for b in facets['brands']}, counted(p.brand_id for p in matching()))
+        self.assertEqual({t['tag']: t['count'] for t in facets['tags']},
+                         counted(tag for p in matching('tags') for tag in p.tags))
+        self.assertEqual({s['inStock']: s['count'] for s in facets['inStock']},
+                         counted(p.in_stock for p in matching('in_stock')))
+        edges = [float('-inf'), 100, 105, 110, float('inf')]
+        self.assertEqual(
+            [(bucket['min'], bucket['max'], bucket['count']) for bucket in facets['prices']],
+            [(None if i == 0 else edges[i], None if i == 3 else edges[i + 1],
+              sum(edges[i] <= price(p) < edges[i + 1] for p in matching('price'))) for i in range(4)],
+        )
+        self.assertTrue(facets['categories'] and facets['tags'] and facets['prices'][1]['count'])
+        with override_settings(CATALOG_ENGINE=True):
+            self.assertEqual(self.client.get(f'/api/products/facets?{query}').json(), facets)
+
+    @override_settings(CATALOG_ENGINE_REFRESH=0)
+    def test_engine_matches_sql(self):
+        expected = {url: self.ids(url) for url in self.urls()}
+        with override_settings(CATALOG_ENGINE=True):
+            for url in self.urls():
+                with self.subTest(url=url):
+                    self.assertEqual(self.ids(url), expected[url])
+                    card_url = url + '&view=card'
+                    self.assertEqual([card['id'] for card in self.client.get(card_url).json()], expected[url])
+            self.assertIsNotNone(catalog_engine.columns)
+
+            # Changes that bypass signals arrive through the sync_xid watermark
+            cheapest = self.ids('/api/products?sort=price&limit=1')[0]
+            Product.objects.filter(id=cheapest).update(price=1000, sale_price=None)
+            Product.objects.filter(id=self.ids('/api/products?sort=-price&limit=1')[0]).delete()
+            changed = {url: self.ids(url) for url in self.urls()}
+            self.assertNotEqual(changed['/api/products?sort=price'][0], cheapest)
+        for url in self.urls():
+            with self.subTest(url=url):
+                self.assertEqual(self.ids(url), changed[url])
+
+
+# --- Category tree ---
+
+class CategoryTreeTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.addCleanup(cache.clear)
+        catalog_engine.reset()
+        self.addCleanup(catalog_engine.reset)
+        data = seed_store(1)
+        self.jewelry = Category.objects.create(name='Jewelry', slug='jewelry')
+        self.rings = Category.objects.create(name='Rings', slug='rings', parent=self.jewelry)
+        self.silver = Category.objects.create(name='Silver', slug='silver-rings', parent=self.rings)
+        self.watches = Category.objects.create(name='Watches', slug='watches')
+        self.products = {
+            category.slug: Product.objects.create(
+                category=category, brand=data.brand, name=category.name, slug=f'p-{category.slug}', price=10,
+            )
+            for category in (self.jewelry, self.rings, self.silver, self.watches)
+        }
+
+    def listed(self, category):
+        return {product['slug'] for product in self.client.get(f'/api/products?category={category.id}').json()}
+
+    def test_category_lists_its_subtree(self):
+        self.assertEqual(self.silver.path, f'{self.jewelry.id}/{self.rings.id}/{self.silver.id}/')
+        expected = {
+            self.jewelry: {'p-jewelry', 'p-rings', 'p-silver-rings'},
+            self.rings: {'p-rings', 'p-silver-rings'},
+            self.silver: {'p-silver-rings'},
+            self.watches: {'p-watches'},
+        }
+        for category, slugs in expected.items():
+            self.assertEqual(self.listed(category), slugs)
+        with override_settings(CATALOG_ENGINE=True):
+            for category, slugs in expected.items():
+                self.assertEqual(self.listed(category), slugs)
+        self.assertEqual(self.client.get('/api/products?category=999999').json(), [])
+
+    def test_moving_a_category_moves_its_subtree(self):
+        self.rings.parent = self.watches
+        self.rings.save()
+        self.assertEqual(Category.objects.get(id=self.silver.id).path,
+                         f'{self.watches.id}/{self.rings.id}/{self.silver.id}/')
+        self.assertEqual(self.listed(self.jewelry), {'p-jewelry'})
+        self.assertEqual(self.listed(self.watches), {'p-watches', 'p-rings', 'p-silver-rings'})
+
+        self.watches.parent = self.silver
+        with self.assertRaises(InternalError), transaction.atomic():
+            self.watches.save()
+
+    def test_moved_category_is_read_from_the_table(self):
+        self.listed(self.jewelry)
+        # Moved by another process: nothing here clears this process's cache
+        Category.objects.filter(id=self.rings.id).update(parent=self.watches)
+        self.assertEqual(self.listed(self.jewelry), {'p-jewelry'})
+        self.assertEqual(self.listed(self.watches), {'p-watches', 'p-rings', 'p-silver-rings'})
+
+    def test_facets_count_the_subtree(self):
+        expected = {self.jewelry.id: 3, self.rings.id: 2, self.silver.id: 1, self.watches.id: 1}
+        for engine in (False, True):
+            with self.subTest(engine=engine), override_settings(CATALOG_ENGINE=engine):
+                cache.clear()
+                for query in ('', f'category={self.silver.id}'):
+                    facets = self.client.get(f'/api/products/facets?{query}').json()
+                    counts = {category['id']: category['count'] for category in facets['categories']}
+                    self.assertEqual({id: counts.get(id) for id in expected}, expected)
+                facets = self.client.get(f'/api/products/facets?category={self.rings.id}').json()
+                self.assertEqual(facets['total'], 2)
+
+    def test_tree_endpoint(self):
+        def node(slug, tree):
+            for category in tree:
+                if category['slug'] == slug:
+                    return category
+                found = node(slug, category['children'])
+                if found:
+                    return found
+
+        tree = self.client.get('/api/products/categories/tree').json()
+        jewelry = node('jewelry', tree)
+        self.assertIn(jewelry, tree)
+        self.assertEqual([child['slug'] for child in jewelry['children']], ['rings'])
+        self.assertEqual(jewelry['children'][0]['children'][0]['parentId'], self.rings.id)
+        self.assertEqual(node('silver-rings', tree)['children'], [])
+
+        # Cached until a category changes
+        with self.assertNumQueries(0):
+            self.client.get('/api/products/categories/tree')
+        Category.objects.create(name='Earrings', slug='earrings', parent=self.jewelry)
+        tree = self.client.get('/api/products/categories/tree').json()
+        self.assertEqual([child['slug'] for child in node('jewelry', tree)['children']], ['rings', 'earrings'])
+
+
+# --- Product detail cache ---
+
+class ProductDetailCacheTests(TestCase):
+    def setUp(self):
+        product_details.clear()
+        self.addCleanup(product_details.clear)
+
+    def test_cached_until_the_product_or_a_review_changes(self):
+        data = seed_store(2)
+        url = f'/api/products/{data.product.slug}'
+        first = self.client.get(url)
+        self.assertEqual(first['X-Cache'], 'MISS')
+        with self.assertNumQueries(0):
+            second = self.client.get(url)
+        self.assertEqual((second['X-Cache'], second.content), ('HIT', first.content))
+
+        Review.objects.create(user=data.user, product=data.product, user_name='x', rating=1.0)
+        third = self.client.get(url)
+        self.assertEqual(third['X-Cache'], 'MISS')
+        self.assertEqual(len(third.json()['reviews']), len(first.json()['reviews']) + 1)
+        self.assertEqual(self.client.get('/api/products/no-such-product').status_code, 404)
+
+    @override_settings(PRODUCT_CACHE_FRESH=0, PRODUCT_CACHE_STALE=60)
+    def test_stale_entries_are_served_while_one_request_reloads(self):
+        cache = ProductDetailCache()
+        self.assertEqual(cache.get('a', lambda: (1, b'v1')), (b'v1', 'MISS'))
+        loading, release = threading.Event(), threading.Event()
+
+        def slow_load():
+            loading.set()
+            release.wait()
+            return 1, b'v2'
+
+        results = []
+        refresher = threading.Thread(target=lambda: results.append(cache.get('a', slow_load)))
+        refresher.start()
+        loading.wait()
+        self.assertEqual(cache.get('a', lambda: self.fail('second reload')), (b'v1', 'STALE'))
+        release.set()
+        refresher.join()
+        self.assertEqual(results, [(b'v2', 'REFRESH')])
+
+    def test_concurrent_misses_share_one_load(self):
+        cache = ProductDetailCache()
+        loads, loading, release = [], threading.Event(), threading.Event()
+
+        def slow_load():
+            loads.append(1)
+            loading.set()
+            release.wait()
+            return 1, b'body'
+
+        results = []
+        threads = [threading.Thread(target=lambda: results.append(cache.get('a', slow_load))) for _ in range(6)]
+        threads[0].start()
+        loading.wait()
+        for thread in threads[1:]:
+            thread.start()
+        time.sleep(0.2)  # let the others find the load in progress
+        release.set()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(len(loads), 1)
+        self.assertEqual(sorted(how for _, how in results), ['COALESCED'] * 5 + ['MISS'])
+        self.assertEqual({body for body, _ in results}, {b'body'})
+        self.assertEqual((cache.counters()['misses'], cache.counters()['coalesced']), (1, 5))
+
+
+# --- View counters and trending ---
+
+@override_settings(VIEW_FLUSH_SECONDS=0, POPULARITY_HALF_LIFE=3600)
+class PopularityTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.addCleanup(cache.clear)
+        view_counter.clear()
+        self.addCleanup(view_counter.clear)
+        seed_store(3)
+        self.products = list(Product.objects.order_by('id'))
+
+    def test_views_are_buffered_and_flushed_in_one_statement(self):
+        first, second = self.products[:2]
+        for slug in [first.slug] * 3 + [second.slug, 'no-such-product']:
+            self.client.get(f'/api/products/{slug}')
+        self.assertFalse(ProductPopularity.objects.exists())
+        with CaptureQueriesContext(connection) as ctx:
+            self.assertEqual(view_counter.flush(), 2)
+        self.assertEqual(len(ctx.captured_queries), 1)
+        self.assertEqual(
+            dict(ProductPopularity.objects.values_list('product_id', 'views')), {first.id: 3, second.id: 1},
+        )
+        self.assertEqual(view_counter.flush(), 0)
+
+        # The old score halves every half-life before the new views are added
+        ProductPopularity.objects.filter(product=first).update(
+            score=4, scored_at=timezone.now() - timedelta(hours=1),
+        )
+        self.client.get(f'/api/products/{first.slug}')
+        view_counter.flush()
+        popularity = ProductPopularity.objects.get(product=first)
+        self.assertEqual(popularity.views, 4)
+        self.assertAlmostEqual(popularity.score, 3, places=2)
+
+    def test_failed_flush_keeps_the_counts(self):
+        def unavailable(execute, sql, params, many, context):
+            raise OperationalError('server closed the connection unexpectedly')
+
+        first = self.products[0]
+        self.client.get(f'/api/products/{first.slug}')
+        with connection.execute_wrapper(unavailable), self.assertRaises(OperationalError):
+            view_counter.flush()
+        self.client.get(f'/api/products/{first.slug}')
+        self.assertEqual(view_counter.flush(), 1)
+        self.assertEqual(ProductPopularity.objects.get(product=first).views, 2)
+
+    def test_trending_ranks_by_decayed_score(self):
+        now = timezone.now()
+        rows = [(10, 10, now - timedelta(hours=2)), (3, 5, now), (500, 500, now - timedelta(days=30))]
+        ProductPopularity.objects.bulk_create(
+            ProductPopularity(product=product, views=views, score=score, scored_at=scored_at)
+            for product, (views, score, scored_at) in zip(self.products, rows)
+        )
+
+        def ranked(query=''):
+            response = self.client.get(f'/api/products/trending{query}')
+            self.assertEqual(response.status_code, 200)
+            return [card['id'] for card in response.json()]
+
+        first, second, third = (product.id for product in self.products)
+        self.assertEqual(ranked(), [second, first])  # 10 decayed to 2.5; the third is outside the window
+        self.assertEqual(ranked('?by=views&limit=2'), [third, first])
+        ProductPopularity.objects.filter(product_id=first).update(scored_at=now)
+        self.assertEqual(ranked(), [second, first])  # cached
+        cache.clear()
+        self.assertEqual(ranked(), [first, second])
+        for bad in ('?by=name', '?limit=0', '?limit=x'):
+            self.assertEqual(self.client.get(f'/api/products/trending{bad}').status_code, 400)
+
+
+# --- Frequently bought together ---
+
+@override_settings(RELATED_PRODUCTS_K=2, RELATED_MIN_ORDERS=1, RELATED_OVERLAP=0)
+class RelatedProductsTests(TestCase):
+    def setUp(self):
+        self.user = seed_store(5).user
+        # product-0 is in every seeded order on its own; leave it out
+        self.a, self.b, self.c, self.d = Product.objects.exclude(slug='product-0').order_by('id')
+        for products, status in [
+            ([self.a, self.b, self.c], 'processing'), ([self.a, self.b], 'delivered'), ([self.a, self.c], 'shipped'),
+            ([self.a, self.d], 'cancelled'), ([self.b, self.b, self.d], 'processing'),
+        ]:
+            self.order(products, status)
+
+    def order(self, products, status='processing'):
+        order = Order.objects.create(user=self.user, status=status, payment_method='cod', shipping_address_snapshot={})
+        OrderItem.objects.bulk_create(OrderItem(order=order, product=p, name=p.name, price=p.price) for p in products)
+
+    def related(self, product):
+        response = self.client.get(f'/api/products/{product.slug}/related')
+        self.assertEqual(response.status_code, 200)
+        return [card['id'] for card in response.json()]
+
+    def test_lists_from_co_occurrence(self):
+        self.assertTrue(Job.objects.filter(name='store.recommendations.update_related_products', status='queued'))
+        run = build_related_products()
+        self.assertFalse(run.incremental)
+        self.assertEqual(self.related(self.a), [self.b.id, self.c.id])  # two orders each; lower id first
+        self.assertEqual(self.related(self.b), [self.a.id, self.c.id])  # c and d tie at one; cut at K=2
+        self.assertEqual(self.related(self.d), [self.b.id])  # the cancelled order does not count
+        top = RelatedProduct.objects.get(product=self.b, rank=0)
+        self.assertEqual(top.orders, 2)
+        self.assertAlmostEqual(top.confidence, 2 / 3)
+        self.assertEqual(self.client.get('/api/products/no-such-product/related').status_code, 404)
+
+    def test_incremental_update_redoes_only_new_orders_products(self):
+        build_related_products()
+        untouched = list(RelatedProduct.objects.filter(product=self.a).values_list('id', flat=True))
+        self.order([self.c, self.d])
+        self.order([self.c, self.d])
+        run = update_related_products()
+        self.assertEqual((run.incremental, run.products), (True, 2))
+        self.assertEqual(self.related(self.c), [self.a.id, self.d.id])
+        self.assertEqual(self.related(self.d), [self.c.id, self.b.id])
+        self.assertEqual(list(RelatedProduct.objects.filter(product=self.a).values_list('id', flat=True)), untouched)
+
+        # The same lists as a full build of everything
+        incremental = list(RelatedProduct.objects.order_by('product', 'rank').values_list('product', 'related', 'orders'))
+        build_related_products()
+        full = list(RelatedProduct.objects.order_by('product', 'rank').values_list('product', 'related', 'orders'))
+        self.assertEqual(incremental, full)
+
+
+class SimilarProductsTests(TransactionTestCase):
+    # Refreshes find changes by transaction id, so every step commits on its own
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.addCleanup(self.directory.cleanup)
+        settings = override_settings(SIMILAR_INDEX_PATH=os.path.join(self.directory.name, 'similar.npz'))
+        settings.enable()
+        self.addCleanup(settings.disable)
+        category = Category.objects.create(name='Jewellery', slug='jewellery')
+        brand = Brand.objects.create(name='Brand', slug='brand')
+        self.ring, self.band, self.necklace, self.chain = Product.objects.bulk_create(
+            Product(category=category, brand=brand, name=name, slug=name.lower().replace(' ', '-'), price=100,
+                    description=description, tags=tags, specifications={'material': material})
+            for name, description, tags, material in [
+                ('Silver Ring', 'Sterling silver ring', ['ring', 'silver'], 'silver'),
+                ('Silver Band', 'A plain sterling ring', ['ring', 'silver'], 'silver'),
+                ('Gold Necklace', 'Gold pendant necklace', ['necklace', 'gold'], 'gold'),
+                ('Gold Chain', 'Gold necklace chain', ['chain', 'gold'], 'gold'),
+            ]
+        )
+
+    def similar(self, product):
+        response = self.client.get(f'/api/products/{product.slug}/similar')
+        self.assertEqual(response.status_code, 200)
+        return [card['id'] for card in response.json()]
+
+    def lists(self):
+        return list(SimilarProduct.objects.order_by('product', 'rank').values_list('product', 'similar', 'rank'))
+
+    def test_build_ranks_by_shared_content(self):
+        self.assertTrue(Job.objects.filter(name='store.similarity.refresh_similar_products', status='queued'))
+        self.assertEqual(build_similar_products(workers=2), 4)
+        self.assertEqual(self.similar(self.ring)[0], self.band.id)
+        self.assertEqual(self.similar(self.necklace)[0], self.chain.id)
+        self.assertNotIn(self.ring.id, self.similar(self.ring))
+        top = SimilarProduct.objects.get(product=self.ring, rank=0)
+        self.assertGreater(top.score, SimilarProduct.objects.get(product=self.ring, rank=1).score)
+        self.assertEqual(self.client.get('/api/products/no-such-product/similar').status_code, 404)
+
+        # The same lists in a single process
+        parallel = self.lists()
+        build_similar_products(workers=1)
+        self.assertEqual(self.lists(), parallel)
+
+    def test_refresh_redoes_only_changed_products(self):
+        with self.assertLogs('store.similarity', 'WARNING'):
+            self.assertEqual(refresh_similar_products(workers=1), 0)  # no saved index here: skipped
+        self.assertEqual(self.lists(), [])
+        self.assertEqual(build_similar_products(workers=1), 4)
+        untouched = list(SimilarProduct.objects.filter(product=self.necklace).values_list('id', flat=True))
+        Product.objects.filter(id=self.chain.id).update(tags=['ring', 'silver'], specifications={'material': 'silver'})
+        self.assertEqual(refresh_similar_products(workers=1), 1)
+        self.assertEqual(set(self.similar(self.chain)[:2]), {self.ring.id, self.band.id})
+        self.assertEqual(list(SimilarProduct.objects.filter(product=self.necklace).values_list('id', flat=True)), untouched)
+
+        self.band.delete()
+        self.assertEqual(refresh_similar_products(workers=1), 0)
+        self.assertNotIn(self.band.id, self.similar(self.chain))
+        self.assertEqual(refresh_similar_products(workers=1), 0)  # nothing changed since
+
+
+# --- Home page bundle ---
+
+@override_settings(VIEW_FLUSH_SECONDS=0)
+class HomeTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.addCleanup(cache.clear)
+        view_counter.clear()
+        self.addCleanup(view_counter.clear)
+        seed_store(3)
+
+    def test_bundle_matches_the_separate_endpoints(self):
+        response = self.client.get('/api/home')
+        self.assertEqual(response.status_code, 200)
+        body = response.json()
+        self.assertEqual(body['heroSlides'], self.client.get('/api/hero-slides').json())
+        self.assertEqual(body['categories'], self.client.get('/api/products/categories').json())
+        self.assertEqual(body['brands'], self.client.get('/api/products/brands').json())
+        newest = Product.objects.order_by('-created_at', '-id').first()
+        self.assertEqual(body['products'][0]['id'], newest.id)  # nothing viewed yet
+        first_image = HeroSlide.objects.order_by('id').first().image
+        self.assertEqual(response['Link'], f'<{first_image}>; rel=preload; as=image')
+
+        # Trending products once there are views
+        viewed = Product.objects.order_by('id').first()
+        self.client.get(f'/api/products/{viewed.slug}')
+        view_counter.flush()
+        cache.clear()
+        self.assertEqual([card['id'] for card in self.client.get('/api/home').json()['products']], [viewed.id])
+
+    def test_etag_compression_and_invalidation(self):
+        response = self.client.get('/api/home')
+        etag = response['ETag']
+        with self.assertNumQueries(0):
+            self.assertEqual(self.client.get('/api/home', HTTP_IF_NONE_MATCH=etag).status_code, 304)
+        for encoding, decompress in [('br', brotli.decompress), ('gzip', gzip.decompress)]:
+            compressed = self.client.get('/api/home', HTTP_ACCEPT_ENCODING=f'{encoding}, deflate')
+            self.assertEqual(compressed['Content-Encoding'], encoding)
+            self.assertEqual(compressed['ETag'], etag)
+            self.assertEqual(decompress(compressed.content), response.content)
+
+        Brand.objects.create(name='New Brand', slug='new-brand')
+        response = self.client.get('/api/home', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertIn('New Brand', [brand['name'] for brand in response.json()['brands']])
+
+
+# --- Delta sync ---
+
+class ProductChangesTests(TransactionTestCase):
+    # Sync tokens are transaction ids, so every step has to commit on its own
+
+    def sync(self, token=None, limit=None):
+        params = {key: value for key, value in (('since', token), ('limit', limit)) if value is not None}
+        pages = []
+        while True:
+            response = self.client.get('/api/products/changes', params)
+            self.assertEqual(response.status_code, 200)
+            body = response.json()
+            pages.append(body)
+            params['since'] = body['next']
+            if not body['more']:
+                return pages
+
+    def test_changes_since_token(self):
+        data = seed_store(5)
+        products = list(Product.objects.order_by('id'))
+
+        pages = self.sync(limit=2)
+        self.assertEqual(len(pages), 3)
+        self.assertEqual(sorted(p['id'] for page in pages for p in page['products']), [p.id for p in products])
+        token = pages[-1]['next']
+        self.assertEqual(self.sync(token), [{'products': [], 'deleted': [], 'next': token, 'more': False}])
+
+        products[1].name = 'Renamed'
+        products[1].save()
+        Review.objects.create(user=data.user, product=products[2], user_name='x', rating=1.0)
+        deleted_id = products[3].id
+        products[3].delete()
+
+        [page] = self.sync(token)
+        self.assertEqual([p['id'] for p in page['products']], [products[1].id, products[2].id])
+        self.assertEqual(page['products'][0]['name'], 'Renamed')
+        self.assertEqual(len(page['products'][1]['reviews']), 2)
+        self.assertEqual(page['deleted'], [deleted_id])
+        # Review changes still refresh the listing documents
+        self.assertEqual(ProductListing.objects.get(product=products[2]).document['reviewCount'], 2)
+
+        self.assertEqual(self.client.get('/api/products/changes?since=1.2').status_code, 400)
+        self.assertEqual(self.client.get('/api/products/changes?limit=0').status_code, 400)
+
+
+
+# --- Catalog snapshots ---
+
+class PublishCatalogTests(TestCase):
+    def setUp(self):
+        static_root = tempfile.TemporaryDirectory()
+        self.addCleanup(static_root.cleanup)
+        self.enterContext(override_settings(STATIC_ROOT=static_root.name))
+
+    def test_one_process_per_host_publishes(self):
+        seed_store(1)
+        os.makedirs(catalog_root())
+        with open(os.path.join(catalog_root(), '.publish.lock'), 'w') as lock:
+            fcntl.flock(lock, fcntl.LOCK_EX)
+            self.assertFalse(catalog_publisher.publish())
+        self.assertEqual(self.client.get('/api/catalog').status_code, 404)
+        self.assertTrue(catalog_publisher.publish())
+        self.assertEqual(self.client.get('/api/catalog').status_code, 200)
+
+    def test_snapshots_match_the_api_and_are_served_precompressed(self):
+        self.assertEqual(self.client.get('/api/catalog').status_code, 404)
+        seed_store(3)
+        publish_catalog()
+        manifest = self.client.get('/api/catalog').json()
+        self.assertEqual(set(manifest), {'products', 'categories', 'brands', 'heroSlides', 'publishedAt'})
+
+        for url, api in ((manifest['products'], '/api/products'), (manifest['brands'], '/api/products/brands')):
+            with self.subTest(url=url):
+                expected = self.client.get(api).content
+                response = self.client.get(url, HTTP_ACCEPT_ENCODING='br')
+                self.assertEqual(response.status_code, 200)
+                self.assertEqual(response['Content-Encoding'], 'br')
+                self.assertIn('immutable', response['Cache-Control'])
+                self.assertEqual(brotli.decompress(b''.join(response.streaming_content)), expected)
+                response = self.client.get(url, HTTP_ACCEPT_ENCODING='gzip')
+                self.assertEqual(gzip.decompress(b''.join(response.streaming_content)), expected)
+
+        # Unchanged content keeps its name; a change gets a new one and the
+        # old snapshot stays for clients still holding the old manifest
+        self.assertEqual(publish_catalog()['products'], manifest['products'])
+        Product.objects.filter(id=Product.objects.order_by('id')[0].id).update(name='Renamed')
+        republished = publish_catalog()
+        self.assertNotEqual(republished['products'], manifest['products'])
+        self.assertEqual(republished['brands'], manifest['brands'])
+        self.assertEqual(self.client.get(manifest['products']).status_code, 200)
+
+
+class CatalogChangeTests(TransactionTestCase):
+    # Notifications are delivered on commit
+
+    def test_catalog_changes_notify_the_web_processes(self):
+        listener = psycopg2.connect(**connections['default'].get_connection_params())
+        self.addCleanup(listener.close)
+        listener.set_session(autocommit=True)
+        listener.cursor().execute(f'LISTEN {CATALOG_CHANNEL}')
+        with transaction.atomic():
+            brand = Brand.objects.create(name='Brand', slug='brand')
+            Brand.objects.filter(id=brand.id).update(name='Renamed')
+        Notification.objects.create(user=User.objects.create(username='u', phone='u'), title='', message='')
+        listener.poll()
+        self.assertEqual([notify.payload for notify in listener.notifies], ['store_brand'])
+
+    def test_only_rendered_product_changes_notify(self):
+        data = seed_store(1)
+        listener = psycopg2.connect(**connections['default'].get_connection_params())
+        self.addCleanup(listener.close)
+        listener.set_session(autocommit=True)
+        listener.cursor().execute(f'LISTEN {CATALOG_CHANNEL}')
+        Product.objects.filter(id=data.product.id).update(sync_xid=0)  # as a review touch does
+        Product.objects.filter(id=data.product.id).update(name=data.product.name)  # no change
+        Review.objects.create(user=data.user, product=data.product, user_name='x', rating=3.0)
+        Product.objects.filter(id=data.product.id).update(quantity=0)
+        self.assertTrue(select.select([listener], [], [], 5)[0])
+        time.sleep(0.1)
+        listener.poll()
+        self.assertEqual([notify.payload for notify in listener.notifies], ['store_review', 'store_product'])
+
+    @override_settings(CATALOG_PUBLISH_DELAY=10, CATALOG_REVIEW_PUBLISH_DELAY=300)
+    def test_reviews_wait_longer_to_publish(self):
+        now = time.monotonic()
+        due = catalog_publisher.next_due(None, ['store_review'])
+        self.assertAlmostEqual(due - now, 300, delta=1)
+        self.assertEqual(catalog_publisher.next_due(due, ['store_review']), due)
+        self.assertAlmostEqual(catalog_publisher.next_due(due, ['store_brand', 'store_review']) - now, 10, delta=1)
+        self.assertIsNone(catalog_publisher.next_due(None, []))
+
+
+# --- Postgres-assembled JSON ---
+
+class DatabaseRenderTests(TestCase):
+    def test_db_render_matches_serializers(self):
+        data = seed_store(5)
+        Product.objects.filter(id=data.product.id).update(
+            sale_price=99.5, specifications=None, description=None,
+            created_at=timezone.now().replace(microsecond=0),
+        )
+        Review.objects.filter(product=data.product).update(comment=None, rating=4.25)
+        # Specification keys are served as stored on both paths, not camelized
+        Product.objects.exclude(id=data.product.id).update(
+            specifications={'screen_size': '6.1in', 'battery': {'charge_time': '2h'}})
+        products = Product.objects.prefetch_related(Prefetch('reviews', Review.objects.order_by('id'))).order_by('id')
+        cases = {
+            '/api/products/categories': CategorySerializer(Category.objects.order_by('id'), many=True),
+            '/api/products/brands': BrandSerializer(Brand.objects.order_by('id'), many=True),
+            '/api/products': ProductSerializer(products[:100], many=True),
+            '/api/products?skip=2&limit=2': ProductSerializer(products[2:4], many=True),
+        }
+        for url, serializer in cases.items():
+            with self.subTest(url=url):
+                # The DRF serializer as the API renders it, not the compiled fast path
+                expected = json.loads(CamelCaseJSONRenderer().render(serializer.data))
+                with CaptureQueriesContext(connection) as ctx:
+                    response = self.client.get(url + ('&' if '?' in url else '?') + 'render=db')
+                actual = response.json()
+                self.assertEqual(response['Content-Type'], 'application/json')
+                self.assertEqual(len(ctx.captured_queries), 1)
+                self.assertTrue(expected)
+                self.assertEqual(actual, expected)
+                if 'categories' not in url and 'brands' not in url:
+                    self.assertIn({'screen_size': '6.1in', 'battery': {'charge_time': '2h'}},
+                                  [row['specifications'] for row in actual])
+                # json_build_object keeps the serializer's key order too
+                self.assertEqual([list(row) for row in actual], [list(row) for row in expected])
+
+
+# --- Compiled serializers ---
+
+class CompiledSerializerTests(TestCase):
+    def test_output_is_byte_identical_to_drf(self):
+        seed_store(4)
+        Notification.objects.update(is_read=True)
+        Product.objects.filter(id=Product.objects.order_by('id').first().id).update(
+            sale_price=5, specifications=None, created_at=timezone.now().replace(microsecond=0))
+        cases = [
+            (ProductSerializer, Product.objects.prefetch_related(Prefetch('reviews', Review.objects.order_by('id')))),
+            (OrderSerializer, Order.objects.prefetch_related(Prefetch('items', OrderItem.objects.order_by('id')))),
+            (UserSerializer, User.objects.prefetch_related(Prefetch('addresses', Address.objects.order_by('id')))),
+            (OrderSummarySerializer, Order.objects.annotate(item_count=Sum('items__quantity'))),
+            (NotificationSerializer, Notification.objects.all()),
+            (CategorySerializer, Category.objects.all()),
+            (BrandSerializer, Brand.objects.all()),
+            (AddressSerializer, Address.objects.all()),
+            (HeroSlideSerializer, HeroSlide.objects.all()),
+        ]
+        render = JSONRenderer().render
+        for serializer_class, queryset in cases:
+            with self.subTest(serializer=serializer_class.__name__):
+                queryset = queryset.order_by('id')
+                fast = compiled(serializer_class)
+                rows = list(fast.values(queryset))
+                self.assertTrue(rows)
+                self.assertEqual(
+                    render(fast.serialize(rows, queryset._prefetch_related_lookups)),
+                    render(serializer_class(queryset, many=True).data),
+                )
+
+
+# --- Keyset-paginated order and user lists ---
+
+def walk(client, url):
+    """Every page of a keyset-paginated list, following the Link header's next URL."""
+    pages = []
+    while url:
+        response = client.get(url)
+        assert response.status_code == 200, response.content
+        pages.append(response.json())
+        links = dict(
+            (rel.split('"')[1], target.strip(' <>'))
+            for target, rel in (link.split(';') for link in response.headers.get('Link', '').split(',') if link)
+        )
+        url = links.get('next')
+    return pages
+
+
+class OrderListTests(TestCase):
+    def setUp(self):
+        data = seed_store(1)
+        self.user = data.user
+        self.other = User.objects.create(username='other', phone='other')
+        start = (timezone.now() - timedelta(days=30)).replace(hour=0, minute=0, second=0, microsecond=0)
+        statuses = ['processing', 'shipped', 'delivered']
+        for i in range(11):
+            Order.objects.create(
+                user=self.user if i % 2 else self.other, payment_method='cod', status=statuses[i % 3],
+                payment_status='paid' if i % 4 else 'pending', shipping_address_snapshot={},
+            )
+        # Pairs share a timestamp, so pages have to break ties on id
+        for i, order in enumerate(Order.objects.order_by('id')):
+            Order.objects.filter(id=order.id).update(created_at=start + timedelta(days=i // 2))
+        self.orders = list(Order.objects.all())
+
+    def ids(self, query=''):
+        response = self.client.get(f'/api/orders{query}')
+        self.assertEqual(response.status_code, 200)
+        return [order['id'] for order in response.json()]
+
+    def newest_first(self, orders):
+        return [order.id for order in sorted(orders, key=lambda o: (o.created_at, o.id), reverse=True)]
+
+    def test_filters(self):
+        after, before = sorted({order.created_at for order in self.orders})[2:4]
+        cases = {
+            '?status=shipped': lambda o: o.status == 'shipped',
+            '?status=shipped,delivered': lambda o: o.status in ('shipped', 'delivered'),
+            '?payment_status=pending': lambda o: o.payment_status == 'pending',
+            f'?user={self.other.id}': lambda o: o.user_id == self.other.id,
+            f'?created_after={after.isoformat().replace("+00:00", "Z")}': lambda o: o.created_at >= after,
+            f'?created_before={before.date()}': lambda o: o.created_at < before,
+            f'?status=processing&user={self.user.id}': lambda o: o.status == 'processing' and o.user_id == self.user.id,
+        }
+        for query, test in cases.items():
+            with self.subTest(query=query):
+                expected = self.newest_first(o for o in self.orders if test(o))
+                self.assertTrue(expected)
+                self.assertEqual(self.ids(query), expected)
+        self.assertEqual(self.ids('?status=cancelled'), [])
+
+    def test_pages_have_no_gaps_or_overlap(self):
+        cases = {
+            '?limit=5': lambda o: True,
+            '?limit=3&payment_status=paid': lambda o: o.payment_status == 'paid',
+            f'?limit=1&user={self.user.id}': lambda o: o.user_id == self.user.id,
+        }
+        for query, test in cases.items():
+            with self.subTest(query=query):
+                limit = int(query.split('&')[0][len('?limit='):])
+                pages = walk(self.client, f'/api/orders{query}')
+                self.assertGreater(len(pages), 1)
+                self.assertTrue(all(0 < len(page) <= limit for page in pages))
+                self.assertEqual([order['id'] for page in pages for order in page],
+                                 self.newest_first(o for o in self.orders if test(o)))
+
+    def test_bad_input_is_400(self):
+        cases = {
+            '?user=me': 'user',
+            '?created_after=yesterday': 'createdAfter',
+            '?created_before=2026-13-01': 'createdBefore',
+            '?created_after=2026-01-01T25:00:00Z': 'createdAfter',
+        }
+        for query, field in cases.items():
+            with self.subTest(query=query):
+                response = self.client.get(f'/api/orders{query}')
+                self.assertEqual(response.status_code, 400)
+                self.assertEqual(list(response.json()), [field])
+
+    def test_user_order_summary(self):
+        orders = sorted((o for o in self.orders if o.user_id == self.user.id), key=lambda o: (o.created_at, o.id))
+        product = Product.objects.get()
+        OrderItem.objects.filter(order=orders[0]).delete()
+        for i, order in enumerate(orders[1:]):
+            OrderItem.objects.bulk_create(
+                OrderItem(order=order, product=product, name=product.name, price=10, quantity=quantity)
+                for quantity in range(1, i + 3)
+            )
+        url = f'/api/orders/user/{self.user.id}'
+        full = {order['id']: order for page in walk(self.client, f'{url}?limit=2') for order in page}
+        pages = walk(self.client, f'{url}?view=summary&limit=2')
+        summaries = [order for page in pages for order in page]
+
+        self.assertGreater(len(pages), 1)
+        self.assertEqual([order['id'] for order in summaries], self.newest_first(orders))
+        for summary in summaries:
+            with self.subTest(order=summary['id']):
+                self.assertEqual(set(summary), {'id', 'status', 'total', 'createdAt', 'itemCount'})
+                items = full[summary['id']]['items']
+                self.assertEqual(summary['itemCount'], sum(item['quantity'] for item in items))
+        self.assertEqual(summaries[-1]['itemCount'], 0)  # the oldest has no items
+
+
+class UserListTests(TestCase):
+    def setUp(self):
+        people = [
+            ('Asha Rao', '9100000001', 'asha@example.com', 'admin'),
+            ('Ravi Rao', '9100000002', None, 'user'),
+            ('Meera Iyer', '9100000003', 'meera@shop.in', 'user'),
+            ('Kiran Shah', '9200000004', 'KIRAN@EXAMPLE.COM', 'staff'),
+            ('Dev Patel', '9200000005', 'dev@shop.in', 'user'),
+        ]
+        for name, phone, email, role in people:
+            User.objects.create(username=phone, phone=phone, name=name, email=email, role=role)
+
+    def phones(self, query=''):
+        pages = walk(self.client, f'/api/users?limit=2{query}')
+        return sorted(user['phone'] for page in pages for user in page)
+
+    def test_search_and_role(self):
+        cases = {
+            '': ['9100000001', '9100000002', '9100000003', '9200000004', '9200000005'],
+            '&search=rao': ['9100000001', '9100000002'],  # name, any case
+            '&search=92000': ['9200000004', '9200000005'],  # phone
+            '&search=example.com': ['9100000001', '9200000004'],  # email, any case
+            '&search=%20shop.in%20': ['9100000003', '9200000005'],  # trimmed
+            '&role=user': ['9100000002', '9100000003', '9200000005'],
+            '&search=rao&role=user': ['9100000002'],
+            '&search=nobody': [],
+        }
+        for query, phones in cases.items():
+            with self.subTest(query=query):
+                self.assertEqual(self.phones(query), phones)
+
+    def test_count(self):
+        admin = User.objects.create(username='admin', phone='admin', name='Admin', is_staff=True, role='admin')
+        user = User.objects.get(phone='9100000002')
+        self.assertEqual(self.client.get('/api/users/count').status_code, 403)
+        response = self.client.get('/api/users/count', HTTP_AUTHORIZATION=f'Bearer {create_access_token(user.id)}')
+        self.assertEqual(response.status_code, 403)
+
+        headers = {'HTTP_AUTHORIZATION': f'Bearer {create_access_token(admin.id)}'}
+        cases = {
+            '': {'count': 6, 'byRole': {'admin': 2, 'user': 3, 'staff': 1}},
+            '?search=shop.in': {'count': 2, 'byRole': {'user': 2}},
+            '?role=staff': {'count': 1, 'byRole': {'staff': 1}},
+            '?search=rao&role=admin': {'count': 1, 'byRole': {'admin': 1}},
+            '?search=nobody': {'count': 0, 'byRole': {}},
+        }
+        for query, body in cases.items():
+            with self.subTest(query=query):
+                self.assertEqual(self.client.get(f'/api/users/count{query}', **headers).json(), body)
+
+
+# --- Bulk order transitions ---
+
+class OrderTransitionTests(TestCase):
+    def post(self, user, payload):
+        headers = {'HTTP_AUTHORIZATION': f'Bearer {create_access_token(user.id)}'} if user else {}
+        return self.client.post('/api/orders/transition', payload, content_type='application/json', **headers)
+
+    def test_admins_only(self):
+        data = seed_store(1)
+        payload = {'ids': [data.order.id], 'status': 'shipped'}
+        self.assertEqual(self.post(None, payload).status_code, 403)
+        self.assertEqual(self.post(data.user, payload).status_code, 403)
+        self.assertEqual(Order.objects.get(id=data.order.id).status, 'processing')
+        admin = User.objects.create(username='admin', phone='admin', is_staff=True)
+        self.assertEqual(self.post(admin, payload).json(), {'updated': 1})
+
+    def test_all_or_nothing(self):
+        data = seed_store(3)
+        ids = sorted(data.user.orders.values_list('id', flat=True))
+        Order.objects.filter(id=ids[0]).update(status='delivered')
+        notifications = Notification.objects.count()
+        admin = User.objects.create(username='admin', phone='admin', is_staff=True)
+
+        response = self.post(admin, {'ids': ids, 'status': 'shipped'})
+        self.assertEqual(response.status_code, 400)
+        self.assertIn(f'#{ids[0]} delivered -> shipped', response.content.decode())
+        self.assertEqual(Order.objects.filter(status='shipped').count(), 0)
+
+        self.assertEqual(transition_orders(ids[1:], 'shipped', {ids[1]: 'TRK1'}), 2)
+        self.assertEqual(
+            list(Order.objects.filter(id__in=ids).order_by('id').values_list('status', 'tracking_number')),
+            [('delivered', None), ('shipped', 'TRK1'), ('shipped', None)],
+        )
+        self.assertEqual(Notification.objects.count(), notifications + 2)
+        self.assertTrue(Notification.objects.filter(
+            user=data.user, type='order', message=f'Your order #{ids[2]} has been shipped.').exists())
+
+
+# --- Notification inbox ---
+
+class NotificationInboxTests(TestCase):
+    def setUp(self):
+        self.user = seed_store(4).user
+        self.notifications = list(Notification.objects.filter(user=self.user).order_by('id'))
+        self.other = User.objects.create(username='other', phone='other')
+        Notification.objects.create(user=self.other, title='Theirs', message='', type='info')
+
+    def get(self, url, user=None):
+        user = user or self.user
+        response = self.client.get(url, HTTP_AUTHORIZATION=f'Bearer {create_access_token(user.id)}')
+        self.assertEqual(response.status_code, 200)
+        return response.json()
+
+    def ids(self, query=''):
+        return [n['id'] for n in self.get(f'/api/notifications/{self.user.id}{query}')]
+
+    def test_since_and_unread(self):
+        first, second, third, fourth = self.notifications
+        self.assertEqual(self.ids(), [fourth.id, third.id, second.id, first.id])
+        self.assertEqual(self.ids(f'?since={second.id}'), [fourth.id, third.id])
+
+        cutoff = timezone.now() - timedelta(hours=1)
+        Notification.objects.filter(id__in=[first.id, second.id]).update(created_at=cutoff - timedelta(minutes=1))
+        self.assertEqual(self.ids(f'?since={cutoff.isoformat().replace("+00:00", "Z")}'), [fourth.id, third.id])
+        self.assertEqual(self.ids(f'?since={(cutoff - timedelta(days=1)).date()}'), [fourth.id, third.id, second.id, first.id])
+
+        Notification.objects.filter(id__in=[third.id, first.id]).update(is_read=True)
+        self.assertEqual(self.ids('?unread=true'), [fourth.id, second.id])
+        self.assertEqual(self.ids(f'?unread=true&since={second.id}'), [fourth.id])
+        response = self.client.get(f'/api/notifications/{self.user.id}?since=yesterday',
+                                   HTTP_AUTHORIZATION=f'Bearer {create_access_token(self.user.id)}')
+        self.assertEqual(response.status_code, 400)
+
+    def test_mark_read_and_unread_count(self):
+        first, second, third, fourth = self.notifications
+        count_url = f'/api/notifications/{self.user.id}/unread-count'
+        mark_url = f'/api/notifications/{self.user.id}/mark-read'
+        headers = {'HTTP_AUTHORIZATION': f'Bearer {create_access_token(self.user.id)}'}
+        self.assertEqual(self.get(count_url), {'count': 4})
+
+        theirs = Notification.objects.get(user=self.other).id
+        response = self.client.post(mark_url, {'ids': [first.id, third.id, theirs]},
+                                    content_type='application/json', **headers)
+        self.assertEqual(response.json(), {'updated': 2})
+        self.assertEqual(self.get(count_url), {'count': 2})
+        self.assertFalse(Notification.objects.get(id=theirs).is_read)
+
+        response = self.client.post(mark_url, {}, content_type='application/json', **headers)
+        self.assertEqual(response.json(), {'updated': 2})
+        self.assertEqual(self.get(count_url), {'count': 0})
+        response = self.client.post(mark_url, {'ids': 'all'}, content_type='application/json', **headers)
+        self.assertEqual(response.status_code, 400)
+
+    def test_only_the_user_or_staff(self):
+        list_url = f'/api/notifications/{self.user.id}'
+        count_url = f'/api/notifications/{self.user.id}/unread-count'
+        mark_url = f'/api/notifications/{self.user.id}/mark-read'
+        other = {'HTTP_AUTHORIZATION': f'Bearer {create_access_token(self.other.id)}'}
+        for url in (list_url, count_url):
+            self.assertEqual(self.client.get(url).status_code, 403)
+            self.assertEqual(self.client.get(url, **other).status_code, 403)
+        self.assertEqual(self.client.post(mark_url).status_code, 403)
+        self.assertEqual(self.client.post(mark_url, **other).status_code, 403)
+        self.assertFalse(Notification.objects.filter(user=self.user, is_read=True).exists())
+
+        User.objects.filter(id=self.other.id).update(is_staff=True)
+        self.assertEqual(self.get(count_url, self.other), {'count': 4})
+        self.assertEqual(len(self.get(list_url, self.other)), 4)
+
+
+# --- Notification retention ---
+
+@override_settings(NOTIFICATION_RETENTION_DAYS={'promotion': 30})
+class PurgeNotificationsTests(TestCase):
+    def test_only_old_read_notifications_of_listed_types_go(self):
+        user = seed_store(1).user
+        old = timezone.now() - timedelta(days=31)
+        rows = {
+            (kind, is_read, created_at): Notification.objects.create(
+                user=user, title=kind, message='', type=kind, is_read=is_read,
+            )
+            for kind in ('promotion', 'order')
+            for is_read in (True, False)
+            for created_at in (old, timezone.now())
+        }
+        for (kind, is_read, created_at), notification in rows.items():
+            Notification.objects.filter(id=notification.id).update(created_at=created_at)
+        expired = rows['promotion', True, old]
+
+        call_command('purge_notifications', archive=True, batch_size=1, pause=0, stdout=StringIO())
+
+        self.assertFalse(Notification.objects.filter(id=expired.id).exists())
+        self.assertEqual(
+            set(Notification.objects.filter(user=user, title__in=['promotion', 'order']).values_list('id', flat=True)),
+            {notification.id for notification in rows.values()} - {expired.id},
+        )
+        self.assertEqual(list(NotificationArchive.objects.values_list('id', flat=True)), [expired.id])
+
+
+# --- Background jobs ---
+
+CALLS = []
+
+
+@task()
+def record_call(marker):
+    CALLS.append(marker)
+
+
+@task(max_attempts=2)
+def always_fails():
+    raise RuntimeError('boom')
+
+
+class JobTests(TestCase):
+    def setUp(self):
+        CALLS.clear()
+
+    def test_jobs_run_by_priority_once_due(self):
+        enqueue(record_call, delay=60, marker='later')
+        enqueue(record_call, queue='maintenance', marker='low')
+        record_call.delay(marker='high')
+        enqueue(record_call, queue='notifications', marker='notifications')
+        while (job := claim_job('test')) is not None:
+            self.assertEqual(run_job(job).status, 'done')
+        self.assertEqual(CALLS, ['notifications', 'high', 'low'])
+        self.assertEqual(Job.objects.get(status='queued').kwargs, {'marker': 'later'})
+
+    def test_failures_are_retried_with_backoff(self):
+        job = always_fails.delay()
+        job = run_job(claim_job('test'))
+        self.assertEqual((job.status, job.attempts), ('queued', 1))
+        self.assertIn('boom', job.last_error)
+        self.assertIsNone(claim_job('test'))  # backing off
+
+        Job.objects.filter(id=job.id).update(run_at=timezone.now())
+        job = run_job(claim_job('test'))
+        self.assertEqual((job.status, job.attempts), ('failed', 2))
+
+    def test_housekeeping_respects_max_attempts(self):
+        stale = timezone.now() - timedelta(seconds=settings.JOB_LOCK_TIMEOUT + 1)
+        retried, last, alive = record_call.delay(marker='a'), always_fails.delay(), record_call.delay(marker='b')
+        Job.objects.filter(id__in=[retried.id, last.id, alive.id]).update(
+            status='running', locked_by='gone', locked_at=stale, attempts=1,
+        )
+        Job.objects.filter(id=last.id).update(attempts=2)
+        Job.objects.filter(id=alive.id).update(locked_at=timezone.now())
+        done = record_call.delay(marker='c')
+        Job.objects.filter(id=done.id).update(
+            status='done', finished_at=timezone.now() - timedelta(days=settings.JOB_KEEP_DONE_DAYS + 1),
+        )
+
+        self.assertEqual(housekeeping(), (1, 1, 1))
+        jobs = {job.id: job for job in Job.objects.all()}
+        self.assertEqual((jobs[retried.id].status, jobs[retried.id].locked_by), ('queued', ''))
+        self.assertEqual((jobs[last.id].status, jobs[last.id].attempts), ('failed', 2))
+        self.assertIn('lost', jobs[last.id].last_error)
+        self.assertEqual(jobs[alive.id].status, 'running')
+        self.assertNotIn(done.id, jobs)
+
+
+@task()
+def slow_job(seconds):
+    CALLS.append(Job.objects.get(name=f'{__name__}.slow_job').locked_at)
+    time.sleep(seconds)
+    CALLS.append(Job.objects.get(name=f'{__name__}.slow_job').locked_at)
+
+
+class JobHeartbeatTests(TransactionTestCase):
+    # The heartbeat writes from its own thread and connection
+
+    @override_settings(JOB_HEARTBEAT=0.05)
+    def test_running_jobs_refresh_their_lock(self):
+        CALLS.clear()
+        slow_job.delay(seconds=0.5)
+        job = run_job(claim_job('test'))
+        self.assertEqual(job.status, 'done')
+        claimed, later = CALLS
+        self.assertGreater(later, claimed)
+        self.assertIsNone(Job.objects.get(id=job.id).locked_at)
@@ -1,14 +1,35 @@
 from rest_framework import viewsets, generics, status
 from rest_framework.views import APIView
 from rest_framework.response import Response
-from rest_framework.permissions import IsAuthenticated, AllowAny
+from rest_framework.permissions import BasePermission, IsAuthenticated, IsAdminUser, AllowAny
+from rest_framework.exceptions import NotFound, ValidationError
+from django.db import connection
+from django.db.models import Count, OuterRef, Prefetch, Q, Subquery, Sum, TextField
+from django.db.models.functions import Cast, Coalesce
+from django.http import HttpResponse
 from django.shortcuts import get_object_or_404
 from django.contrib.auth.hashers import check_password
-from datetime import datetime, timedelta
+from django.utils import timezone
+from django.utils.cache import get_conditional_response, patch_vary_headers
+from django.utils.dateparse import parse_date, parse_datetime
+from datetime import datetime, time, timedelta, timezone as dt_timezone
 import jwt
 from django.conf import settings
+from djangorestframework_camel_case.render import CamelCaseJSONRenderer
 
 from .models import *
+from .catalog import read_manifest
+from .catalogengine import catalog_engine
+from .categories import category_tree
+from .facets import facet_counts
+from .fastserializers import compiled
+from .home import home
+from .jsonsql import render_json_array
+from .orders import transition_orders
+from .pagination import KeysetPagination, UserKeysetPagination
+from .popularity import RANKINGS, popular_products, view_counter
+from .productcache import product_details
+from .productfilters import ProductFilters, in_id_order
 from .serializers import *
 
 # --- Auth Views (Matching Schema) ---
@@ -88,68 +109,413 @@ class UserUpdateView(APIView):
         user.save()
         return Response(UserSerializer(user).data)
 
+def parse_date_param(params, name):
+    # Accepts a date ("2026-01-31") or an ISO datetime
+    value = params[name]
+    try:
+        parsed = parse_datetime(value)
+        day = parse_date(value) if parsed is None else None
+    except ValueError:  # well formed but out of range, like month 13
+        parsed = day = None
+    if parsed is None:
+        if day is None:
+            raise ValidationError({name: 'Expected a date or ISO 8601 datetime.'})
+        parsed = datetime.combine(day, time.min)
+    if timezone.is_naive(parsed):
+        parsed = timezone.make_aware(parsed, dt_timezone.utc)
+    return parsed
+
 # --- Product Catalog Views ---
 
-class CategoryListView(generics.ListAPIView):
-    queryset = Category.objects.all()
+class CompiledListMixin:
+    # Read-only lists go through the compiled serializer (store/fastserializers.py):
+    # .values() rows in, the ModelSerializer's output out, at a fraction of the CPU
+
+    def list(self, request, *args, **kwargs):
+        serializer = compiled(self.get_serializer_class())
+        queryset = self.filter_queryset(self.get_queryset())
+        ordering = getattr(self.paginator, 'ordering', ())
+        ordering = [ordering] if isinstance(ordering, str) else ordering
+        page = self.paginate_queryset(serializer.values(queryset, *(name.lstrip('-') for name in ordering)))
+        rows = page if page is not None else list(serializer.values(queryset))
+        data = serializer.serialize(rows, queryset._prefetch_related_lookups)
+        return self.get_paginated_response(data) if page is not None else Response(data)
+
+class DatabaseJSONMixin:
+    # ?render=db: Postgres assembles the whole JSON array (store/jsonsql.py)
+    # and the bytes go out as they come. Same body as the serializer path.
+
+    def list(self, request, *args, **kwargs):
+        if request.query_params.get('render') != 'db':
+            return super().list(request, *args, **kwargs)
+        queryset = self.filter_queryset(self.get_queryset())
+        if self.paginator is not None:
+            offset = self.paginator.get_offset(request)
+            queryset = queryset[offset:offset + self.paginator.get_limit(request)]
+        return HttpResponse(
+            render_json_array(queryset, self.get_serializer_class()), content_type='application/json'
+        )
+
+class CategoryListView(DatabaseJSONMixin, CompiledListMixin, generics.ListAPIView):
+    queryset = Category.objects.order_by('id')
     serializer_class = CategorySerializer
     permission_classes = [AllowAny]
     pagination_class = None  # <--- ADD THIS (FastAPI returned .all())
 
+class CategoryTreeView(APIView):
+    # Every category nested under its parent, from the cache (store/categories.py)
+    permission_classes = [AllowAny]
+
+    def get(self, request):
+        return Response(category_tree())
+
 class CategoryDetailView(generics.RetrieveAPIView):
     queryset = Category.objects.all()
     serializer_class = CategorySerializer
     lookup_field = 'id'
     permission_classes = [AllowAny]
 
-class BrandListView(generics.ListAPIView):
-    queryset = Brand.objects.all()
+class BrandListView(DatabaseJSONMixin, CompiledListMixin, generics.ListAPIView):
+    queryset = Brand.objects.order_by('id')
     serializer_class = BrandSerializer
     permission_classes = [AllowAny]
     pagination_class = None  # <--- ADD THIS
 
-class ProductListView(generics.ListAPIView):
-    queryset = Product.objects.all()
+class ProductListView(DatabaseJSONMixin, CompiledListMixin, generics.ListAPIView):
+    queryset = Product.objects.prefetch_related(Prefetch('reviews', Review.objects.order_by('id'))).order_by('id')
     serializer_class = ProductSerializer
     permission_classes = [AllowAny]
     # KEEP PAGINATION HERE (FastAPI used skip/limit on products)
     # It will use the SkipLimitPagination we fixed in step 1.
 
+    # Catalog filters and ?sort= (store/productfilters.py). With
+    # settings.CATALOG_ENGINE the page's ids come from the in-memory engine
+    # and SQL only fetches those rows; otherwise it all runs in SQL.
+    page_ids = None
+
+    def list(self, request, *args, **kwargs):
+        self.filters = ProductFilters.from_params(request.query_params)
+        page_ids = catalog_engine.query(
+            self.filters, self.paginator.get_offset(request), self.paginator.get_limit(request),
+        )
+        if page_ids is not None:
+            self.page_ids = page_ids
+            self._paginator = None  # already paged
+        if request.query_params.get('view') == 'card':
+            return self.list_cards()
+        return super().list(request, *args, **kwargs)
+
+    def get_queryset(self):
+        queryset = super().get_queryset()
+        if self.page_ids is not None:
+            return in_id_order(queryset, self.page_ids)
+        return self.filters.apply(queryset)
+
+    def list_cards(self):
+        # ?view=card: the pre-built ProductListing documents, fetched as JSON
+        # text and joined into the response; no serializer, no camelizing
+        if self.page_ids is not None:
+            documents = in_id_order(ProductListing.objects.all(), self.page_ids, 'product_id')
+        else:
+            documents = self.filters.apply(ProductListing.objects.all(), prefix='product__')
+        documents = documents.annotate(text=Cast('document', TextField())).values_list('text', flat=True)
+        page = self.paginate_queryset(documents)
+        return HttpResponse(f"[{','.join(documents if page is None else page)}]", content_type='application/json')
+
+class ProductFacetsView(APIView):
+    # Sidebar counts for the same filters as the product list (store/facets.py)
+    permission_classes = [AllowAny]
+
+    def get(self, request):
+        return Response(facet_counts(ProductFilters.from_params(request.query_params)))
+
+class ProductChangesView(APIView):
+    # ?since=<token>: products created or changed (reviews included) and ids
+    # deleted since the token, oldest change first. No since = full sync.
+    # Tokens are transaction ids, not timestamps: a slow transaction that
+    # commits after a sync still lands above that sync's token.
+    permission_classes = [AllowAny]
+    default_limit = 500
+    max_limit = 2000
+
+    def get(self, request):
+        since, cursor = self.parse_token(request.query_params.get('since', '0'))
+        try:
+            limit = min(int(request.query_params.get('limit', self.default_limit)), self.max_limit)
+        except ValueError:
+            raise ValidationError({'limit': 'Must be a number.'})
+        if limit < 1:
+            raise ValidationError({'limit': 'Must be at least 1.'})
+
+        if cursor is None:
+            # Anything not yet committed has an id at or above the oldest
+            # transaction this snapshot still sees running
+            with connection.cursor() as db:
+                db.execute("SELECT pg_snapshot_xmin(pg_current_snapshot())::text::bigint")
+                floor = db.fetchone()[0]
+        else:
+            floor, cursor = cursor[0], cursor[1:]
+
+        queryset = Product.objects.filter(sync_xid__gte=since).order_by('sync_xid', 'id')
+        if cursor is not None:
+            queryset = queryset.filter(
+                Q(sync_xid__gt=cursor[0]) | Q(sync_xid=cursor[0], id__gt=cursor[1])
+            )
+        serializer = compiled(ProductSerializer)
+        rows = list(serializer.values(queryset, 'sync_xid')[:limit + 1])
+        more = len(rows) > limit
+        rows = rows[:limit]
+        products = serializer.serialize(rows, [Prefetch('reviews', Review.objects.order_by('id'))])
+
+        deleted = []
+        if cursor is None and since > 0:
+            deleted = list(
+                ProductTombstone.objects.filter(sync_xid__gte=since)
+                .order_by('product_id').values_list('product_id', flat=True)
+            )
+        if more:
+            last = rows[-1]
+            next_token = f"{since}.{floor}.{last['sync_xid']}.{last['id']}"
+        else:
+            next_token = str(floor)
+        return Response({'products': products, 'deleted': deleted, 'next': next_token, 'more': more})
+
+    def parse_token(self, token):
+        # "<since>" or, mid-sync, "<since>.<floor>.<last sync_xid>.<last id>"
+        parts = token.split('.')
+        if len(parts) not in (1, 4) or not all(part.isdigit() for part in parts):
+            raise ValidationError({'since': 'Invalid sync token.'})
+        parts = [int(part) for part in parts]
+        return parts[0], (parts[1:] if len(parts) == 4 else None)
+
+class CatalogManifestView(APIView):
+    # Where the current catalog snapshots are (store/catalog.py). The snapshot
+    # files are immutable; this small document is the only thing to revalidate.
+    permission_classes = [AllowAny]
+
+    def get(self, request):
+        manifest = read_manifest()
+        if manifest is None:
+            raise NotFound('The catalog has not been published yet.')
+        response = HttpResponse(manifest, content_type='application/json')
+        response['Cache-Control'] = 'no-cache'
+        return response
+
 class ProductDetailView(generics.RetrieveAPIView):
-    queryset = Product.objects.all()
+    queryset = Product.objects.prefetch_related(Prefetch('reviews', Review.objects.order_by('id')))
     serializer_class = ProductSerializer
     lookup_field = 'slug'
     permission_classes = [AllowAny]
 
+    def retrieve(self, request, *args, **kwargs):
+        # Rendered bodies come from the per-process cache (store/productcache.py);
+        # X-Cache says whether this one was a hit, stale, shared or loaded
+        body, how = product_details.get(kwargs['slug'], self.render_product)
+        view_counter.record(kwargs['slug'])
+        response = HttpResponse(body, content_type='application/json')
+        response['X-Cache'] = how
+        return response
+
+    def render_product(self):
+        product = self.get_object()
+        return product.id, CamelCaseJSONRenderer().render(self.get_serializer(product).data)
+
+class ProductTrendingView(APIView):
+    # ?by=trending (views decaying over time, the default) or ?by=views (all
+    # time), as product cards; counts are written with a delay (store/popularity.py)
+    permission_classes = [AllowAny]
+    default_limit = 20
+    max_limit = 100
+
+    def get(self, request):
+        ranking = request.query_params.get('by', 'trending')
+        if ranking not in RANKINGS:
+            raise ValidationError({'by': f'One of: {", ".join(RANKINGS)}.'})
+        try:
+            limit = min(int(request.query_params.get('limit', self.default_limit)), self.max_limit)
+        except ValueError:
+            raise ValidationError({'limit': 'Must be a number.'})
+        if limit < 1:
+            raise ValidationError({'limit': 'Must be at least 1.'})
+        return HttpResponse(popular_products(ranking, limit), content_type='application/json')
+
+class ProductRelatedView(APIView):
+    # Frequently bought together, as product cards; precomputed from order
+    # items (store/recommendations.py)
+    permission_classes = [AllowAny]
+    model = RelatedProduct
+    field = 'related'
+
+    def get(self, request, slug):
+        documents = list(
+            self.model.objects.filter(product__slug=slug, **{f'{self.field}__listing__isnull': False})
+            .order_by('rank').annotate(text=Cast(f'{self.field}__listing__document', TextField()))
+            .values_list('text', flat=True)
+        )
+        if not documents and not Product.objects.filter(slug=slug).exists():
+            raise NotFound('Product not found')
+        return HttpResponse(f"[{','.join(documents)}]", content_type='application/json')
+
+class ProductSimilarView(ProductRelatedView):
+    # Most alike by content, as product cards; precomputed from product
+    # fields (store/similarity.py)
+    model = SimilarProduct
+    field = 'similar'
+
+class ProductCacheStatsView(APIView):
+    # This process's product detail cache counters; each worker keeps its own
+    permission_classes = [IsAdminUser]
+
+    def get(self, request):
+        return Response(product_details.counters())
+
 # --- User & Order Views ---
 
 # ... User views ...
 
-class OrderListView(generics.ListAPIView):
-    queryset = Order.objects.all()
+class OrderListView(CompiledListMixin, generics.ListAPIView):
     serializer_class = OrderSerializer
-    pagination_class = None  # <--- ADD THIS
+    pagination_class = KeysetPagination
 
-class UserOrderListView(generics.ListAPIView):
-    serializer_class = OrderSerializer
-    pagination_class = None  # <--- ADD THIS
-    
+    # ?status=shipped,delivered&payment_status=paid&user=12
+    # &created_after=2026-01-01&created_before=2026-02-01T12:00:00Z
     def get_queryset(self):
-        return Order.objects.filter(user_id=self.kwargs['user_id'])
+        params = self.request.query_params
+        queryset = Order.objects.prefetch_related('items')
+
+        for field in ('status', 'payment_status'):
+            if params.get(field):
+                queryset = queryset.filter(**{f'{field}__in': params[field].split(',')})
+        if params.get('user'):
+            if not params['user'].isdigit():
+                raise ValidationError({'user': 'Must be a user id.'})
+            queryset = queryset.filter(user_id=params['user'])
+        if params.get('created_after'):
+            queryset = queryset.filter(created_at__gte=parse_date_param(params, 'created_after'))
+        if params.get('created_before'):
+            queryset = queryset.filter(created_at__lt=parse_date_param(params, 'created_before'))
+        return queryset
+
+class OrderTransitionView(APIView):
+    # {"ids": [1, 2], "status": "shipped", "trackingNumbers": {"1": "TRK1"}}:
+    # all or nothing, one UPDATE for the orders and one INSERT for the notifications
+    permission_classes = [IsAdminUser]
+
+    def post(self, request):
+        ids = request.data.get('ids')
+        if not isinstance(ids, list) or not ids or not all(isinstance(i, int) for i in ids):
+            raise ValidationError({'ids': 'Expected a list of order ids.'})
+        new_status = request.data.get('status')
+        if not isinstance(new_status, str):
+            raise ValidationError({'status': 'Expected a status.'})
+        tracking_numbers = request.data.get('tracking_numbers') or {}
+        if not isinstance(tracking_numbers, dict) or not all(
+            str(key).isdigit() and isinstance(value, str) for key, value in tracking_numbers.items()
+        ):
+            raise ValidationError({'tracking_numbers': 'Expected an object of order id to tracking number.'})
+        updated = transition_orders(
+            ids, new_status, {int(key): value for key, value in tracking_numbers.items()}
+        )
+        return Response({"updated": updated})
+
+class UserOrderListView(CompiledListMixin, generics.ListAPIView):
+    # Newest first, one keyset page at a time; ?view=summary for the account overview
+    pagination_class = KeysetPagination
+
+    def is_summary(self):
+        return self.request.query_params.get('view') == 'summary'
+
+    def get_serializer_class(self):
+        return OrderSummarySerializer if self.is_summary() else OrderSerializer
+
+    def get_queryset(self):
+        queryset = Order.objects.filter(user_id=self.kwargs['user_id'])
+        if self.is_summary():
+            # Correlated subquery: only the orders on this page get their items summed
+            item_count = OrderItem.objects.filter(order=OuterRef('pk')).values('order').annotate(
+                n=Sum('quantity')
+            ).values('n')
+            return queryset.only('id', 'status', 'total', 'created_at').annotate(
+                item_count=Coalesce(Subquery(item_count), 0)
+            )
+        return queryset.prefetch_related('items')
+
+class IsPathUserOrStaff(BasePermission):
+    # For /<user_id>/ routes: only that user, or staff, gets through
 
-class NotificationListView(generics.ListAPIView):
+    def has_permission(self, request, view):
+        return request.user.is_staff or view.kwargs.get('user_id') == request.user.id
+
+class NotificationListView(CompiledListMixin, generics.ListAPIView):
+    # Newest first, keyset-paginated. Polling clients pass ?since=<last id or
+    # ISO timestamp> to get only what is new; ?unread=true for unread only.
     serializer_class = NotificationSerializer
-    pagination_class = None  # <--- ADD THIS (Fixes userNotifications.filter error)
-    
+    pagination_class = KeysetPagination
+    permission_classes = [IsAuthenticated, IsPathUserOrStaff]
+
     def get_queryset(self):
-        return Notification.objects.filter(user_id=self.kwargs['user_id'])
-    
+        params = self.request.query_params
+        queryset = Notification.objects.filter(user_id=self.kwargs['user_id'])
+        since = params.get('since')
+        if since:
+            if since.isdigit():
+                queryset = queryset.filter(id__gt=since)
+            else:
+                queryset = queryset.filter(created_at__gt=parse_date_param(params, 'since'))
+        if params.get('unread') in ('1', 'true'):
+            queryset = queryset.filter(is_read=False)
+        return queryset
+
+class NotificationUnreadCountView(APIView):
+    permission_classes = [IsAuthenticated, IsPathUserOrStaff]
+
+    def get(self, request, user_id):
+        count = Notification.objects.filter(user_id=user_id, is_read=False).count()
+        return Response({"count": count})
+
+class NotificationMarkReadView(APIView):
+    # {"ids": [1, 2]} marks those; an empty body marks everything. One UPDATE either way.
+    permission_classes = [IsAuthenticated, IsPathUserOrStaff]
+
+    def post(self, request, user_id):
+        queryset = Notification.objects.filter(user_id=user_id, is_read=False)
+        ids = request.data.get('ids')
+        if ids is not None:
+            if not isinstance(ids, list) or not all(isinstance(i, int) for i in ids):
+                raise ValidationError({'ids': 'Expected a list of notification ids.'})
+            queryset = queryset.filter(id__in=ids)
+        return Response({"updated": queryset.update(is_read=True)})
+
     # Add this inside store/views.py (under the User & Order Views section)
 
-class UserListView(generics.ListAPIView):
-    queryset = User.objects.all()
+def filter_users(queryset, params):
+    # ?search= matches name, phone or email (trigram indexes); ?role= is exact
+    if params.get('search'):
+        term = params['search'].strip()
+        queryset = queryset.filter(
+            Q(name__icontains=term) | Q(phone__icontains=term) | Q(email__icontains=term)
+        )
+    if params.get('role'):
+        queryset = queryset.filter(role=params['role'])
+    return queryset
+
+class UserListView(CompiledListMixin, generics.ListAPIView):
     serializer_class = UserSerializer
-    pagination_class = None  # Disable pagination for users too (just in case)
+    pagination_class = UserKeysetPagination
+
+    def get_queryset(self):
+        return filter_users(User.objects.prefetch_related('addresses'), self.request.query_params)
+
+class UserCountView(APIView):
+    # Counts for the admin dashboard, so it never downloads the user table
+    permission_classes = [IsAdminUser]
+
+    def get(self, request):
+        rows = filter_users(User.objects.all(), request.query_params).values('role').annotate(
+            n=Count('id')
+        ).order_by()
+        by_role = {row['role']: row['n'] for row in rows}
+        return Response({"count": sum(by_role.values()), "by_role": by_role})
 
 class UserDetailView(generics.RetrieveAPIView):
     queryset = User.objects.all()
@@ -185,6 +551,27 @@ class AddressDetailView(APIView):
         address.delete()
         return Response(UserSerializer(request.user).data)
 
+class HomeView(APIView):
+    # Hero slides, categories, brands and featured product cards in one body,
+    # cached and precompressed (store/home.py). Revalidated by ETag; the first
+    # hero images are named in Link so the browser fetches them straight away.
+    permission_classes = [AllowAny]
+
+    def get(self, request):
+        bundle = home()
+        accepted = {value.split(';')[0].strip() for value in request.headers.get('Accept-Encoding', '').split(',')}
+        encoding = next((encoding for encoding in ('br', 'gzip') if encoding in accepted), None)
+        response = HttpResponse(bundle[encoding or 'body'], content_type='application/json')
+        if encoding:
+            response['Content-Encoding'] = encoding
+        patch_vary_headers(response, ['Accept-Encoding'])
+        # Weak: the same for every encoding of the body
+        response['ETag'] = f"W/{bundle['etag']}"
+        response['Cache-Control'] = 'no-cache'
+        if bundle['preload']:
+            response['Link'] = ', '.join(f'<{url}>; rel=preload; as=image' for url in bundle['preload'])
+        return get_conditional_response(request, etag=response['ETag'], response=response)
+
 class HeroSlideListView(APIView):
     permission_classes = [AllowAny]
     